@@ -0,0 +1,35 @@
+"""Micro-benchmark of the hashing throughput of corelay.io.hashing.ext_hash."""
+import time
+
+import click
+import numpy as np
+
+from corelay.io.hashing import ext_hash, TolerantHash, SampledHash
+
+
+def throughput(func, data, repeat):
+    """Return the best throughput in GB/s of calling func on data."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(data)
+        best = min(best, time.perf_counter() - start)
+    return data.nbytes / best / 1e9
+
+
+@click.command()
+@click.option('--sizes', default='1000,4000,8000', help='Comma-separated side lengths of square float64 matrices.')
+@click.option('--repeat', type=int, default=3)
+def main(sizes, repeat):
+    rng = np.random.default_rng(0xDEADBEEF)
+    print(f'{"shape":>14s} {"MB":>9s} {"exact GB/s":>11s} {"tolerant GB/s":>14s} {"sampled GB/s":>13s}')
+    for size in (int(elem) for elem in sizes.split(',')):
+        data = rng.normal(size=(size, size))
+        exact = throughput(ext_hash, data, repeat)
+        tolerant = throughput(lambda obj: ext_hash(obj, TolerantHash()), data, repeat)
+        sampled = throughput(lambda obj: ext_hash(obj, SampledHash()), data, repeat)
+        print(f'{str(data.shape):>14s} {data.nbytes / 1e6:9.1f} {exact:11.2f} {tolerant:14.2f} {sampled:13.2f}')
+
+
+if __name__ == '__main__':
+    main()
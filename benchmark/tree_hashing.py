@@ -0,0 +1,30 @@
+"""Benchmark of the scaling of the tree-hashing mode of corelay.io.hashing.ext_hash with the number of threads."""
+import os
+import time
+
+import click
+import numpy as np
+
+from corelay.io.hashing import ext_hash, ExactHash
+
+
+@click.command()
+@click.option('--size-mb', type=int, default=2048, help='Size of the hashed float64 array in MB.')
+@click.option('--max-workers', type=int, default=os.cpu_count())
+@click.option('--repeat', type=int, default=3)
+def main(size_mb, max_workers, repeat):
+    data = np.random.default_rng(0xDEADBEEF).normal(size=(size_mb * 10 ** 6 // 8,))
+    workers = sorted({2 ** exp for exp in range(max_workers.bit_length())} | {max_workers})
+
+    print(f'{"mode":>8s} {"workers":>8s} {"GB/s":>8s} {"digest":>34s}')
+    for mode, strategy in [('flat', ExactHash())] + [('tree', ExactHash(tree=True, workers=n)) for n in workers]:
+        best = float('inf')
+        for _ in range(repeat):
+            start = time.perf_counter()
+            digest = ext_hash(data, strategy)
+            best = min(best, time.perf_counter() - start)
+        print(f'{mode:>8s} {strategy.workers or 1:8d} {data.nbytes / best / 1e9:8.2f} {digest:>34s}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""Benchmark of file size and read/write throughput of corelay.io.policy.WritePolicy for spectral pipeline artifacts."""
+import os
+import time
+import tempfile
+
+import click
+import h5py
+import numpy as np
+from scipy.spatial.distance import pdist, squareform
+
+from corelay.io.policy import WritePolicy
+from corelay.io.storage import HashedHDF5
+
+
+POLICIES = {
+    'plain': WritePolicy(),
+    'lzf': WritePolicy(compression='lzf', shuffle=True),
+    'gzip-4': WritePolicy(compression='gzip', compression_opts=4, shuffle=True),
+    'float32': WritePolicy(downcast='float32'),
+    'float32+lzf': WritePolicy(compression='lzf', shuffle=True, downcast='float32'),
+    'float16+gzip': WritePolicy(compression='gzip', compression_opts=4, shuffle=True, downcast='float16'),
+}
+
+
+def artifacts(n_samples, n_eigval, rng):
+    """Return typical outputs of a spectral pipeline for random data."""
+    data = rng.normal(size=(n_samples, 32))
+    distances = squareform(pdist(data))
+    affinity = np.exp(-distances ** 2 / np.median(distances) ** 2)
+    eigval, eigvec = np.linalg.eigh(affinity)
+    return {
+        'distances': distances,
+        'affinity': affinity,
+        'eigenpairs': (eigval[-n_eigval:], eigvec[:, -n_eigval:]),
+        'labels': rng.integers(0, 8, size=n_samples),
+    }
+
+
+def measure(policy, data_out, repeat):
+    """Return file size in MB and best write and read throughput in GB/s of data_out stored with policy."""
+    nbytes = sum(elem.nbytes for elem in data_out) if isinstance(data_out, tuple) else data_out.nbytes
+    write_time = read_time = float('inf')
+    size = 0
+    for _ in range(repeat):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'memo.h5')
+            with h5py.File(path, 'w') as fd:
+                storage = HashedHDF5(fd.require_group('memo'), policy=policy)
+                start = time.perf_counter()
+                storage.write(data_out, 0, None)
+                fd.flush()
+                write_time = min(write_time, time.perf_counter() - start)
+            size = os.path.getsize(path)
+            with h5py.File(path, 'r') as fd:
+                start = time.perf_counter()
+                HashedHDF5(fd['memo']).read(0, None)
+                read_time = min(read_time, time.perf_counter() - start)
+    return size / 1e6, nbytes / write_time / 1e9, nbytes / read_time / 1e9
+
+
+@click.command()
+@click.option('--samples', type=int, default=2000, help='Number of samples of the synthetic data.')
+@click.option('--eigval', type=int, default=32, help='Number of stored eigenpairs.')
+@click.option('--repeat', type=int, default=3)
+def main(samples, eigval, repeat):
+    rng = np.random.default_rng(0xDEADBEEF)
+    print(f'{"artifact":>12s} {"policy":>14s} {"MB":>9s} {"write GB/s":>11s} {"read GB/s":>10s}')
+    for name, data_out in artifacts(samples, eigval, rng).items():
+        for policy_name, policy in POLICIES.items():
+            size, write, read = measure(policy, data_out, repeat)
+            print(f'{name:>12s} {policy_name:>14s} {size:9.2f} {write:11.2f} {read:10.2f}')
+
+
+if __name__ == '__main__':
+    main()
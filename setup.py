@@ -17,6 +17,11 @@ setup(
     url='https://github.com/virelay/corelay',
     packages=find_packages(where='src', include=['corelay*']),
     package_dir={'': 'src'},
+    entry_points={
+        'console_scripts': [
+            'corelay-memo=corelay.io.maintenance:main',
+        ],
+    },
     install_requires=[
         'h5py>=2.9.0',
         'matplotlib>=3.0.3',
@@ -1,12 +1,25 @@
 """IO-related module for Processor data"""
 from .storage import Storable, NoDataSource, NoDataTarget, DataStorageBase, NoStorage, PickleStorage, HDF5Storage
+from .keys import KeyedStorable, StorageKey
+from .directory import DirectoryStorage
+from .sqlite import SQLiteStorage
+from .cache import CachedStorage
+from .writebehind import WriteBehindStorage
+from .policy import WritePolicy
 
 __all__ = [
     'Storable',
+    'KeyedStorable',
+    'StorageKey',
     'NoDataSource',
     'NoDataTarget',
     'DataStorageBase',
     'NoStorage',
     'PickleStorage',
     'HDF5Storage',
+    'DirectoryStorage',
+    'SQLiteStorage',
+    'CachedStorage',
+    'WriteBehindStorage',
+    'WritePolicy',
 ]
@@ -0,0 +1,176 @@
+"""In-memory caches in front of storages of Processor data.
+
+"""
+import sys
+import threading
+from collections import OrderedDict, namedtuple
+
+import numpy as np
+from scipy import sparse as sp
+
+from .keys import NoDataTarget, KeyedStorable, StorageKey, read_key, write_key, contains_key
+from .hashing import ext_hash, register_lineage, ExactHash
+
+
+CacheInfo = namedtuple('CacheInfo', ('hits', 'misses', 'evictions', 'entries', 'size', 'budget'))
+
+
+def nbytes(data):
+    """Return the number of bytes of the buffers of a tuple hierarchy of arrays and sparse matrices.
+
+    Parameters
+    ----------
+    data : object
+        Tuple hierarchy of :obj:`numpy.ndarray`, sparse matrices or other objects, for which the size of the object
+        itself is used.
+
+    Returns
+    -------
+    int
+        Number of bytes.
+
+    """
+    if isinstance(data, tuple):
+        return sum(nbytes(elem) for elem in data)
+    if isinstance(data, np.ndarray):
+        return data.nbytes
+    if sp.issparse(data):
+        if data.format in ('csr', 'csc', 'bsr'):
+            return data.data.nbytes + data.indices.nbytes + data.indptr.nbytes
+        if data.format == 'coo':
+            return data.data.nbytes + data.row.nbytes + data.col.nbytes
+        return nbytes(data.tocoo())
+    return sys.getsizeof(data)
+
+
+class CachedStorage:
+    """Storage with an in-memory least recently used cache in front of any other :obj:`corelay.io.storage.Storable`.
+
+    Reads are served from the cache if possible, and read through the backend otherwise. Writes are written through
+    to the backend and cached. If the backend is not a data target, e.g. :obj:`corelay.io.storage.NoStorage`, outputs
+    are only cached. Cached outputs are returned as they are, without copying, and thus should not be modified. If the
+    backend registers the lineage of its outputs (see :obj:`corelay.io.hashing.register_lineage`), so do cache hits.
+
+    Parameters
+    ----------
+    backend : :obj:`corelay.io.storage.Storable`
+        Persistent storage.
+    budget : int
+        Maximum number of bytes of cached outputs, as computed by :obj:`nbytes`. Outputs larger than the budget are
+        not cached.
+    strategy : :obj:`corelay.io.hashing.HashStrategy`, optional
+        Strategy to hash inputs with. Defaults to the strategy of the backend, if it has one, else
+        :obj:`corelay.io.hashing.ExactHash`.
+
+    """
+    def __init__(self, backend, budget=1 << 30, strategy=None):
+        self.backend = backend
+        self.budget = budget
+        if strategy is None:
+            strategy = getattr(backend, 'strategy', None)
+        self.strategy = ExactHash() if strategy is None else strategy
+        self._entries = OrderedDict()
+        self._size = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._lock = threading.RLock()
+
+    def cache_info(self):
+        """Return the statistics of the cache.
+
+        Returns
+        -------
+        :obj:`CacheInfo`
+            Number of hits, misses and evictions, number of entries, their size in bytes and the budget.
+
+        """
+        with self._lock:
+            return CacheInfo(self._hits, self._misses, self._evictions, len(self._entries), self._size, self.budget)
+
+    def cache_clear(self):
+        """Remove all entries from the cache and reset its statistics."""
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+            self._hits = self._misses = self._evictions = 0
+
+    def _put(self, key, data):
+        """Cache `data` as the most recently used entry, and evict the least recently used ones beyond the budget"""
+        size = nbytes(data)
+        with self._lock:
+            if key in self._entries:
+                self._size -= self._entries.pop(key)[1]
+            if size > self.budget:
+                return
+            self._entries[key] = (data, size)
+            self._size += size
+            while self._size > self.budget:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._size -= evicted
+                self._evictions += 1
+
+    def _register(self, data, key):
+        """Register `key` as the lineage of `data` if the backend registers the lineage of its outputs"""
+        if getattr(self.backend, 'provenance', False):
+            register_lineage(data, key.digest)
+
+    def key(self, data_in, meta):
+        """Return the key of `data_in` and `meta`, which is the key of the backend if it implements the key protocol,
+        and their hash otherwise."""
+        if isinstance(self.backend, KeyedStorable):
+            return self.backend.key(data_in, meta)
+        return StorageKey(ext_hash((data_in, meta), self.strategy), data_in, meta)
+
+    def read_key(self, key):
+        """Read output of :obj:`corelay.io.keys.StorageKey` `key` from the cache, or from the backend if it is not
+        cached"""
+        with self._lock:
+            entry = self._entries.get(key.digest)
+            if entry is not None:
+                self._entries.move_to_end(key.digest)
+                self._hits += 1
+                self._register(entry[0], key)
+                return entry[0]
+            self._misses += 1
+        data_out = read_key(self.backend, key)
+        self._put(key.digest, data_out)
+        return data_out
+
+    def write_key(self, data_out, key):
+        """Write output of :obj:`corelay.io.keys.StorageKey` `key` to the backend and the cache"""
+        try:
+            write_key(self.backend, data_out, key)
+        except NoDataTarget:
+            pass
+        self._register(data_out, key)
+        self._put(key.digest, data_out)
+
+    def contains_key(self, key):
+        """Return True if the output of :obj:`corelay.io.keys.StorageKey` `key` is cached or in the backend"""
+        return key.digest in self or contains_key(self.backend, key)
+
+    def read(self, data_in, meta):
+        """Read output from the cache, or from the backend if it is not cached"""
+        return self.read_key(self.key(data_in, meta))
+
+    def write(self, data_out, data_in, meta):
+        """Write output to the backend and the cache"""
+        self.write_key(data_out, self.key(data_in, meta))
+
+    def __contains__(self, digest):
+        """Whether an entry with the digest of a key is cached"""
+        with self._lock:
+            return str(digest) in self._entries
+
+    def close(self):
+        """Clear the cache and close the backend, if it can be closed"""
+        self.cache_clear()
+        if hasattr(self.backend, 'close'):
+            self.backend.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, typ, value, traceback):
+        self.close()
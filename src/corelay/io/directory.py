@@ -0,0 +1,207 @@
+"""Content-addressed storage of Processor data in a directory tree of .npy files.
+
+"""
+import os
+import json
+import time
+import uuid
+import shutil
+
+import numpy as np
+from scipy import sparse as sp
+
+from ..base import Param
+from .storage import DataStorageBase, SPARSE_COMPONENTS
+from .keys import NoDataSource, StorageKey, json_default
+from .hashing import ext_hash, register_lineage, HashStrategy, ExactHash
+
+
+MANIFEST = 'manifest.json'
+
+
+def save_leaf(data, directory, name='data'):
+    """Save a tuple hierarchy of arrays and sparse matrices as .npy files in `directory`, whose names start with
+    `name`, followed by the positions in the tuple hierarchy, and return its structure."""
+    if isinstance(data, tuple):
+        return {'type': 'tuple', 'items': [
+            save_leaf(elem, directory, f'{name}-{n:03d}') for n, elem in enumerate(data)
+        ]}
+    if isinstance(data, np.ndarray) and not data.dtype.hasobject:
+        np.save(os.path.join(directory, f'{name}.npy'), data, allow_pickle=False)
+        return {'type': 'ndarray', 'file': f'{name}.npy', 'shape': list(data.shape)}
+    if sp.issparse(data) and data.format in SPARSE_COMPONENTS:
+        files = {}
+        for component in SPARSE_COMPONENTS[data.format]:
+            files[component] = f'{name}.{component}.npy'
+            np.save(os.path.join(directory, files[component]), getattr(data, component), allow_pickle=False)
+        return {'type': 'sparse', 'format': data.format, 'shape': list(data.shape), 'files': files}
+    raise TypeError('Unsupported output type!')
+
+
+def load_leaf(structure, directory):
+    """Load a tuple hierarchy of memory-mapped arrays and sparse matrices from its structure."""
+    if structure['type'] == 'tuple':
+        return tuple(load_leaf(item, directory) for item in structure['items'])
+    if structure['type'] == 'ndarray':
+        return np.load(os.path.join(directory, structure['file']), mmap_mode='r', allow_pickle=False)
+    fmt = structure['format']
+    data, first, second = (
+        np.load(os.path.join(directory, structure['files'][component]), mmap_mode='r', allow_pickle=False)
+        for component in SPARSE_COMPONENTS[fmt]
+    )
+    shape = tuple(structure['shape'])
+    if fmt == 'coo':
+        return sp.coo_matrix((data, (first, second)), shape=shape, copy=False)
+    return getattr(sp, f'{fmt}_matrix')((data, first, second), shape=shape, copy=False)
+
+
+class DirectoryStorage(DataStorageBase):
+    """Content-addressed storage, which stores each entry in its own directory `<root>/<aa>/<hash>/`, where `<hash>`
+    is the hash of the data key, input and meta data, and `<aa>` are its first two characters.
+
+    Each entry consists of one .npy file per array in its (nested) tuple of outputs, the component arrays of CSR, CSC
+    and COO sparse matrices, and a JSON manifest describing the structure, data key, meta data and hash strategy.
+    Entries are written to a temporary directory first, which is then renamed atomically, such that concurrent
+    processes may write without locks; if an entry is written concurrently, the first rename wins. Reads memory-map
+    the .npy files read-only, such that data is only loaded when accessed.
+
+    Attributes
+    ----------
+    data_key : str
+        Key of the entry, which is combined with the input and meta data of reads and writes. As a memo store of
+        Processors, which read and write with their input and identifiers, it may be left empty.
+    strategy : :obj:`corelay.io.hashing.HashStrategy`
+        Strategy to hash inputs with.
+    provenance : bool
+        If True, outputs which are read or written are registered with their key as lineage, see
+        :obj:`corelay.io.hashing.register_lineage`.
+
+    """
+    data_key = Param(str, '')
+    strategy = Param(HashStrategy, ExactHash())
+    provenance = Param(bool, False)
+
+    def __init__(self, root, mode='a', **kwargs):
+        """
+        Parameters
+        ----------
+        root: str
+            Root directory of the storage.
+        mode: str
+            Read or Append mode ['r', 'a']. The root directory is created in append mode.
+
+        """
+        super().__init__(**kwargs)
+        if mode not in ['r', 'a']:
+            raise ValueError("Mode should be set to 'r' or 'a'.")
+        self.root = os.fspath(root)
+        self.mode = mode
+        if mode == 'a':
+            os.makedirs(self.root, exist_ok=True)
+        self.io = self.root
+
+    def key(self, data_in=None, meta=None):
+        """Return the key of the entry of `data_in` and `meta` at the current data key, which is the hash of all three.
+
+        Returns
+        -------
+        :obj:`corelay.io.keys.StorageKey`
+            Key to pass to :obj:`DirectoryStorage.read_key`, :obj:`DirectoryStorage.write_key` and
+            :obj:`DirectoryStorage.contains_key`.
+
+        """
+        return StorageKey(ext_hash((self.data_key, data_in, meta), self.strategy), data_in, meta)
+
+    def path(self, digest):
+        """Return the directory of the entry with hash `digest`."""
+        return os.path.join(self.root, digest[:2], digest)
+
+    def read(self, data_in=None, meta=None):
+        """
+        Returns
+        -------
+        Tuple hierarchy of read-only memory-mapped arrays and sparse matrices of the entry.
+
+        """
+        return self.read_key(self.key(data_in, meta))
+
+    def write(self, data_out, data_in=None, meta=None):
+        """
+        Parameters
+        ----------
+        data_out: np.ndarray, scipy.sparse.spmatrix, tuple
+            Tuple hierarchy of arrays and sparse matrices being stored.
+
+        """
+        self.write_key(data_out, self.key(data_in, meta))
+
+    def contains_key(self, key):
+        """Return True if the entry of :obj:`corelay.io.keys.StorageKey` `key` exists."""
+        return os.path.exists(os.path.join(self.path(key.digest), MANIFEST))
+
+    def read_key(self, key):
+        """Read the entry of :obj:`corelay.io.keys.StorageKey` `key`."""
+        directory = self.path(key.digest)
+        try:
+            with open(os.path.join(directory, MANIFEST), 'r', encoding='utf-8') as fd:
+                manifest = json.load(fd)
+        except FileNotFoundError as error:
+            raise NoDataSource(f"Key: '{key}' does not exist.") from error
+        data_out = load_leaf(manifest['structure'], directory)
+        if self.provenance:
+            register_lineage(data_out, key.digest)
+        return data_out
+
+    def write_key(self, data_out, key):
+        """Write the entry of :obj:`corelay.io.keys.StorageKey` `key`, with its meta data in the manifest."""
+        if self.mode == 'r':
+            raise OSError('Storage is opened read-only.')
+        target = self.path(key.digest)
+        if os.path.exists(target):
+            return
+        parent = os.path.dirname(target)
+        os.makedirs(parent, exist_ok=True)
+        tmp = os.path.join(parent, f'.tmp-{key.digest}-{uuid.uuid4().hex}')
+        os.mkdir(tmp)
+        try:
+            manifest = {
+                'data_key': self.data_key,
+                'meta': key.meta,
+                'strategy': self.strategy.identifiers(),
+                'created': time.time(),
+                'structure': save_leaf(data_out, tmp),
+            }
+            with open(os.path.join(tmp, MANIFEST), 'w', encoding='utf-8') as fd:
+                json.dump(manifest, fd, default=json_default)
+            try:
+                os.rename(tmp, target)
+            except OSError:
+                # another process published the same entry first
+                if not os.path.exists(target):
+                    raise
+        finally:
+            if os.path.exists(tmp):
+                shutil.rmtree(tmp)
+        if self.provenance:
+            register_lineage(data_out, key.digest)
+
+    def exists(self):
+        """Returns True if the entry of the current data key without input and meta data exists.
+
+        """
+        return self.contains_key(self.key())
+
+    def keys(self):
+        """Return the hashes of all entries.
+
+        """
+        return [
+            key
+            for prefix in sorted(os.listdir(self.root)) if len(prefix) == 2
+            for key in sorted(os.listdir(os.path.join(self.root, prefix))) if not key.startswith('.')
+        ]
+
+    def close(self):
+        """Nothing to close, since files are only opened during reads and writes.
+
+        """
@@ -5,10 +5,22 @@ Note
 See https://github.com/chr5tphr/funcache/blob/master/funcache/hashing.py
 
 """
+import os
+import mmap
 import pickle
+import hashlib
+import weakref
+from types import CodeType, FunctionType, MethodType, ModuleType
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar
 
+import h5py
 import numpy as np
 from numpy import ndarray
+from scipy import sparse as sp
 # pylint: disable=no-name-in-module
 from metrohash import MetroHash128
 try:
@@ -17,6 +29,27 @@ except ImportError:
     class Tensor:
         """Dummy Tensor"""
 
+from .lazy import DatasetProxy
+
+
+# number of bytes fed to the hasher at once; the metrohash binding only accepts bytes, so each chunk of the buffer is
+# copied once, which keeps the temporary memory bounded by this size
+CHUNK_SIZE = 1 << 20
+# size of the blocks of the tree-hashing mode, which is part of the digest, and thus has to be fixed between runs
+BLOCK_SIZE = 1 << 26
+# name of an optional attribute of HDF5 datasets with a checksum, which is included in their file keys
+CHECKSUM_ATTR = 'checksum'
+# maximum number of evenly spaced elements of a memoized array which are compared to detect in-place modifications
+MEMO_SAMPLES = 64
+# sparse formats whose content is held in component arrays, which can be checked for modifications by a HashMemo
+MEMO_SPARSE_FORMATS = ('csr', 'csc', 'bsr', 'coo')
+# name of the attribute of functions holding the optional version tag set by `versioned`
+VERSION_ATTR = '__corelay_version__'
+
+
+# memo of the currently active hash_memo scope, if any
+_HASH_MEMO = ContextVar('hash_memo', default=None)
+
 
 class Hasher(MetroHash128):
     """Hasher object with a write function for file-like updates"""
@@ -26,31 +59,933 @@ class Hasher(MetroHash128):
         return len(data)
 
 
-class HashPickler(pickle.Pickler):
-    """Pickler for computing Hashes"""
+def _contiguous_strides(shape, itemsize, order='C'):
+    """Compute the strides of a contiguous array with `shape` and `itemsize` in memory order `order`."""
+    strides = []
+    stride = itemsize
+    dims = reversed(shape) if order == 'C' else shape
+    for dim in dims:
+        strides.append(stride)
+        stride *= max(dim, 1)
+    return tuple(reversed(strides)) if order == 'C' else tuple(strides)
+
+
+def _iter_chunks(array):
+    """Yield the memory of `array` in chunks of at most :obj:`CHUNK_SIZE` bytes.
+
+    Contiguous arrays are sliced through a memoryview of their own buffer. Other arrays are copied to C-order in blocks
+    along their first axis, such that at most about :obj:`CHUNK_SIZE` bytes are held at once.
+
+    """
+    if array.flags.c_contiguous or array.flags.f_contiguous:
+        buffer = memoryview(np.ravel(array, order='K').view(np.uint8))
+        for start in range(0, len(buffer), CHUNK_SIZE):
+            yield bytes(buffer[start:start + CHUNK_SIZE])
+        return
+
+    row_bytes = array[:1].nbytes
+    rows = max(CHUNK_SIZE // max(row_bytes, 1), 1)
+    for start in range(0, array.shape[0], rows):
+        buffer = memoryview(np.ascontiguousarray(array[start:start + rows]).reshape(-1).view(np.uint8))
+        for offset in range(0, len(buffer), CHUNK_SIZE):
+            yield bytes(buffer[offset:offset + CHUNK_SIZE])
+
+
+def _digest(dtype, shape, strides, chunks):
+    """Compute the digest of a buffer given as an iterable of bytes `chunks`, with `dtype`, `shape` and `strides`."""
+    hasher = Hasher()
+    hasher.update(repr((dtype.descr, shape, strides)).encode('utf-8'))
+    for chunk in chunks:
+        hasher.update(chunk)
+    return hasher.digest()
+
+
+def array_digest(array):
+    """Compute the digest of the raw buffer of a numpy array.
+
+    The buffer is fed into the hasher in chunks, without creating full-size temporary copies. The dtype, shape and the
+    strides of the hashed memory layout are mixed into the digest, such that equal buffers of differently shaped or
+    typed arrays do not collide.
+
+    Parameters
+    ----------
+    array : :obj:`numpy.ndarray`
+        Array with a non-object dtype to hash.
+
+    Returns
+    -------
+    bytes
+        Digest of the array.
+
+    """
+    order = 'F' if array.flags.f_contiguous and not array.flags.c_contiguous else 'C'
+    strides = _contiguous_strides(array.shape, array.dtype.itemsize, order)
+    return _digest(array.dtype, array.shape, strides, _iter_chunks(array))
+
+
+def dataset_digest(dataset):
+    """Compute the digest of the content of a HDF5 dataset, streamed from disk in blocks along its first axis, such that
+    at most about :obj:`CHUNK_SIZE` bytes are loaded at once. The digest is the same as the one of the loaded array
+    computed with :obj:`array_digest`.
+
+    Parameters
+    ----------
+    dataset : :obj:`h5py.Dataset`
+        Dataset with a non-object dtype to hash.
+
+    Returns
+    -------
+    bytes
+        Digest of the dataset's content.
+
+    """
+    def _chunks():
+        """Read and yield the chunks of the dataset"""
+        if not dataset.shape:
+            yield from _iter_chunks(np.asarray(dataset[()]))
+            return
+        row_bytes = int(np.prod(dataset.shape[1:], dtype=np.int64)) * dataset.dtype.itemsize
+        rows = max(CHUNK_SIZE // max(row_bytes, 1), 1)
+        for start in range(0, dataset.shape[0], rows):
+            yield from _iter_chunks(dataset[start:start + rows])
+
+    strides = _contiguous_strides(dataset.shape, dataset.dtype.itemsize)
+    return _digest(dataset.dtype, dataset.shape, strides, _chunks())
+
+
+def _file_identity(path):
+    """Return the real path, size and modification time of the file at `path`, or None if it can not be accessed."""
+    try:
+        path = os.path.realpath(os.fspath(path))
+        stat = os.stat(path)
+    except (OSError, TypeError):
+        return None
+    return (path, stat.st_size, stat.st_mtime_ns)
+
+
+def _block(array, index, block_size):
+    """Return a bytes-like object of block number `index` of size `block_size` of the C-order buffer of `array`, which
+    may also be a HDF5 dataset, of which only the rows overlapping with the block are read.
+    """
+    start = index * block_size
+    if not array.shape or (isinstance(array, ndarray) and (array.flags.c_contiguous or array.flags.f_contiguous)):
+        return memoryview(np.ravel(array[()], order='K').view(np.uint8))[start:start + block_size]
+
+    row_bytes = int(np.prod(array.shape[1:], dtype=np.int64)) * array.dtype.itemsize
+    first = start // row_bytes
+    last = -(-(start + block_size) // row_bytes)
+    rows = np.ascontiguousarray(array[first:last]).reshape(-1).view(np.uint8)
+    offset = start - first * row_bytes
+    return memoryview(rows)[offset:offset + block_size]
+
+
+def _block_digest(block):
+    """Compute the digest of the bytes-like `block`.
+
+    Blocks are hashed with :obj:`hashlib.blake2b`, which accepts memoryviews without copying and releases the GIL for
+    large buffers, such that blocks are hashed concurrently when called from multiple threads.
+
+    """
+    return hashlib.blake2b(block, digest_size=16).digest()
+
+
+def _tree_digest(header, n_blocks, block, workers):
+    """Compute the root digest of `header` and the digests of the `n_blocks` blocks returned by `block(index)`."""
+    hasher = Hasher()
+    hasher.update(repr(header).encode('utf-8'))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for digest in executor.map(lambda index: _block_digest(block(index)), range(n_blocks)):
+            hasher.update(digest)
+    return hasher.digest()
+
+
+def tree_digest(array, block_size=None, workers=None):
+    """Compute the tree-digest of the raw buffer of a numpy array.
+
+    The buffer in the same memory order as used by :obj:`array_digest` is split into blocks of a fixed size, which are
+    hashed concurrently on a thread pool. The root digest is computed from the dtype, shape, strides, block size and the
+    ordered block digests, and thus does not depend on the number of threads.
+
+    Parameters
+    ----------
+    array : :obj:`numpy.ndarray`
+        Array with a non-object dtype to hash.
+    block_size : int, optional
+        Size of the blocks in bytes. Defaults to :obj:`BLOCK_SIZE`.
+    workers : int, optional
+        Maximum number of threads. Defaults to the default of :obj:`concurrent.futures.ThreadPoolExecutor`.
+
+    Returns
+    -------
+    bytes
+        Digest of the array.
+
+    """
+    if block_size is None:
+        block_size = BLOCK_SIZE
+    order = 'F' if array.flags.f_contiguous and not array.flags.c_contiguous else 'C'
+    strides = _contiguous_strides(array.shape, array.dtype.itemsize, order)
+    n_blocks = -(-array.nbytes // block_size)
+    header = ('tree', block_size, n_blocks, array.dtype.descr, array.shape, strides)
+    return _tree_digest(header, n_blocks, lambda index: _block(array, index, block_size), workers)
+
+
+def dataset_tree_digest(dataset, block_size=None, workers=None):
+    """Compute the tree-digest of the content of a HDF5 dataset, reading only the rows overlapping with each block from
+    disk. The digest is the same as the one of the loaded array computed with :obj:`tree_digest`.
+
+    Parameters
+    ----------
+    dataset : :obj:`h5py.Dataset`
+        Dataset with a non-object dtype to hash.
+    block_size : int, optional
+        Size of the blocks in bytes. Defaults to :obj:`BLOCK_SIZE`.
+    workers : int, optional
+        Maximum number of threads. Defaults to the default of :obj:`concurrent.futures.ThreadPoolExecutor`.
+
+    Returns
+    -------
+    bytes
+        Digest of the dataset's content.
+
+    """
+    if block_size is None:
+        block_size = BLOCK_SIZE
+    strides = _contiguous_strides(dataset.shape, dataset.dtype.itemsize)
+    n_blocks = -(-dataset.nbytes // block_size)
+    header = ('tree', block_size, n_blocks, dataset.dtype.descr, dataset.shape, strides)
+    return _tree_digest(header, n_blocks, lambda index: _block(dataset, index, block_size), workers)
+
+
+def _sparse_components(obj):
+    """Return the component arrays of the sparse matrix `obj`."""
+    if obj.format == 'coo':
+        return (obj.row, obj.col, obj.data)
+    if obj.format in ('csr', 'csc', 'bsr'):
+        return (obj.indptr, obj.indices, obj.data)
+    return ()
+
+
+def canonical_sparse(obj):
+    """Return the canonical CSR representation of the sparse matrix `obj`, i.e. with sorted indices and without
+    duplicate entries. CSR matrices already in canonical format are returned as they are, all others are converted.
+
+    Parameters
+    ----------
+    obj : :obj:`scipy.sparse.spmatrix`
+        Sparse matrix of any format.
+
+    Returns
+    -------
+    :obj:`scipy.sparse.csr_matrix`
+        Canonical CSR representation of `obj`.
+
+    """
+    if obj.format != 'csr':
+        # conversions from coo and csc already sum duplicates and sort indices
+        obj = obj.tocsr()
+    if not obj.has_canonical_format:
+        obj = obj.copy()
+        obj.sum_duplicates()
+    return obj
+
+
+class HashMemo:
+    """Identity-keyed memo of persistent ids of numpy arrays and scipy sparse matrices.
+
+    Entries are keyed by the identity of the array and hold a weak reference to it, such that they are dropped as soon
+    as the array is garbage collected. An entry is invalidated when the writeable flag, data pointer, shape, strides or
+    dtype of the array changed since it was hashed, or the values of up to :obj:`MEMO_SAMPLES` evenly spaced elements,
+    which detects most in-place modifications at a negligible cost. Modifications of only other elements are not
+    detected, unless `freeze` is set. Sparse matrices are only memoized in the formats :obj:`MEMO_SPARSE_FORMATS`, of
+    which the component arrays are checked.
+
+    Parameters
+    ----------
+    freeze : bool
+        If True, memoized arrays (and the component arrays of memoized sparse matrices) are made read-only until the
+        memo is closed, such that in-place modifications raise instead of silently reusing a stale digest. Their
+        writeable flag is restored by :obj:`HashMemo.close`.
+
+    """
+    def __init__(self, freeze=False):
+        self.freeze = freeze
+        self._entries = {}
+        self._frozen = []
+
     @staticmethod
-    def numpy_id(obj):
-        """Persistent id for numpy arrays"""
-        mantissa, exponent = np.frexp(obj)
-        np.around(mantissa, decimals=2, out=mantissa)
+    def memoizable(obj):
+        """Return True if modifications of `obj` can be detected, which excludes sparse matrices whose content is not
+        held in component arrays, e.g. in the lil, dok and dia formats."""
+        return not sp.issparse(obj) or obj.format in MEMO_SPARSE_FORMATS
+
+    @classmethod
+    def _state(cls, obj):
+        """Return the properties of `obj` which invalidate its entries when changed. For sparse matrices, these are the
+        format, shape and the properties of all component arrays."""
+        if sp.issparse(obj):
+            return (obj.format, obj.shape) + tuple(cls._state(array) for array in _sparse_components(obj))
+        if isinstance(obj, DatasetProxy):
+            return (id(obj.dataset), obj.shape, obj.dtype.str)
+        sample = b''
+        if obj.size:
+            indices = np.linspace(0, obj.size - 1, min(obj.size, MEMO_SAMPLES), dtype=np.int64)
+            sample = obj.flat[indices].tobytes()
         return (
-            obj.dtype.name,
+            obj.flags.writeable,
+            obj.__array_interface__['data'][0],
             obj.shape,
+            obj.strides,
+            obj.dtype.str,
+            sample,
+        )
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _freeze(self, obj):
+        """Make the writeable arrays of `obj` read-only until the memo is closed."""
+        if sp.issparse(obj):
+            for array in _sparse_components(obj):
+                self._freeze(array)
+        elif isinstance(obj, ndarray) and obj.flags.writeable:
+            obj.flags.writeable = False
+            self._frozen.append(weakref.ref(obj))
+
+    def close(self):
+        """Discard all entries, and make the arrays which were made read-only by the memo writeable again."""
+        self._entries.clear()
+        pending = [array for array in (ref() for ref in reversed(self._frozen)) if array is not None]
+        self._frozen = []
+        # views can only be made writeable after their base, which may have been frozen after them
+        while pending:
+            failed = []
+            for array in pending:
+                try:
+                    array.flags.writeable = True
+                except ValueError:
+                    failed.append(array)
+            if len(failed) == len(pending):
+                break
+            pending = failed
+
+    def get(self, obj, mode):
+        """Return the memoized persistent id of `obj` hashed with `mode`, or None if there is no valid entry."""
+        entry = self._entries.get(id(obj))
+        if entry is None:
+            return None
+        ref, state, values = entry
+        if ref() is not obj or state != self._state(obj):
+            self._entries.pop(id(obj), None)
+            return None
+        return values.get(mode)
+
+    def set(self, obj, mode, value):
+        """Memoize the persistent id `value` of `obj` hashed with `mode`, unless its modifications can not be
+        detected."""
+        if not self.memoizable(obj):
+            return
+        key = id(obj)
+        if self.freeze:
+            self._freeze(obj)
+        state = self._state(obj)
+        entry = self._entries.get(key)
+        if entry is None or entry[0]() is not obj or entry[1] != state:
+            entries = self._entries
+            entry = (weakref.ref(obj, lambda _: entries.pop(key, None)), state, {})
+            self._entries[key] = entry
+        entry[2][mode] = value
+
+
+@contextmanager
+def hash_memo(freeze=False):
+    """Context in which the persistent ids of hashed numpy arrays are memoized by the arrays' identity. Nested contexts
+    share the memo of the outermost context, which is discarded when the outermost context exits.
+
+    In-place modifications of hashed arrays within the context are detected by sampling their elements, see
+    :obj:`HashMemo`. For a strict guarantee, `freeze` makes hashed arrays read-only until the context exits.
+
+    Parameters
+    ----------
+    freeze : bool
+        If True, hashed arrays are read-only until the outermost context exits. Ignored for nested contexts.
+
+    Yields
+    ------
+    :obj:`HashMemo`
+        The active memo.
+
+    """
+    memo = _HASH_MEMO.get()
+    if memo is not None:
+        yield memo
+        return
+    memo = HashMemo(freeze=freeze)
+    token = _HASH_MEMO.set(memo)
+    try:
+        yield memo
+    finally:
+        _HASH_MEMO.reset(token)
+        memo.close()
+
+
+def register_lineage(data, key):
+    """Register the key from which `data` was derived in the active :obj:`HashMemo`, if any.
+
+    Numpy arrays and sparse matrices in the tuple hierarchy `data` will subsequently be hashed by their lineage, i.e.
+    `key` and their position in `data`, instead of by their content, until the outermost :obj:`hash_memo` context
+    exits, or until they are invalidated.
+
+    Parameters
+    ----------
+    data : object
+        Tuple hierarchy of outputs, usually of a memoized :obj:`corelay.processor.base.Processor`.
+    key : str
+        Key which uniquely identifies the computation of `data`, e.g. the hash of its input and the Processor.
+
+    """
+    memo = _HASH_MEMO.get()
+    if memo is None:
+        return
+
+    def _register(obj, path):
+        """Recursively register the leaves of a tuple hierarchy"""
+        if isinstance(obj, tuple):
+            for n, elem in enumerate(obj):
+                _register(elem, path + (n,))
+        elif isinstance(obj, (ndarray, DatasetProxy)) or sp.issparse(obj):
+            memo.set(obj, 'lineage', ('lineage', key, path))
+
+    _register(data, ())
+
+
+def versioned(tag):
+    """Decorator to attach a version tag to a function, which is included in its fingerprint. Changing the tag forces
+    new keys for memoized outputs depending on the function, e.g. when it calls code which is not fingerprinted, like
+    functions of other modules.
+
+    Parameters
+    ----------
+    tag : str
+        Version tag of the function.
+
+    Returns
+    -------
+    callable
+        Decorator which sets the version tag and returns the function.
+
+    """
+    def decorator(func):
+        setattr(func, VERSION_ATTR, tag)
+        return func
+    return decorator
+
+
+def _code_id(code):
+    """Return the parts of a code object which define its behaviour, excluding its name and location."""
+    return (
+        code.co_code,
+        tuple(_code_id(const) if isinstance(const, CodeType) else const for const in code.co_consts),
+        code.co_names,
+        code.co_varnames,
+        code.co_freevars,
+        code.co_argcount,
+        code.co_kwonlyargcount,
+        code.co_flags,
+    )
+
+
+def _global_names(code):
+    """Return the sorted names used in `code` and all its nested code objects"""
+    names = set(code.co_names)
+    for const in code.co_consts:
+        if isinstance(const, CodeType):
+            names.update(_global_names(const))
+    return sorted(names)
+
+
+class HashStrategy(ABC):
+    """Base class of strategies to compute the persistent ids of numpy arrays and HDF5 datasets for hashing.
+
+    The persistent ids of all strategies differ from each other for the same arrays, and the identifiers of a strategy
+    are recorded by storages next to the outputs they store.
+
+    Parameters
+    ----------
+    file_keys : bool
+        If True, hash file-backed inputs, i.e. :obj:`h5py.Dataset` and :obj:`numpy.memmap`, by their provenance instead
+        of their content: the file's path, size and modification time, the dataset's name or the memory-map's offset,
+        its shape and dtype, and for datasets the optional checksum attribute :obj:`CHECKSUM_ATTR`. This is fast, but
+        only safe as long as files are not rewritten with the same size within the resolution of their modification
+        time. Inputs whose files can not be accessed are hashed by their content.
+
+    """
+    name = None
+    # whether persistent ids may be stored in a HashMemo; should be False for large ids
+    memoize = True
+
+    def __init__(self, file_keys=False):
+        self.file_keys = file_keys
+
+    def identifiers(self):
+        """Return the name and all parameters of this strategy which change its persistent ids.
+
+        Returns
+        -------
+        :obj:`collections.OrderedDict`
+            Name and parameters of this strategy.
+
+        """
+        return OrderedDict(name=self.name, file_keys=self.file_keys)
+
+    @property
+    def mode(self):
+        """Hashable representation of the identifiers, used to distinguish memoized ids of different strategies"""
+        return tuple(self.identifiers().items())
+
+    @abstractmethod
+    def array_id(self, array):
+        """Persistent id of a numpy array with a non-object dtype"""
+
+    def dataset_id(self, dataset):
+        """Persistent id of a HDF5 dataset with a non-object dtype. Loads the dataset if not overwritten."""
+        return self.array_id(np.asarray(dataset[()]))
+
+    def __eq__(self, other):
+        return isinstance(other, HashStrategy) and self.mode == other.mode
+
+    def __hash__(self):
+        return hash(self.mode)
+
+    def __repr__(self):
+        params = ', '.join(f'{key}={value!r}' for key, value in self.identifiers().items() if key != 'name')
+        return f'{type(self).__name__}({params})'
+
+
+class ExactHash(HashStrategy):
+    """Hash arrays by their exact raw buffers, see :obj:`array_digest`. HDF5 datasets are streamed from disk.
+
+    Parameters
+    ----------
+    tree : bool
+        If True, hash the buffers of arrays and HDF5 datasets larger than :obj:`BLOCK_SIZE` using :obj:`tree_digest`
+        and :obj:`dataset_tree_digest`. Digests differ from the ones computed with `tree=False`, but not between
+        different numbers of `workers`, or between datasets and their loaded arrays.
+    workers : int, optional
+        Maximum number of threads to use for tree-hashing.
+    file_keys : bool
+        See :obj:`HashStrategy`.
+
+    """
+    name = 'exact'
+
+    def __init__(self, tree=False, workers=None, file_keys=False):
+        super().__init__(file_keys=file_keys)
+        self.tree = tree
+        self.workers = workers
+
+    def identifiers(self):
+        result = super().identifiers()
+        result['tree'] = self.tree
+        return result
+
+    def array_id(self, array):
+        if self.tree and array.nbytes > BLOCK_SIZE:
+            return ('ndarray-tree', tree_digest(array, workers=self.workers))
+        return ('ndarray', array_digest(array))
+
+    def dataset_id(self, dataset):
+        if self.tree and dataset.nbytes > BLOCK_SIZE:
+            return ('ndarray-tree', dataset_tree_digest(dataset, workers=self.workers))
+        return ('ndarray', dataset_digest(dataset))
+
+
+class TolerantHash(HashStrategy):
+    """Hash arrays by their mantissa rounded to a number of decimals and their exponent, such that tiny numerical
+    differences result in the same hash. The rounded mantissa is copied, which is why ids are not memoized.
+
+    Parameters
+    ----------
+    decimals : int
+        Number of decimals of the mantissa to keep.
+    file_keys : bool
+        See :obj:`HashStrategy`.
+
+    """
+    name = 'tolerant'
+    memoize = False
+
+    def __init__(self, decimals=2, file_keys=False):
+        super().__init__(file_keys=file_keys)
+        self.decimals = decimals
+
+    def identifiers(self):
+        result = super().identifiers()
+        result['decimals'] = self.decimals
+        return result
+
+    def array_id(self, array):
+        mantissa, exponent = np.frexp(array)
+        np.around(mantissa, decimals=self.decimals, out=mantissa)
+        return (
+            self.name,
+            self.decimals,
+            array.dtype.name,
+            array.shape,
             bytes(mantissa),
             bytes(exponent),
         )
 
+
+class SampledHash(HashStrategy):
+    """Hash arrays by a deterministic, strided subsample of their elements, their shape and dtype, and optionally
+    summary statistics of all elements. This is intended for multi-GB arrays, for which hashing the whole buffer costs
+    more than a cache lookup saves. Changes to elements which are not sampled are only detected if they change the
+    summary statistics.
+
+    Parameters
+    ----------
+    n_samples : int
+        Maximum number of elements to sample at evenly spaced positions of the flattened array.
+    statistics : bool
+        If True, include the sum, minimum and maximum of all elements of numeric arrays. This requires full passes over
+        the data, which together cost about as much as hashing it exactly, and is thus disabled by default.
+    file_keys : bool
+        See :obj:`HashStrategy`.
+
+    """
+    name = 'sampled'
+
+    def __init__(self, n_samples=65536, statistics=False, file_keys=False):
+        super().__init__(file_keys=file_keys)
+        self.n_samples = n_samples
+        self.statistics = statistics
+
+    def identifiers(self):
+        result = super().identifiers()
+        result['n_samples'] = self.n_samples
+        result['statistics'] = self.statistics
+        return result
+
+    def _indices(self, shape):
+        """Return the multi-indices of the sampled elements of an array with `shape`"""
+        size = int(np.prod(shape, dtype=np.int64))
+        flat = np.unique(np.linspace(0, size - 1, min(size, self.n_samples), dtype=np.int64))
+        return np.unravel_index(flat, shape)
+
+    def _id(self, dtype, shape, samples, stats):
+        """Combine the parts of the persistent id"""
+        return (self.name, self.n_samples, dtype.descr, shape, array_digest(np.ascontiguousarray(samples)), stats)
+
+    @staticmethod
+    def _blocks(array):
+        """Yield C-contiguous blocks of at most about :obj:`CHUNK_SIZE` bytes along the first axis of an array or HDF5
+        dataset, such that arrays and datasets with the same content are reduced in the same order"""
+        row_bytes = array.dtype.itemsize * int(np.prod(array.shape[1:], dtype=np.int64))
+        rows = max(CHUNK_SIZE // max(row_bytes, 1), 1)
+        for start in range(0, array.shape[0], rows):
+            yield np.ascontiguousarray(array[start:start + rows])
+
+    def _stats(self, array):
+        """Reduce the sum, minimum and maximum of an array or HDF5 dataset block by block, if statistics are enabled"""
+        dtype = array.dtype
+        if not self.statistics or not (np.issubdtype(dtype, np.number) or np.issubdtype(dtype, np.bool_)):
+            return None
+        total, low, high = 0., None, None
+        for block in self._blocks(array.reshape(1) if not array.shape else array):
+            if block.size:
+                total += float(block.sum(dtype=np.float64))
+                low = block.min().item() if low is None else min(low, block.min().item())
+                high = block.max().item() if high is None else max(high, block.max().item())
+        return (repr(total), repr(low), repr(high))
+
+    def array_id(self, array):
+        samples = array[self._indices(array.shape)] if array.shape else array.reshape(1)
+        stats = self._stats(array)
+        return self._id(array.dtype, array.shape, samples, stats)
+
+    def dataset_id(self, dataset):
+        if not dataset.shape:
+            return self.array_id(np.asarray(dataset[()]))
+        samples = np.empty(0, dtype=dataset.dtype)
+        if dataset.size:
+            coords = np.stack(self._indices(dataset.shape), axis=1)
+            samples = np.empty(len(coords), dtype=dataset.dtype)
+            file_space = dataset.id.get_space()
+            file_space.select_elements(coords)
+            dataset.id.read(h5py.h5s.create_simple(samples.shape), file_space, samples)
+        return self._id(dataset.dtype, dataset.shape, samples, self._stats(dataset))
+
+
+class HashPickler(pickle.Pickler):
+    """Pickler for computing Hashes
+
+    Parameters
+    ----------
+    file : file-like
+        Object with a write function which receives the pickled bytes, usually a :obj:`Hasher`.
+    strategy : :obj:`HashStrategy`, optional
+        Strategy to compute the persistent ids of numpy arrays and HDF5 datasets. Defaults to :obj:`ExactHash`.
+
+    Notes
+    -----
+    Scipy sparse matrices are hashed by the ids of their component arrays, and HDF5 datasets are never loaded
+    completely into memory by :obj:`ExactHash`, either being hashed by their provenance, or by streaming their content
+    in chunks.
+
+    """
+    def __init__(self, file, strategy=None, **kwargs):
+        super().__init__(file, **kwargs)
+        self.strategy = ExactHash() if strategy is None else strategy
+        self._callables = set()
+        # module of the outermost fingerprinted function, whose functions of other modules are referenced by name
+        self._module = None
+
+    def value_id(self, obj, tagged=False):
+        """Persistent id of an arbitrary object referenced by a function, which is its digest.
+
+        Objects which cannot be hashed are identified by their type if the referencing function is `tagged` with
+        :obj:`versioned`, in which case the version tag has to be changed when the object changes. Otherwise, a
+        :obj:`TypeError` is raised, since functions referencing different such objects would share their fingerprint.
+
+        """
+        if isinstance(obj, ModuleType):
+            return ('module', obj.__name__)
+        hasher = Hasher()
+        pickler = type(self)(hasher, strategy=self.strategy)
+        # pylint: disable=protected-access
+        pickler._callables = self._callables
+        pickler._module = self._module
+        try:
+            pickler.dump(obj)
+        except (pickle.PicklingError, TypeError, AttributeError) as error:
+            if not tagged:
+                raise TypeError(
+                    f'Cannot fingerprint a function referencing an unhashable {type(obj).__qualname__} object, tag '
+                    'the function with corelay.io.hashing.versioned instead.'
+                ) from error
+            return ('unhashable', type(obj).__module__, type(obj).__qualname__)
+        return ('value', hasher.digest())
+
+    def function_id(self, obj):
+        """Persistent id of python functions and methods by their fingerprint.
+
+        The fingerprint consists of the function's bytecode and constants, including nested functions, its defaults,
+        the values of its closure, the values of all referenced globals, and an optional version tag set with
+        :obj:`versioned`. The name and location of the function are not part of the fingerprint. Referenced functions
+        of other modules than the fingerprinted function, e.g. of libraries, are only identified by their name. Bound
+        methods are identified by their function and the instance they are bound to, which is hashed like the values
+        of a closure, or by its identifiers if it has any, e.g. a :obj:`corelay.processor.base.Processor`. Functions
+        and methods which (indirectly) reference themselves are only identified by their name when referenced.
+        Referenced values which cannot be hashed raise a :obj:`TypeError`, unless the function is tagged with
+        :obj:`versioned`.
+
+        """
+        if isinstance(obj, MethodType):
+            return self.method_id(obj)
+
+        if obj in self._callables or self._module not in (None, obj.__module__):
+            return ('function-ref', obj.__module__, obj.__qualname__)
+        self._callables.add(obj)
+        outer = self._module
+        self._module = obj.__module__
+        try:
+            code = obj.__code__
+            tag = getattr(obj, VERSION_ATTR, None)
+            tagged = tag is not None
+            closure = tuple(self.value_id(cell.cell_contents, tagged) for cell in obj.__closure__ or ())
+            global_values = tuple(
+                (name, self.value_id(obj.__globals__[name], tagged))
+                for name in _global_names(code) if name in obj.__globals__
+            )
+            return (
+                'function',
+                _code_id(code),
+                self.value_id(obj.__defaults__, tagged),
+                self.value_id(obj.__kwdefaults__, tagged),
+                closure,
+                global_values,
+                tag,
+            )
+        finally:
+            self._callables.discard(obj)
+            self._module = outer
+
+    def method_id(self, obj):
+        """Persistent id of bound methods by the fingerprint of their function and the id of their instance, see
+        :obj:`HashPickler.function_id`."""
+        func = obj.__func__
+        # the instance may reference the method itself, e.g. as an identifier of a Processor
+        ref = (id(obj.__self__), func)
+        if ref in self._callables:
+            return ('method-ref', func.__module__, func.__qualname__)
+        self._callables.add(ref)
+        try:
+            bound = obj.__self__
+            tagged = getattr(func, VERSION_ATTR, None) is not None
+            identifiers = getattr(bound, 'identifiers', None)
+            if callable(identifiers) and not isinstance(bound, type):
+                bound_id = ('identifiers', self.value_id(identifiers(), tagged))
+            else:
+                bound_id = self.value_id(bound, tagged)
+            return ('method', self.function_id(func), bound_id)
+        finally:
+            self._callables.discard(ref)
+
+    def array_id(self, obj):
+        """Persistent id for numpy arrays using the configured strategy, or None for object arrays, which are
+        pickled"""
+        if obj.dtype.hasobject:
+            return None
+        return self.strategy.array_id(obj)
+
+    def memoized_array_id(self, obj):
+        """Persistent id for numpy arrays, looked up in and stored to the active :obj:`HashMemo`, if any and if the
+        strategy allows it."""
+        memo = _HASH_MEMO.get()
+        if memo is None or not self.strategy.memoize:
+            return self.array_id(obj)
+        value = memo.get(obj, self.strategy.mode)
+        if value is None:
+            value = self.array_id(obj)
+            if value is not None:
+                memo.set(obj, self.strategy.mode, value)
+        return value
+
+    def sparse_id(self, obj):
+        """Persistent id for scipy sparse matrices.
+
+        Matrices are converted to their canonical CSR representation, such that CSR, CSC and COO matrices with the same
+        values share the same id, and the format, shape, and the raw buffers of the index pointers, indices and data
+        are hashed.
+
+        """
+        obj = canonical_sparse(obj)
+        return (
+            'sparse',
+            obj.format,
+            obj.shape,
+            self.memoized_array_id(obj.indptr),
+            self.memoized_array_id(obj.indices),
+            self.memoized_array_id(obj.data),
+        )
+
+    def memoized_sparse_id(self, obj):
+        """Persistent id for scipy sparse matrices, looked up in and stored to the active :obj:`HashMemo`, if any."""
+        memo = _HASH_MEMO.get()
+        if memo is None or not self.strategy.memoize:
+            return self.sparse_id(obj)
+        value = memo.get(obj, self.strategy.mode)
+        if value is None:
+            value = self.sparse_id(obj)
+            memo.set(obj, self.strategy.mode, value)
+        return value
+
+    @staticmethod
+    def file_id(obj):
+        """Persistent id of file-backed datasets and memory-maps by their provenance, or None if `obj` is not
+        file-backed or its file can not be accessed."""
+        if isinstance(obj, h5py.Dataset):
+            identity = _file_identity(obj.file.filename)
+            if identity is None:
+                return None
+            checksum = obj.attrs.get(CHECKSUM_ATTR)
+            if isinstance(checksum, ndarray):
+                checksum = checksum.tolist()
+            return ('h5py-file', identity, obj.name, obj.shape, obj.dtype.descr, checksum)
+
+        if isinstance(obj, np.memmap) and getattr(obj, '_mmap', None) is not None and obj.filename is not None:
+            identity = _file_identity(obj.filename)
+            if identity is None:
+                return None
+            try:
+                # pylint: disable=protected-access
+                map_address = np.frombuffer(obj._mmap, dtype=np.uint8).__array_interface__['data'][0]
+            except (ValueError, TypeError):
+                return None
+            map_offset = obj.offset - obj.offset % mmap.ALLOCATIONGRANULARITY
+            offset = obj.__array_interface__['data'][0] - map_address + map_offset
+            return ('memmap-file', identity, offset, obj.shape, obj.strides, obj.dtype.descr)
+        return None
+
+    def dataset_id(self, obj):
+        """Persistent id for HDF5 datasets using the configured strategy. Datasets with an object dtype are loaded and
+        pickled."""
+        if obj.dtype.hasobject:
+            hasher = Hasher()
+            type(self)(hasher, strategy=self.strategy).dump(obj[()])
+            return ('h5py-pickled', hasher.digest())
+        return self.strategy.dataset_id(obj)
+
+    @staticmethod
+    def lineage_id(obj):
+        """Persistent id of numpy arrays, sparse matrices or dataset proxies with a registered lineage, or None if there
+        is none."""
+        memo = _HASH_MEMO.get()
+        if memo is None:
+            return None
+        return memo.get(obj, 'lineage')
+
     def persistent_id(self, obj):
         """Persistent ids for persistent pickles"""
+        value = None
+        if isinstance(obj, (ndarray, DatasetProxy)) or sp.issparse(obj):
+            value = self.lineage_id(obj)
+        if isinstance(obj, DatasetProxy) and value is None:
+            # proxies of only the first rows of a dataset are hashed by the loaded rows
+            obj = obj.dataset if obj.length is None else np.asarray(obj)
+        if value is None and self.strategy.file_keys:
+            value = self.file_id(obj)
+        if value is not None:
+            return value
+        if isinstance(obj, h5py.Dataset):
+            return self.dataset_id(obj)
         if isinstance(obj, ndarray):
-            return self.numpy_id(obj)
-        if isinstance(obj, Tensor):
-            return self.numpy_id(obj.numpy())
-        return None
+            return self.memoized_array_id(obj)
+        if sp.issparse(obj):
+            return self.memoized_sparse_id(obj)
+        if isinstance(obj, (FunctionType, MethodType)):
+            value = self.function_id(obj)
+        elif isinstance(obj, Tensor):
+            value = self.array_id(obj.numpy())
+        return value
+
+
+def ext_hash(data, strategy=None):
+    """Extended non-cryptographic Hashing using Pickle and MetroHash
+
+    Parameters
+    ----------
+    data : object
+        Picklable object to hash. Numpy arrays are hashed by their buffer.
+    strategy : :obj:`HashStrategy`, optional
+        Strategy to hash numpy arrays and HDF5 datasets. Defaults to :obj:`ExactHash`.
 
+    Returns
+    -------
+    str
+        Hexadecimal digest.
 
-def ext_hash(data):
-    """Extended non-cryptographic Hashing using Pickle and MetroHash"""
+    """
     hasher = Hasher()
-    HashPickler(hasher).dump(data)
+    HashPickler(hasher, strategy=strategy).dump(data)
     return hasher.hexdigest()
+
+
+def fingerprint(func, strategy=None):
+    """Compute a stable fingerprint of a python function, see :obj:`HashPickler.function_id`.
+
+    Parameters
+    ----------
+    func : :obj:`types.FunctionType` or :obj:`types.MethodType`
+        Function to fingerprint.
+    strategy : :obj:`HashStrategy`, optional
+        Strategy to hash arrays referenced by the function. Defaults to :obj:`ExactHash`.
+
+    Returns
+    -------
+    str
+        Hexadecimal digest.
+
+    """
+    return ext_hash(func, strategy)
@@ -0,0 +1,239 @@
+"""In-memory index of the entries of hashed storages, with size-bounded eviction.
+
+"""
+import time
+from collections import OrderedDict
+
+import h5py
+
+
+# names of the attributes of entry groups which persist their index information
+SIZE_ATTR = 'size'
+CREATED_ATTR = 'created'
+ACCESSED_ATTR = 'accessed'
+COST_ATTR = 'cost'
+
+EVICTION_POLICIES = ('lru', 'cost')
+
+# name of the attribute of the base group of hashed storages which holds the number of shard levels of its layout
+SHARD_ATTR = 'shard_depth'
+# number of characters of the key per shard level
+SHARD_WIDTH = 2
+
+
+class IndexEntry:
+    """Index information of a single stored output.
+
+    Parameters
+    ----------
+    size : int
+        Number of bytes the output occupies in storage.
+    created : float
+        Time of creation in seconds since the epoch.
+    accessed : float
+        Time of the last access in seconds since the epoch.
+    cost : float
+        Time in seconds it took to compute the output, or 0 if unknown.
+
+    """
+    __slots__ = ('size', 'created', 'accessed', 'cost')
+
+    def __init__(self, size, created, accessed, cost):
+        self.size = size
+        self.created = created
+        self.accessed = accessed
+        self.cost = cost
+
+    @classmethod
+    def from_group(cls, group):
+        """Load the index information persisted in the attributes of an entry group. The size of entries without
+        index attributes is computed from their datasets, and their times default to 0."""
+        attrs = group.attrs
+        size = int(attrs[SIZE_ATTR]) if SIZE_ATTR in attrs else group_size(group)
+        return cls(
+            size,
+            float(attrs.get(CREATED_ATTR, 0.)),
+            float(attrs.get(ACCESSED_ATTR, 0.)),
+            float(attrs.get(COST_ATTR, 0.)),
+        )
+
+    def to_group(self, group):
+        """Persist the index information in the attributes of an entry group."""
+        group.attrs[SIZE_ATTR] = self.size
+        group.attrs[CREATED_ATTR] = self.created
+        group.attrs[ACCESSED_ATTR] = self.accessed
+        group.attrs[COST_ATTR] = self.cost
+
+    def __repr__(self):
+        return (
+            f'{type(self).__name__}(size={self.size}, created={self.created}, accessed={self.accessed}, '
+            f'cost={self.cost})'
+        )
+
+
+def group_size(group):
+    """Return the number of bytes allocated by all datasets in a HDF5 group, including its subgroups.
+
+    Parameters
+    ----------
+    group : :obj:`h5py.Group`
+        Group of which to compute the size.
+
+    Returns
+    -------
+    int
+        Number of bytes allocated by the datasets, after compression.
+
+    """
+    sizes = []
+
+    def _visit(_, obj):
+        if isinstance(obj, h5py.Dataset):
+            sizes.append(obj.id.get_storage_size())
+    group.visititems(_visit)
+    return sum(sizes)
+
+
+def shard_path(key, depth):
+    """Return the path of the entry group of `key` relative to the base group, in a layout with `depth` shard levels,
+    e.g. 'ab/cd/abcd...' for a depth of 2.
+
+    Parameters
+    ----------
+    key : str
+        Key of the entry.
+    depth : int
+        Number of shard levels, each named by the next two characters of the key.
+
+    Returns
+    -------
+    str
+        Path of the entry group.
+
+    """
+    shards = [key[level * SHARD_WIDTH:(level + 1) * SHARD_WIDTH] for level in range(depth)]
+    return '/'.join(shards + [key])
+
+
+def iter_entry_groups(base):
+    """Iterate over the entry groups of a hashed storage in any layout, descending into shard groups, which are
+    recognized by their names of two characters.
+
+    Parameters
+    ----------
+    base : :obj:`h5py.Group`
+        Group of the hashed storage.
+
+    Yields
+    ------
+    tuple of (str, :obj:`h5py.Group`)
+        Key and group of each entry.
+
+    """
+    for key, group in base.items():
+        if not isinstance(group, h5py.Group):
+            continue
+        if len(key) == SHARD_WIDTH:
+            yield from iter_entry_groups(group)
+        else:
+            yield key, group
+
+
+class MemoIndex:
+    """In-memory index of the entries of a hashed storage, ordered by their last access.
+
+    The index is loaded once from the attributes of the entry groups, such that lookups of missing keys do not need to
+    access the file.
+
+    Parameters
+    ----------
+    eviction : str
+        Eviction policy, either 'lru' to evict the least recently used entries first, or 'cost' to evict the entries
+        with the lowest compute cost per byte first, breaking ties by their last access.
+
+    """
+    def __init__(self, eviction='lru'):
+        if eviction not in EVICTION_POLICIES:
+            raise ValueError(f"Unsupported eviction policy: '{eviction}'")
+        self.eviction = eviction
+        self.entries = OrderedDict()
+        self.total = 0
+
+    def load(self, base):
+        """Replace the index by the entries of a HDF5 group. Access times which are more recent in the current index,
+        e.g. of reads which did not persist them, are kept.
+
+        Parameters
+        ----------
+        base : :obj:`h5py.Group`
+            Group of the hashed storage, containing one group per entry.
+
+        """
+        entries = [(key, IndexEntry.from_group(group)) for key, group in iter_entry_groups(base)]
+        for key, entry in entries:
+            if key in self.entries:
+                entry.accessed = max(entry.accessed, self.entries[key].accessed)
+        entries.sort(key=lambda item: item[1].accessed)
+        self.entries = OrderedDict(entries)
+        self.total = sum(entry.size for entry in self.entries.values())
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __getitem__(self, key):
+        return self.entries[key]
+
+    def add(self, key, entry):
+        """Add or replace the entry of `key` as the most recently used one."""
+        self.remove(key)
+        self.entries[key] = entry
+        self.total += entry.size
+
+    def remove(self, key):
+        """Remove the entry of `key` if it exists, and return it or None."""
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.total -= entry.size
+        return entry
+
+    def touch(self, key, now=None):
+        """Mark the entry of `key` as the most recently used one, and return it."""
+        entry = self.entries[key]
+        entry.accessed = time.time() if now is None else now
+        self.entries.move_to_end(key)
+        return entry
+
+    def victims(self, budget, exclude=()):
+        """Return the keys to evict such that the total size does not exceed `budget`, in order of eviction.
+
+        Parameters
+        ----------
+        budget : int
+            Maximum total number of bytes.
+        exclude : iterable of str
+            Keys which may not be evicted, e.g. the one which was just written.
+
+        Returns
+        -------
+        list of str
+            Keys to evict. If the excluded entries alone exceed the budget, all others are evicted.
+
+        """
+        excess = self.total - budget
+        if excess <= 0:
+            return []
+        exclude = set(exclude)
+        candidates = [key for key in self.entries if key not in exclude]
+        if self.eviction == 'cost':
+            # stable sort, such that ties keep their order of least recent use
+            candidates.sort(key=lambda key: self.entries[key].cost / max(self.entries[key].size, 1))
+        result = []
+        for key in candidates:
+            if excess <= 0:
+                break
+            result.append(key)
+            excess -= self.entries[key].size
+        return result
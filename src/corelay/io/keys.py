@@ -0,0 +1,171 @@
+"""Key protocol of storages, by which the key of the input and meta data is computed once and passed to all accesses of
+the same output, and the errors raised by storages.
+
+"""
+from types import FunctionType, MethodType
+
+from .hashing import fingerprint
+
+
+class NoDataSource(Exception):
+    """Raise when no data source available."""
+    # Following is not useless, since message becomes optional
+    # pylint: disable=useless-super-delegation
+    def __init__(self, message='No Data Source available.'):
+        super().__init__(message)
+
+
+class NoDataTarget(Exception):
+    """Raise when no target source available."""
+    def __init__(self):
+        super().__init__('No Data Target available.')
+
+
+class KeyedStorableMeta(type):
+    """Meta class to check for the attributes of the key protocol via isinstance"""
+    def __instancecheck__(cls, instance):
+        """Is instance if object has attributes key, read_key, write_key and contains_key"""
+        return all(hasattr(instance, attr) for attr in ('key', 'read_key', 'write_key', 'contains_key'))
+
+
+class KeyedStorable(metaclass=KeyedStorableMeta):
+    """Abstract class to check for the attributes of the key protocol via isinstance.
+
+    Storages implementing the key protocol compute a :obj:`StorageKey` of the input and meta data once with
+    ``key(data_in, meta)``, which is then passed to ``read_key(key)``, ``write_key(data_out, key)`` and
+    ``contains_key(key)``, such that the input is not hashed again for each access.
+    """
+
+
+class StorageKey:
+    """Key of an output in a storage, as returned by the `key` method of storages implementing the key protocol.
+
+    Keys compare equal by their digest only. Storages with their own keys may use any digest.
+
+    Parameters
+    ----------
+    digest : str
+        Hash which identifies the output in the storage.
+    data_in : object, optional
+        Input data from which the key was computed, which some storages write alongside the output.
+    meta : object, optional
+        Meta data from which the key was computed, which some storages write alongside the output.
+
+    """
+    __slots__ = ('digest', 'data_in', 'meta')
+
+    def __init__(self, digest, data_in=None, meta=None):
+        self.digest = digest
+        self.data_in = data_in
+        self.meta = meta
+
+    def __eq__(self, other):
+        return isinstance(other, StorageKey) and self.digest == other.digest
+
+    def __hash__(self):
+        return hash(self.digest)
+
+    def __str__(self):
+        return self.digest
+
+    def __repr__(self):
+        return f"{type(self).__name__}('{self.digest}')"
+
+
+def storage_key(storage, data_in, meta):
+    """Return the key of `data_in` and `meta` in `storage`, which is computed by the storage if it implements the key
+    protocol, see :obj:`KeyedStorable`, and otherwise only holds the input and meta data.
+
+    Parameters
+    ----------
+    storage : :obj:`Storable`
+        Storage for which to compute the key.
+    data_in : object
+        Input data.
+    meta : object
+        Meta data, usually the identifiers of a Processor.
+
+    Returns
+    -------
+    :obj:`StorageKey`
+        Key to pass to :obj:`read_key`, :obj:`write_key` and :obj:`contains_key`.
+
+    """
+    if isinstance(storage, KeyedStorable):
+        return storage.key(data_in, meta)
+    return StorageKey(None, data_in, meta)
+
+
+def read_key(storage, key):
+    """Read the output of :obj:`StorageKey` `key` from `storage`, using the key protocol if implemented, and
+    :obj:`Storable` `read` otherwise."""
+    if isinstance(storage, KeyedStorable):
+        return storage.read_key(key)
+    return storage.read(data_in=key.data_in, meta=key.meta)
+
+
+def write_key(storage, data_out, key):
+    """Write the output of :obj:`StorageKey` `key` to `storage`, using the key protocol if implemented, and
+    :obj:`Storable` `write` otherwise."""
+    if isinstance(storage, KeyedStorable):
+        storage.write_key(data_out, key)
+    else:
+        storage.write(data_out=data_out, data_in=key.data_in, meta=key.meta)
+
+
+def contains_key(storage, key):
+    """Return True if the output of :obj:`StorageKey` `key` is in `storage`. Storages which do not implement the key
+    protocol are checked by reading the output."""
+    if isinstance(storage, KeyedStorable):
+        return storage.contains_key(key)
+    try:
+        storage.read(data_in=key.data_in, meta=key.meta)
+    except NoDataSource:
+        return False
+    return True
+
+
+def read_many(storage, keys):
+    """Read the outputs of multiple keys from `storage`, in a single batch if it implements `read_many`, which returns
+    the stored outputs by digest, and one by one otherwise.
+
+    Parameters
+    ----------
+    storage : :obj:`Storable`
+        Storage from which to read.
+    keys : list of :obj:`StorageKey`
+        Keys of the outputs.
+
+    Returns
+    -------
+    dict
+        Outputs of the stored keys, by their position in `keys`.
+
+    """
+    if isinstance(storage, KeyedStorable) and hasattr(storage, 'read_many'):
+        outputs = storage.read_many(keys)
+        return {n: outputs[key.digest] for n, key in enumerate(keys) if key.digest in outputs}
+    result = {}
+    for n, key in enumerate(keys):
+        try:
+            result[n] = read_key(storage, key)
+        except NoDataSource:
+            pass
+    return result
+
+
+def contains_many(storage, keys):
+    """Return the positions of the keys whose outputs are in `storage`, checked in a single batch if it implements
+    `contains_many`, which returns the digests of the stored keys, and one by one otherwise."""
+    if isinstance(storage, KeyedStorable) and hasattr(storage, 'contains_many'):
+        digests = storage.contains_many(keys)
+        return {n for n, key in enumerate(keys) if key.digest in digests}
+    return {n for n, key in enumerate(keys) if contains_key(storage, key)}
+
+
+def json_default(obj):
+    """Serialize objects in meta data which are not supported by json, i.e. functions by their name and fingerprint,
+    and everything else by its representation"""
+    if isinstance(obj, (FunctionType, MethodType)):
+        return {'function': f'{obj.__module__}.{obj.__qualname__}', 'fingerprint': fingerprint(obj)}
+    return repr(obj)
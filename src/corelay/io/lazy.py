@@ -0,0 +1,198 @@
+"""Lazy access to arrays stored in HDF5 files, which are only loaded into memory when accessed.
+
+"""
+from collections.abc import Mapping
+
+import numpy as np
+import h5py
+
+
+class DatasetProxy:
+    """Read-only array proxy of a HDF5 dataset, which only loads the data when indexed or converted to an array.
+
+    Indexing the proxy only reads the selected elements, e.g. ``proxy[:, 1]`` reads a single column, and
+    ``np.asarray(proxy)`` reads the full dataset.
+
+    Parameters
+    ----------
+    dataset : :obj:`h5py.Dataset`
+        Dataset to proxy. It must stay open as long as the proxy is accessed.
+    length : int, optional
+        Number of rows of the dataset to expose, e.g. of appendable datasets whose capacity exceeds their rows. Rows
+        beyond `length` are neither read nor part of the shape. Defaults to all rows.
+
+    """
+    def __init__(self, dataset, length=None):
+        self.dataset = dataset
+        self.length = length
+
+    @property
+    def shape(self):
+        """Shape of the dataset"""
+        if self.length is None:
+            return self.dataset.shape
+        return (self.length,) + self.dataset.shape[1:]
+
+    @property
+    def dtype(self):
+        """Data type of the dataset"""
+        return self.dataset.dtype
+
+    @property
+    def ndim(self):
+        """Number of dimensions of the dataset"""
+        return len(self.dataset.shape)
+
+    @property
+    def size(self):
+        """Number of elements of the dataset"""
+        return int(np.prod(self.shape, dtype=np.int64))
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, key):
+        if self.length is None:
+            return self.dataset[key]
+        key = key if isinstance(key, tuple) else (key,)
+        if not key or key[0] is Ellipsis:
+            key = (slice(None),) + key
+        first, rest = key[0], key[1:]
+        if isinstance(first, slice):
+            start, stop, step = first.indices(self.length)
+            if step > 0:
+                return self.dataset[(slice(start, max(start, stop), step),) + rest]
+        # other indices of the first axis are resolved against the exposed rows, and read in increasing order
+        rows = np.arange(self.length)[first]
+        if not rows.shape:
+            return self.dataset[(int(rows),) + rest]
+        unique, inverse = np.unique(rows, return_inverse=True)
+        return self.dataset[(unique,) + rest][inverse]
+
+    def __array__(self, dtype=None, copy=None):
+        # pylint: disable=unused-argument
+        array = self.dataset[()] if self.length is None else self.dataset[:self.length]
+        if dtype is not None:
+            array = array.astype(dtype, copy=False)
+        return array
+
+    def __repr__(self):
+        return f'{type(self).__name__}(shape={self.shape}, dtype={self.dtype})'
+
+
+def memmap_dataset(dataset):
+    """Memory-map a HDF5 dataset read-only, if it is stored contiguously and uncompressed in a file on disk.
+
+    Parameters
+    ----------
+    dataset : :obj:`h5py.Dataset`
+        Dataset to memory-map.
+
+    Returns
+    -------
+    :obj:`numpy.memmap` or None
+        Read-only memory-map of the dataset, or None if it cannot be memory-mapped, i.e. if it is chunked, compressed,
+        not yet allocated, empty, has a non-numeric data type, or its file is not on disk.
+
+    """
+    if dataset.chunks is not None or dataset.compression is not None or dataset.dtype.hasobject:
+        return None
+    if not dataset.shape or dataset.size == 0 or dataset.file.driver not in ('sec2', 'stdio'):
+        return None
+    offset = dataset.id.get_offset()
+    if offset is None:
+        return None
+    dataset.file.flush()
+    return np.memmap(dataset.file.filename, mode='r', dtype=dataset.dtype, shape=dataset.shape, offset=offset)
+
+
+def lazy_dataset(dataset, memmap=True):
+    """Return a lazily loaded view of a HDF5 dataset.
+
+    Parameters
+    ----------
+    dataset : :obj:`h5py.Dataset`
+        Dataset to view.
+    memmap : bool
+        If True, return a read-only :obj:`numpy.memmap` if the dataset supports it, see :obj:`memmap_dataset`.
+
+    Returns
+    -------
+    :obj:`numpy.memmap`, :obj:`DatasetProxy` or :obj:`numpy.ndarray`
+        Memory-map of the dataset if possible, otherwise a proxy, or the loaded value for scalar datasets.
+
+    """
+    if not isinstance(dataset, h5py.Dataset):
+        raise TypeError('Unsupported lazy type!')
+    if not dataset.shape:
+        return dataset[()]
+    result = memmap_dataset(dataset) if memmap else None
+    if result is None:
+        result = DatasetProxy(dataset)
+    return result
+
+
+def lazy_leaf(dataset, memmap=False):
+    """Return a lazily loaded view of a HDF5 dataset, like :obj:`lazy_dataset`, but decode scalar strings.
+
+    Parameters
+    ----------
+    dataset : :obj:`h5py.Dataset`
+        Dataset to view.
+    memmap : bool
+        If True, return a read-only :obj:`numpy.memmap` if the dataset supports it, see :obj:`memmap_dataset`.
+
+    Returns
+    -------
+    :obj:`numpy.memmap`, :obj:`DatasetProxy`, :obj:`numpy.ndarray` or str
+        Lazy view of the dataset, or the loaded value for scalar datasets.
+
+    """
+    value = lazy_dataset(dataset, memmap)
+    check = h5py.check_string_dtype(dataset.dtype)
+    if check is not None and isinstance(value, bytes):
+        value = value.decode(check.encoding)
+    return value
+
+
+class GroupView(Mapping):
+    """Read-only mapping view of a HDF5 group, which only loads data when its leaves are indexed.
+
+    Subgroups are returned as views, and datasets as :obj:`DatasetProxy`, such that e.g. ``view['embedding'][idx]``
+    only reads the selected rows. Scalar datasets are loaded when accessed. Listing the keys and checking for
+    membership only access the links of the group. As in :obj:`corelay.io.storage.HDF5Storage`, names consisting of
+    digits are keys of type int, such that groups of tuples may be indexed like sequences.
+
+    Parameters
+    ----------
+    group : :obj:`h5py.Group`
+        Group to view. It must stay open as long as the view is accessed.
+    memmap : bool
+        If True, return datasets as read-only :obj:`numpy.memmap` if they support it, see :obj:`memmap_dataset`.
+
+    """
+    def __init__(self, group, memmap=False):
+        self.group = group
+        self.memmap = memmap
+
+    def __getitem__(self, key):
+        try:
+            value = self.group[str(key)]
+        except KeyError as error:
+            raise KeyError(key) from error
+        if isinstance(value, h5py.Group):
+            return type(self)(value, self.memmap)
+        return lazy_leaf(value, self.memmap)
+
+    def __iter__(self):
+        for name in self.group:
+            yield int(name) if name.isdigit() else name
+
+    def __len__(self):
+        return len(self.group)
+
+    def __contains__(self, key):
+        return str(key) in self.group
+
+    def __repr__(self):
+        return f'{type(self).__name__}({self.group.name!r}, keys={list(self)})'
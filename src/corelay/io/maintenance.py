@@ -0,0 +1,444 @@
+"""Maintenance of HDF5 memo files of :obj:`corelay.io.storage.HashedHDF5`: compaction, deduplication, pruning and
+usage reports, with a command line interface.
+
+"""
+import os
+import json
+import inspect
+import datetime
+import importlib
+from contextlib import contextmanager
+from collections import OrderedDict, namedtuple
+from types import FunctionType, MethodType
+
+import click
+import h5py
+import numpy as np
+
+from .index import IndexEntry, iter_entry_groups, shard_path, SHARD_ATTR, SHARD_WIDTH
+from .shared import file_lock
+from .keys import json_default
+
+
+UsageRow = namedtuple('UsageRow', ('name', 'entries', 'size', 'shared', 'cost', 'accessed'))
+
+
+def _decode(value):
+    """Decode a JSON string dataset value, which h5py returns as bytes."""
+    return json.loads(value.decode() if isinstance(value, bytes) else value)
+
+
+def _object_address(obj):
+    """Return the address of a HDF5 object in its file, which is the same for all hard links to the object."""
+    return h5py.h5o.get_info(obj.id).addr
+
+
+def iter_entries(base):
+    """Iterate over the complete entries of a hashed storage in any layout, i.e. the ones with data.
+
+    Parameters
+    ----------
+    base : :obj:`h5py.Group`
+        Group of the hashed storage.
+
+    Yields
+    ------
+    tuple of (str, :obj:`h5py.Group`)
+        Key and group of each entry.
+
+    """
+    for key, group in iter_entry_groups(base):
+        if 'data' in group:
+            yield key, group
+
+
+def stored_size(base):
+    """Return the number of bytes allocated by the datasets of a HDF5 group, counting datasets which are hard-linked
+    multiple times only once.
+
+    Parameters
+    ----------
+    base : :obj:`h5py.Group`
+        Group of which to compute the size.
+
+    Returns
+    -------
+    int
+        Number of bytes allocated by distinct datasets, after compression.
+
+    """
+    sizes = {}
+
+    def _visit(_, obj):
+        if isinstance(obj, h5py.Dataset):
+            sizes[_object_address(obj)] = obj.id.get_storage_size()
+    base.visititems(_visit)
+    return sum(sizes.values())
+
+
+def repack(path, output=None):
+    """Copy all objects of a HDF5 file into a new file, which reclaims the space of deleted objects, e.g. of evicted
+    or pruned entries. Hard links within each top-level group, e.g. of deduplicated outputs, are preserved. The file
+    must not be opened by other processes.
+
+    Parameters
+    ----------
+    path : str
+        Path of the HDF5 file.
+    output : str, optional
+        Path of the repacked file. Defaults to replacing the original file once the copy is complete.
+
+    Returns
+    -------
+    tuple of int
+        Sizes of the file in bytes before and after repacking.
+
+    """
+    path = os.fspath(path)
+    target = f'{path}.repack' if output is None else os.fspath(output)
+    try:
+        with h5py.File(path, 'r') as source, h5py.File(target, 'w') as dest:
+            for name, value in source.attrs.items():
+                dest.attrs[name] = value
+            for name in source:
+                source.copy(source[name], dest, name)
+    except BaseException:
+        if output is None and os.path.exists(target):
+            os.remove(target)
+        raise
+    before = os.path.getsize(path)
+    after = os.path.getsize(target)
+    if output is None:
+        os.replace(target, path)
+    return before, after
+
+
+def _data_layout(obj):
+    """Return the layout of the stored data `obj`, i.e. the names, types, dtypes and shapes of all its groups and
+    datasets, and their attributes, e.g. the format of sparse matrices."""
+    attrs = tuple(sorted((name, repr(np.asarray(value).tolist())) for name, value in obj.attrs.items()))
+    if isinstance(obj, h5py.Dataset):
+        return ('dataset', obj.dtype.str, obj.shape, attrs)
+    return ('group', attrs, tuple((name, _data_layout(child)) for name, child in sorted(obj.items())))
+
+
+def _hashed_exactly(group):
+    """Return True if the output hash of an entry identifies its content, i.e. if it was computed by the exact
+    strategy without file keys, which is also the case for entries written before strategies were recorded."""
+    if 'strategy' not in group:
+        return True
+    strategy = _decode(group['strategy'][()])
+    return strategy.get('name') == 'exact' and not strategy.get('file_keys', False)
+
+
+def deduplicate(base, dry_run=False):
+    """Replace the data of entries with identical outputs by hard links to the data of a single entry.
+
+    Outputs are identical if their output hashes, which are stored with each entry, their write policies and the
+    layouts of their data are equal. The layout includes e.g. the format of sparse matrices, which are hashed in their
+    canonical form. Only entries whose outputs were hashed exactly by their content are considered, i.e. with
+    :obj:`corelay.io.hashing.ExactHash` without file keys, or before strategies were recorded, since the hashes of
+    other strategies do not identify the content. The space of the replaced data is only reclaimed when the file is
+    repacked, see :obj:`repack`. The sizes stored in the index attributes of the entries are not changed, such that
+    budgets still count shared data once per entry.
+
+    Parameters
+    ----------
+    base : :obj:`h5py.Group`
+        Group of the hashed storage.
+    dry_run : bool
+        If True, do not modify the file.
+
+    Returns
+    -------
+    list of tuple of (str, str)
+        Keys of the relinked entries and of the entries whose data they share.
+
+    """
+    canonical = {}
+    relinked = []
+    for key, group in iter_entries(base):
+        if 'output' not in group or not _hashed_exactly(group):
+            continue
+        identity = (
+            group['output'][()],
+            group['policy'][()] if 'policy' in group else None,
+            _data_layout(group['data']),
+        )
+        if identity not in canonical:
+            canonical[identity] = (key, group.name)
+            continue
+        original_key, original_name = canonical[identity]
+        original = base.file[original_name]
+        if _object_address(original['data']) == _object_address(group['data']):
+            continue
+        relinked.append((key, original_key))
+        if not dry_run:
+            del group['data']
+            group['data'] = original['data']
+    return relinked
+
+
+def migrate(base, shards=2):
+    """Move all entries of a hashed storage into the layout with `shards` shard levels in place, and record it in the
+    attribute 'shard_depth' of `base`, see :obj:`corelay.io.storage.HashedHDF5`. Only links are moved, such that no
+    data is read or copied, and memory is bounded by the keys. The depth is recorded first, such that an interrupted
+    migration may be resumed and its entries are read from either layout meanwhile. Empty shard groups are removed.
+
+    Parameters
+    ----------
+    base : :obj:`h5py.Group`
+        Group of the hashed storage.
+    shards : int
+        Number of shard levels of the new layout, or 0 for the flat layout.
+
+    Returns
+    -------
+    int
+        Number of moved entries.
+
+    """
+    base.attrs[SHARD_ATTR] = shards
+    prefix = base.name.rstrip('/') + '/'
+    moves = [
+        (group.name[len(prefix):], shard_path(key, shards))
+        for key, group in iter_entry_groups(base)
+        if group.name[len(prefix):] != shard_path(key, shards)
+    ]
+    for source, target in moves:
+        parent = target.rpartition('/')[0]
+        if parent:
+            base.require_group(parent)
+        if target in base:
+            # the entry was already written in the new layout, e.g. by a concurrent process
+            del base[source]
+        else:
+            base.move(source, target)
+    _remove_empty_shards(base)
+    return len(moves)
+
+
+def _remove_empty_shards(group):
+    """Remove the shard groups below `group` which contain no entries."""
+    for name, child in list(group.items()):
+        if isinstance(child, h5py.Group) and len(name) == SHARD_WIDTH:
+            _remove_empty_shards(child)
+            if len(child) == 0:
+                del group[name]
+
+
+def _current_fingerprints(functions):
+    """Return the sets of fingerprints by name, as stored in meta data, of functions and of the functions in the
+    identifiers of Processors. Multiple functions may share their name, e.g. lambdas."""
+    result = {}
+    for obj in functions:
+        candidates = [obj] if isinstance(obj, (FunctionType, MethodType)) else obj.identifiers().values()
+        for func in candidates:
+            if not isinstance(func, (FunctionType, MethodType)):
+                continue
+            record = json_default(func)
+            result.setdefault(record['function'], set()).add(record['fingerprint'])
+    return result
+
+
+def _function_records(meta):
+    """Iterate over the function records in decoded meta data, as written by :obj:`corelay.io.keys.json_default`"""
+    if isinstance(meta, dict):
+        if set(meta) == {'function', 'fingerprint'}:
+            yield meta
+            return
+        for value in meta.values():
+            yield from _function_records(value)
+    elif isinstance(meta, list):
+        for value in meta:
+            yield from _function_records(value)
+
+
+def prune(base, before=None, functions=None, dry_run=False):
+    """Delete entries which were created before a date, or which were computed by other versions of functions.
+
+    Parameters
+    ----------
+    base : :obj:`h5py.Group`
+        Group of the hashed storage.
+    before : float or :obj:`datetime.datetime`, optional
+        Delete the entries created before this time, given in seconds since the epoch or as a date. Entries without a
+        creation time are considered to be created at the epoch.
+    functions : iterable of function or :obj:`corelay.processor.base.Processor`, optional
+        Current versions of functions, or Processors whose identifiers contain functions. Delete the entries whose
+        meta data contain a function with the name of one of these functions, but with none of the fingerprints of the
+        functions of that name, i.e. which were computed by a different version of the function.
+    dry_run : bool
+        If True, do not modify the file.
+
+    Returns
+    -------
+    list of str
+        Keys of the deleted entries.
+
+    """
+    if isinstance(before, datetime.datetime):
+        before = before.timestamp()
+    current = _current_fingerprints(functions or ())
+    stale = []
+    for key, group in iter_entries(base):
+        if before is not None and IndexEntry.from_group(group).created < before:
+            stale.append((key, group.name))
+        elif current and 'meta' in group and any(
+            record['fingerprint'] not in current.get(record['function'], (record['fingerprint'],))
+            for record in _function_records(_decode(group['meta'][()]))
+        ):
+            stale.append((key, group.name))
+    if not dry_run:
+        for _, name in stale:
+            del base.file[name]
+    return [key for key, _ in stale]
+
+
+def usage(base):
+    """Summarize the entries of a hashed storage per Processor, as identified by the name in their meta data.
+
+    Parameters
+    ----------
+    base : :obj:`h5py.Group`
+        Group of the hashed storage.
+
+    Returns
+    -------
+    list of :obj:`UsageRow`
+        Per Processor name, sorted by decreasing size: the number of entries, their total size in bytes, the number of
+        entries sharing their data with other entries, the total compute cost in seconds and the time of the last
+        access in seconds since the epoch.
+
+    """
+    rows = OrderedDict()
+    for _, group in iter_entries(base):
+        meta = _decode(group['meta'][()]) if 'meta' in group else None
+        name = meta.get('name', '<unknown>') if isinstance(meta, dict) else '<unknown>'
+        entry = IndexEntry.from_group(group)
+        shared = h5py.h5o.get_info(group['data'].id).rc > 1
+        row = rows.get(name, UsageRow(name, 0, 0, 0, 0., 0.))
+        rows[name] = UsageRow(
+            name,
+            row.entries + 1,
+            row.size + entry.size,
+            row.shared + shared,
+            row.cost + entry.cost,
+            max(row.accessed, entry.accessed),
+        )
+    return sorted(rows.values(), key=lambda row: row.size, reverse=True)
+
+
+def _resolve(spec):
+    """Import the functions referred to by `spec`, which is either 'module:qualname' or a module, of which all
+    functions defined in the module are returned."""
+    module_name, _, qualname = spec.partition(':')
+    module = importlib.import_module(module_name)
+    if not qualname:
+        return [
+            obj for _, obj in inspect.getmembers(module, inspect.isfunction) if obj.__module__ == module.__name__
+        ]
+    obj = module
+    for name in qualname.split('.'):
+        obj = getattr(obj, name)
+    return [obj]
+
+
+def _format_size(size):
+    """Format a number of bytes for humans."""
+    for unit in ('B', 'KiB', 'MiB', 'GiB'):
+        if abs(size) < 1024:
+            return f'{size:.1f} {unit}' if unit != 'B' else f'{size} {unit}'
+        size /= 1024
+    return f'{size:.1f} TiB'
+
+
+@contextmanager
+def _open_base(path, group, write):
+    """Open the group of a memo file, while holding the lock of :obj:`corelay.io.shared.SharedHashedHDF5` if the file
+    has one."""
+    lock_path = f'{path}.lock'
+    if os.path.exists(lock_path):
+        with file_lock(lock_path, exclusive=write):
+            with h5py.File(path, 'r+' if write else 'r') as fd:
+                yield fd[group]
+    else:
+        with h5py.File(path, 'r+' if write else 'r') as fd:
+            yield fd[group]
+
+
+@click.group()
+def main():
+    """Maintain HDF5 memo files of hashed storages."""
+
+
+@main.command('repack')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--output', type=click.Path(dir_okay=False), help='Write to this file instead of replacing PATH.')
+def repack_command(path, output):
+    """Reclaim the space of deleted entries by copying PATH into a new file."""
+    before, after = repack(path, output)
+    click.echo(f'{_format_size(before)} -> {_format_size(after)}')
+
+
+@main.command('dedup')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--group', default='hashed', show_default=True, help='Group of the hashed storage.')
+@click.option('--dry-run', is_flag=True, help='Only report the entries which would be relinked.')
+def dedup_command(path, group, dry_run):
+    """Hard-link the data of entries with identical outputs."""
+    with _open_base(path, group, write=not dry_run) as base:
+        before = stored_size(base)
+        relinked = deduplicate(base, dry_run=dry_run)
+        after = stored_size(base)
+    click.echo(f'{len(relinked)} entries relinked, {_format_size(before - after)} to reclaim by repacking')
+
+
+@main.command('prune')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--group', default='hashed', show_default=True, help='Group of the hashed storage.')
+@click.option('--before', type=click.DateTime(), help='Delete the entries created before this date.')
+@click.option(
+    '--function', 'specs', multiple=True,
+    help="Delete entries computed by other versions of these functions, given as 'module:qualname' or 'module'.",
+)
+@click.option('--dry-run', is_flag=True, help='Only report the entries which would be deleted.')
+def prune_command(path, group, before, specs, dry_run):
+    """Delete old entries, or entries of outdated functions."""
+    functions = [func for spec in specs for func in _resolve(spec)]
+    with _open_base(path, group, write=not dry_run) as base:
+        stale = prune(base, before=before, functions=functions, dry_run=dry_run)
+    click.echo(f'{len(stale)} entries {"to delete" if dry_run else "deleted"}, repack to reclaim their space')
+
+
+@main.command('migrate')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--group', default='hashed', show_default=True, help='Group of the hashed storage.')
+@click.option('--shards', type=click.IntRange(0, 8), default=2, show_default=True, help='Number of shard levels.')
+def migrate_command(path, group, shards):
+    """Move all entries into the layout with the given number of shard levels."""
+    with _open_base(path, group, write=True) as base:
+        moved = migrate(base, shards)
+    click.echo(f'{moved} entries moved')
+
+
+@main.command('usage')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--group', default='hashed', show_default=True, help='Group of the hashed storage.')
+def usage_command(path, group):
+    """Print the number and size of entries per Processor."""
+    with _open_base(path, group, write=False) as base:
+        rows = usage(base)
+        total = stored_size(base)
+    click.echo(f'{"processor":<32} {"entries":>8} {"size":>12} {"shared":>8} {"cost [s]":>10}  last access')
+    for row in rows:
+        accessed = datetime.datetime.fromtimestamp(row.accessed).isoformat(' ', 'seconds') if row.accessed else '-'
+        click.echo(
+            f'{row.name:<32} {row.entries:>8d} {_format_size(row.size):>12} {row.shared:>8d} {row.cost:>10.2f}  '
+            f'{accessed}'
+        )
+    click.echo(f'{len(rows)} processors, {_format_size(total)} stored')
+
+
+if __name__ == '__main__':
+    main()  # pylint: disable=no-value-for-parameter
@@ -0,0 +1,157 @@
+"""Write policies, which configure the layout, filters and precision of arrays written to HDF5 storages.
+
+"""
+from collections import OrderedDict
+
+import numpy as np
+
+
+class WritePolicy:
+    """Policy of how arrays are written to HDF5 datasets.
+
+    Parameters
+    ----------
+    chunks : bool or tuple of int, optional
+        Chunk shape of written datasets. True lets h5py guess the chunk shape. Chunk shapes which do not match the
+        number of dimensions of an array are replaced by h5py's guess, and chunk sizes larger than the array are
+        clipped. Defaults to contiguous datasets, unless filters are used, which require chunking.
+    compression : str, optional
+        Compression filter, i.e. 'gzip' or 'lzf'.
+    compression_opts : int, optional
+        Options of the compression filter, i.e. the level between 0 and 9 for 'gzip'.
+    shuffle : bool
+        If True, apply the byte shuffle filter before compression, which often improves the compression of floats.
+    downcast : str or :obj:`numpy.dtype`, optional
+        Floating point type, e.g. 'float32' or 'float16', to which floating point arrays with a higher precision are
+        converted before being written. This is lossy, and outputs are read back with the lower precision.
+    downcast_outputs : iterable of tuple, optional
+        Positions of the outputs to which `downcast` is applied, as tuples of indices into the (nested) tuple of
+        outputs, e.g. ``[(1,)]`` for the second output, or ``[()]`` for a single output. For HDF5Storage, positions
+        are the keys of dictionary or tuple outputs. Defaults to all outputs.
+
+    """
+    def __init__(
+        self,
+        chunks=None,
+        *,
+        compression=None,
+        compression_opts=None,
+        shuffle=False,
+        downcast=None,
+        downcast_outputs=None
+    ):
+        if compression not in (None, 'gzip', 'lzf'):
+            raise ValueError(f"Unsupported compression: '{compression}'")
+        if downcast is not None and not np.issubdtype(np.dtype(downcast), np.floating):
+            raise ValueError(f"Downcast type must be a floating point type, got '{downcast}'")
+        self.chunks = tuple(chunks) if isinstance(chunks, (list, tuple)) else chunks
+        self.compression = compression
+        self.compression_opts = compression_opts
+        self.shuffle = shuffle
+        self.downcast = None if downcast is None else np.dtype(downcast)
+        self.downcast_outputs = None if downcast_outputs is None else {
+            tuple(pos) if isinstance(pos, (list, tuple)) else (pos,) for pos in downcast_outputs
+        }
+
+    def identifiers(self):
+        """Return the json-serializable configuration of this policy, which is recorded with written outputs.
+
+        Returns
+        -------
+        :obj:`collections.OrderedDict`
+            Configuration of this policy.
+
+        """
+        return OrderedDict((
+            ('chunks', self.chunks),
+            ('compression', self.compression),
+            ('compression_opts', self.compression_opts),
+            ('shuffle', self.shuffle),
+            ('downcast', None if self.downcast is None else self.downcast.name),
+            ('downcast_outputs', None if self.downcast_outputs is None else sorted(self.downcast_outputs, key=str)),
+        ))
+
+    def prepare(self, array, path=()):
+        """Downcast `array` if it is selected by `path` and has a higher floating point precision than `downcast`.
+
+        Parameters
+        ----------
+        array : :obj:`numpy.ndarray`
+            Array to be written.
+        path : tuple
+            Position of the array in the written outputs.
+
+        Returns
+        -------
+        :obj:`numpy.ndarray`
+            Array to be written to the dataset.
+
+        """
+        if (
+            self.downcast is None
+            or not np.issubdtype(array.dtype, np.floating)
+            or array.dtype.itemsize <= self.downcast.itemsize
+            or (self.downcast_outputs is not None and tuple(path) not in self.downcast_outputs)
+        ):
+            return array
+        return array.astype(self.downcast)
+
+    def dataset_kwargs(self, array):
+        """Return the keyword arguments of :obj:`h5py.Group.create_dataset` to write `array` with this policy.
+
+        Parameters
+        ----------
+        array : :obj:`numpy.ndarray`
+            Array to be written.
+
+        Returns
+        -------
+        dict
+            Keyword arguments for chunks and filters, which are empty for scalar and empty arrays.
+
+        """
+        if not array.shape or array.size == 0:
+            return {}
+        kwargs = {}
+        chunks = self.chunks
+        if isinstance(chunks, tuple):
+            if len(chunks) == array.ndim:
+                chunks = tuple(max(1, min(chunk, size)) for chunk, size in zip(chunks, array.shape))
+            else:
+                chunks = True
+        if chunks:
+            kwargs['chunks'] = chunks
+        if self.compression is not None:
+            kwargs['compression'] = self.compression
+            if self.compression_opts is not None:
+                kwargs['compression_opts'] = self.compression_opts
+        if self.shuffle:
+            kwargs['shuffle'] = True
+        return kwargs
+
+    def create_dataset(self, group, name, array, path=()):
+        """Write `array` to a new dataset `name` in `group` using this policy.
+
+        Parameters
+        ----------
+        group : :obj:`h5py.Group`
+            Group in which to create the dataset.
+        name : str
+            Name of the dataset.
+        array : :obj:`numpy.ndarray`
+            Array to be written.
+        path : tuple
+            Position of the array in the written outputs.
+
+        Returns
+        -------
+        :obj:`h5py.Dataset`
+            The created dataset.
+
+        """
+        array = self.prepare(array, path)
+        return group.create_dataset(name, data=array, **self.dataset_kwargs(array))
+
+    def __repr__(self):
+        params = ', '.join(f'{key}={value!r}' for key, value in self.identifiers().items())
+        return f'{type(self).__name__}({params})'
@@ -0,0 +1,148 @@
+"""Hashed HDF5 storage which can be shared by multiple processes.
+
+"""
+import os
+import time
+from contextlib import contextmanager
+
+import h5py
+
+from .storage import HashedHDF5, NoDataSource
+from .index import MemoIndex, IndexEntry
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+@contextmanager
+def file_lock(path, exclusive=True):
+    """Hold an advisory lock on the file `path`, which is created if it does not exist.
+
+    Parameters
+    ----------
+    path : str
+        Path of the lock file.
+    exclusive : bool
+        If True, hold an exclusive lock for writing, otherwise a shared lock for reading.
+
+    """
+    if fcntl is None:
+        raise RuntimeError('File locks require the fcntl module, which is not available on this platform.')
+    with open(path, 'ab') as fd:
+        fcntl.flock(fd.fileno(), fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(fd.fileno(), fcntl.LOCK_UN)
+
+
+class SharedHashedHDF5(HashedHDF5):
+    """Hashed storage of Processor data in a HDF5 file, which is shared by concurrent processes.
+
+    The file is only opened for the duration of each read or write, while holding an advisory lock on a separate lock
+    file: a shared lock for reads, and an exclusive lock for writes. Since every read reopens the file, outputs which
+    were written by other processes are found as soon as their write is finished. HDF5's single-writer/multiple-reader
+    mode is not used, since it requires a single process to keep the file open for writing.
+
+    Parameters
+    ----------
+    path : str
+        Path of the HDF5 file, which is created on the first write.
+    group : str
+        Name of the group in which the hashed outputs are stored.
+    lock_path : str, optional
+        Path of the lock file. Defaults to `path` with the suffix '.lock'.
+    **kwargs :
+        Keyword arguments of :obj:`corelay.io.storage.HashedHDF5`, except `lazy`, since the file is closed after each
+        read. With an index, keys which are missing in the index are looked up in the file before a read misses, and
+        the index is reloaded before each write which may evict.
+
+    """
+    def __init__(self, path, group='hashed', lock_path=None, **kwargs):
+        if kwargs.get('lazy', False):
+            raise ValueError('Lazy reads are not supported, since the file is closed after each read.')
+        index = kwargs.pop('index', False)
+        budget = kwargs.pop('budget', None)
+        eviction = kwargs.pop('eviction', 'lru')
+        self._requested_shards = kwargs.pop('shards', None)
+        super().__init__(None, **kwargs)
+        self.path = os.fspath(path)
+        self.group = group
+        self.lock_path = self.path + '.lock' if lock_path is None else os.fspath(lock_path)
+        self.budget = budget
+        if index or budget is not None:
+            self.index = MemoIndex(eviction)
+            with self._open(write=False) as found:
+                if found:
+                    self.index.load(self.base)
+
+    @contextmanager
+    def _open(self, write):
+        """Open the file while holding the lock, and set the base group. Yields whether the base group exists. Nested
+        calls reuse the file if it is already open for reading, or for writing if `write`."""
+        if self.base is not None and (not write or self.base.file.mode == 'r+'):
+            yield True
+            return
+        with file_lock(self.lock_path, exclusive=write):
+            if not write and not os.path.exists(self.path):
+                yield False
+                return
+            with h5py.File(self.path, 'a' if write else 'r') as fd:
+                if write:
+                    self.base = fd.require_group(self.group)
+                elif self.group in fd:
+                    self.base = fd[self.group]
+                if self.base is not None:
+                    self.shards = self._layout(self._requested_shards)
+                try:
+                    yield self.base is not None
+                finally:
+                    self.base = None
+
+    def _refresh_index(self, hashval):
+        """Add `hashval` to the index if it was written by another process"""
+        path = self._locate(hashval)
+        if path is not None and 'data' in self.base[path]:
+            self.index.add(hashval, IndexEntry.from_group(self.base[path]))
+            return True
+        return False
+
+    def read_many(self, keys):
+        """Read the outputs of multiple keys while opening the file once, and return the stored ones by digest"""
+        with self._open(write=False):
+            return super().read_many(keys)
+
+    def contains_many(self, keys):
+        """Return the digests of the keys whose outputs are stored, while opening the file once"""
+        with self._open(write=False):
+            return super().contains_many(keys)
+
+    def _contains(self, hashval):
+        """Return True if the output with key `hashval` is stored in the file, while holding a shared lock"""
+        with self._open(write=False) as found:
+            return found and super()._contains(hashval)
+
+    def _read(self, hashval):
+        """Read output with key `hashval` from the file, while holding a shared lock"""
+        with self._open(write=False) as found:
+            if not found:
+                self._misses[hashval] = time.perf_counter()
+                raise NoDataSource()
+            return super()._read(hashval)
+
+    def _write(self, data_out, data_in, meta, hashval):
+        """Write output with key `hashval` to the file, while holding an exclusive lock. Outputs which were already
+        written by another process are not written again."""
+        with self._open(write=True):
+            path = self._locate(hashval)
+            if path is not None:
+                if 'data' in self.base[path]:
+                    self._misses.pop(hashval, None)
+                    return
+                # remove incomplete outputs, e.g. of a process which was killed while writing
+                del self.base[path]
+            if self.budget is not None:
+                self.index.load(self.base)
+            super()._write(data_out, data_in, meta, hashval)
@@ -0,0 +1,314 @@
+"""Storage of many small Processor outputs in a SQLite database.
+
+"""
+import os
+import json
+import time
+import shutil
+import uuid
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+from scipy import sparse as sp
+
+from ..base import Param
+from .storage import DataStorageBase, SPARSE_COMPONENTS
+from .keys import NoDataSource, StorageKey, json_default
+from .directory import save_leaf, load_leaf
+from .hashing import ext_hash, register_lineage, HashStrategy, ExactHash
+
+
+# maximum number of keys per query, below the limit of host parameters of older SQLite versions
+BATCH_SIZE = 500
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    data_key TEXT NOT NULL,
+    meta TEXT,
+    strategy TEXT,
+    created REAL,
+    structure TEXT NOT NULL,
+    payload BLOB
+)
+'''
+
+
+def _pack(data, buffers, offset):
+    """Return the structure of a tuple hierarchy of arrays and sparse matrices, whose leaves describe the dtype, shape
+    and position of their bytes, which are appended to `buffers` starting at `offset`. Returns the structure and the
+    offset after its bytes."""
+    if isinstance(data, tuple):
+        items = []
+        for elem in data:
+            item, offset = _pack(elem, buffers, offset)
+            items.append(item)
+        return {'type': 'tuple', 'items': items}, offset
+    if isinstance(data, np.ndarray) and not data.dtype.hasobject:
+        array = np.ascontiguousarray(data)
+        buffers.append(array.tobytes())
+        leaf = {'type': 'ndarray', 'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': offset}
+        return leaf, offset + array.nbytes
+    if sp.issparse(data) and data.format in SPARSE_COMPONENTS:
+        components = {}
+        for component in SPARSE_COMPONENTS[data.format]:
+            components[component], offset = _pack(getattr(data, component), buffers, offset)
+        return {'type': 'sparse', 'format': data.format, 'shape': list(data.shape), 'components': components}, offset
+    raise TypeError('Unsupported output type!')
+
+
+def _nbytes(data):
+    """Return the number of bytes of the arrays of a tuple hierarchy of arrays and sparse matrices, as packed by
+    :obj:`_pack`, without copying them."""
+    if isinstance(data, tuple):
+        return sum(_nbytes(elem) for elem in data)
+    if isinstance(data, np.ndarray) and not data.dtype.hasobject:
+        return data.nbytes
+    if sp.issparse(data) and data.format in SPARSE_COMPONENTS:
+        return sum(getattr(data, component).nbytes for component in SPARSE_COMPONENTS[data.format])
+    raise TypeError('Unsupported output type!')
+
+
+def _unpack(structure, payload):
+    """Return the tuple hierarchy of read-only arrays and sparse matrices of `structure`, whose arrays are views of
+    `payload`."""
+    if structure['type'] == 'tuple':
+        return tuple(_unpack(item, payload) for item in structure['items'])
+    if structure['type'] == 'ndarray':
+        dtype = np.dtype(structure['dtype'])
+        shape = tuple(structure['shape'])
+        count = int(np.prod(shape))
+        return np.frombuffer(payload, dtype=dtype, count=count, offset=structure['offset']).reshape(shape)
+    fmt = structure['format']
+    data, first, second = (_unpack(structure['components'][component], payload) for component in SPARSE_COMPONENTS[fmt])
+    shape = tuple(structure['shape'])
+    if fmt == 'coo':
+        return sp.coo_matrix((data, (first, second)), shape=shape, copy=False)
+    return getattr(sp, f'{fmt}_matrix')((data, first, second), shape=shape, copy=False)
+
+
+class SQLiteStorage(DataStorageBase):
+    """Content-addressed storage in a SQLite database, for many small outputs like cluster labels, for which a HDF5
+    group per output would mostly consist of meta data.
+
+    Each entry is a row with the hash of the data key, input and meta data as its key. The arrays of its (nested)
+    tuple of outputs, including the component arrays of CSR, CSC and COO sparse matrices, are concatenated into a
+    single blob, with their dtype, shape and offset in a JSON header. Outputs larger than `spill` bytes are instead
+    written as .npy files to the directory `<path>-spill`, and memory-mapped on read.
+
+    The database uses write-ahead logging, such that concurrent readers, also in other processes, do not block each
+    other or a writer, and writes are only visible once committed. Writes are committed one by one, or at once within
+    :obj:`SQLiteStorage.transaction`. Multiple keys are probed and read with a single query per batch by
+    :obj:`SQLiteStorage.contains_many` and :obj:`SQLiteStorage.read_many`.
+
+    Attributes
+    ----------
+    data_key : str
+        Key of the entry, which is combined with the input and meta data of reads and writes. As a memo store of
+        Processors, which read and write with their input and identifiers, it may be left empty.
+    strategy : :obj:`corelay.io.hashing.HashStrategy`
+        Strategy to hash inputs with.
+    provenance : bool
+        If True, outputs which are read or written are registered with their key as lineage, see
+        :obj:`corelay.io.hashing.register_lineage`.
+    spill : int
+        Number of bytes of the arrays of an output above which they are written to .npy files instead of the database.
+
+    """
+    data_key = Param(str, '')
+    strategy = Param(HashStrategy, ExactHash())
+    provenance = Param(bool, False)
+    spill = Param(int, 1 << 20)
+
+    def __init__(self, path, mode='a', timeout=30., **kwargs):
+        """
+        Parameters
+        ----------
+        path: str
+            Path of the database file.
+        mode: str
+            Read or Append mode ['r', 'a']. The database is created in append mode.
+        timeout: float
+            Number of seconds to wait for the lock of another writer.
+
+        """
+        super().__init__(**kwargs)
+        if mode not in ['r', 'a']:
+            raise ValueError("Mode should be set to 'r' or 'a'.")
+        self.path = os.fspath(path)
+        self.mode = mode
+        self.spill_root = self.path + '-spill'
+        if mode == 'r':
+            uri = f'file:{self.path}?mode=ro'
+        else:
+            uri = f'file:{self.path}?mode=rwc'
+        # autocommit mode, with explicit transactions, and shared with the writer threads of WriteBehindStorage
+        self.io = sqlite3.connect(uri, uri=True, timeout=timeout, isolation_level=None, check_same_thread=False)
+        self._lock = threading.RLock()
+        self._depth = [0]
+        if mode == 'a':
+            self.io.execute('PRAGMA journal_mode=WAL')
+            self.io.execute('PRAGMA synchronous=NORMAL')
+            self.io.execute(SCHEMA)
+
+    @contextmanager
+    def transaction(self):
+        """Context in which all writes are committed at once when it exits, or rolled back if it raises. Nested
+        contexts join the outermost one. Outputs written within the context are not visible to other connections
+        before it exits.
+
+        """
+        with self._lock:
+            if self._depth[0] == 0:
+                self.io.execute('BEGIN IMMEDIATE')
+            self._depth[0] += 1
+            try:
+                yield self
+            except BaseException:
+                self._depth[0] -= 1
+                if self._depth[0] == 0:
+                    self.io.execute('ROLLBACK')
+                raise
+            self._depth[0] -= 1
+            if self._depth[0] == 0:
+                self.io.execute('COMMIT')
+
+    def key(self, data_in=None, meta=None):
+        """Return the key of the entry of `data_in` and `meta` at the current data key, which is the hash of all three.
+
+        Returns
+        -------
+        :obj:`corelay.io.keys.StorageKey`
+            Key to pass to :obj:`SQLiteStorage.read_key`, :obj:`SQLiteStorage.write_key` and
+            :obj:`SQLiteStorage.contains_key`.
+
+        """
+        return StorageKey(ext_hash((self.data_key, data_in, meta), self.strategy), data_in, meta)
+
+    def read(self, data_in=None, meta=None):
+        """
+        Returns
+        -------
+        Tuple hierarchy of read-only arrays and sparse matrices of the entry.
+
+        """
+        return self.read_key(self.key(data_in, meta))
+
+    def write(self, data_out, data_in=None, meta=None):
+        """
+        Parameters
+        ----------
+        data_out: np.ndarray, scipy.sparse.spmatrix, tuple
+            Tuple hierarchy of arrays and sparse matrices being stored.
+
+        """
+        self.write_key(data_out, self.key(data_in, meta))
+
+    def contains_key(self, key):
+        """Return True if the entry of :obj:`corelay.io.keys.StorageKey` `key` exists."""
+        with self._lock:
+            row = self.io.execute('SELECT 1 FROM entries WHERE key = ?', (key.digest,)).fetchone()
+        return row is not None
+
+    def read_key(self, key):
+        """Read the entry of :obj:`corelay.io.keys.StorageKey` `key`."""
+        with self._lock:
+            row = self.io.execute('SELECT structure, payload FROM entries WHERE key = ?', (key.digest,)).fetchone()
+        if row is None:
+            raise NoDataSource(f"Key: '{key}' does not exist.")
+        return self._load(key.digest, *row)
+
+    def _select(self, columns, keys):
+        """Iterate over the rows with `columns` of the entries of `keys`, querying them in batches."""
+        digests = sorted({key.digest for key in keys})
+        for start in range(0, len(digests), BATCH_SIZE):
+            batch = digests[start:start + BATCH_SIZE]
+            query = f'SELECT {columns} FROM entries WHERE key IN ({", ".join("?" * len(batch))})'
+            with self._lock:
+                rows = self.io.execute(query, batch).fetchall()
+            yield from rows
+
+    def contains_many(self, keys):
+        """Return the digests of the :obj:`corelay.io.keys.StorageKey` `keys` whose entries exist."""
+        return {digest for digest, in self._select('key', keys)}
+
+    def read_many(self, keys):
+        """Read the entries of multiple :obj:`corelay.io.keys.StorageKey` `keys`, and return the existing ones by
+        their digest."""
+        return {digest: self._load(digest, *row) for digest, *row in self._select('key, structure, payload', keys)}
+
+    def _load(self, digest, structure, payload):
+        """Return the output of an entry from its row."""
+        structure = json.loads(structure)
+        if structure['type'] == 'spilled':
+            data_out = load_leaf(structure['structure'], os.path.join(self.spill_root, structure['directory']))
+        else:
+            data_out = _unpack(structure, payload)
+        if self.provenance:
+            register_lineage(data_out, digest)
+        return data_out
+
+    def write_key(self, data_out, key):
+        """Write the entry of :obj:`corelay.io.keys.StorageKey` `key`, unless it exists. Large outputs are spilled to
+        .npy files, without being packed into a blob."""
+        if self.mode == 'r':
+            raise OSError('Storage is opened read-only.')
+        directory = None
+        if _nbytes(data_out) <= self.spill:
+            buffers = []
+            structure, _ = _pack(data_out, buffers, 0)
+            payload = b''.join(buffers)
+        elif self.contains_key(key):
+            if self.provenance:
+                register_lineage(data_out, key.digest)
+            return
+        else:
+            directory = f'{key.digest[:2]}/{key.digest}-{uuid.uuid4().hex}'
+            os.makedirs(os.path.join(self.spill_root, directory))
+            structure = {
+                'type': 'spilled',
+                'directory': directory,
+                'structure': save_leaf(data_out, os.path.join(self.spill_root, directory)),
+            }
+            payload = None
+        with self._lock:
+            cursor = self.io.execute(
+                'INSERT OR IGNORE INTO entries (key, data_key, meta, strategy, created, structure, payload) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (
+                    key.digest,
+                    self.data_key,
+                    json.dumps(key.meta, default=json_default),
+                    json.dumps(self.strategy.identifiers()),
+                    time.time(),
+                    json.dumps(structure),
+                    payload,
+                )
+            )
+        if directory is not None and cursor.rowcount == 0:
+            # the entry was written concurrently, so its spilled files are not referenced
+            shutil.rmtree(os.path.join(self.spill_root, directory))
+        if self.provenance:
+            register_lineage(data_out, key.digest)
+
+    def exists(self):
+        """Returns True if the entry of the current data key without input and meta data exists.
+
+        """
+        return self.contains_key(self.key())
+
+    def keys(self):
+        """Return the hashes of all entries.
+
+        """
+        with self._lock:
+            return [row[0] for row in self.io.execute('SELECT key FROM entries ORDER BY key')]
+
+    def close(self):
+        """Close the database connection.
+
+        """
+        with self._lock:
+            self.io.close()
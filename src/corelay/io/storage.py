@@ -1,8 +1,9 @@
 """'io module contains classes to load and dump different files like hdf5, etc.
 
 """
-
+import os
 import copy
+import time
 import pickle
 import json
 from collections import OrderedDict
@@ -10,10 +11,54 @@ from abc import abstractmethod
 
 import numpy as np
 import h5py
+from scipy import sparse as sp
 
 from ..base import Param
 from ..plugboard import Plugboard
-from .hashing import ext_hash
+from .hashing import ext_hash, register_lineage, ExactHash
+from .keys import NoDataSource, NoDataTarget, StorageKey, json_default
+from .lazy import lazy_dataset, lazy_leaf, DatasetProxy, GroupView
+from .policy import WritePolicy
+from .index import MemoIndex, IndexEntry, group_size, shard_path, ACCESSED_ATTR, SHARD_ATTR
+
+
+# name of the attribute marking HDF5 groups which store sparse matrices
+SPARSE_FORMAT_ATTR = 'sparse_format'
+# datasets in HDF5 groups which store sparse matrices of the supported formats
+SPARSE_COMPONENTS = {
+    'csr': ('data', 'indices', 'indptr'),
+    'csc': ('data', 'indices', 'indptr'),
+    'coo': ('data', 'row', 'col'),
+}
+# suffix of the sidecar index files of pickle storages
+PICKLE_INDEX_SUFFIX = '.idx'
+# alignment in bytes of the out-of-band buffers of pickle storages, relative to the start of the file
+PICKLE_BUFFER_ALIGNMENT = 64
+# attribute of appendable HDF5 datasets holding the number of appended rows, which may be less than their capacity
+APPEND_LENGTH_ATTR = 'append_length'
+# target size in bytes of the chunks of appendable HDF5 datasets
+APPEND_CHUNK_BYTES = 1 << 20
+
+
+def _write_sparse(matrix, group, policy, path=()):
+    """Write a CSR, CSC or COO sparse matrix into a HDF5 group, storing its component arrays as datasets using the
+    :obj:`WritePolicy` `policy`, and its format and shape as attributes."""
+    for name in SPARSE_COMPONENTS[matrix.format]:
+        policy.create_dataset(group, name, getattr(matrix, name), path)
+    group.attrs[SPARSE_FORMAT_ATTR] = matrix.format
+    group.attrs['shape'] = matrix.shape
+
+
+def _read_sparse(group):
+    """Read a sparse matrix from a HDF5 group written by :obj:`_write_sparse`."""
+    fmt = group.attrs[SPARSE_FORMAT_ATTR]
+    if isinstance(fmt, bytes):
+        fmt = fmt.decode()
+    shape = tuple(int(size) for size in group.attrs['shape'])
+    data, first, second = (group[name][()] for name in SPARSE_COMPONENTS[fmt])
+    if fmt == 'coo':
+        return sp.coo_matrix((data, (first, second)), shape=shape)
+    return getattr(sp, f'{fmt}_matrix')((data, first, second), shape=shape)
 
 
 class StorableMeta(type):
@@ -27,52 +72,232 @@ class Storable(metaclass=StorableMeta):
     """Abstract class to check for write/ read attributes via isinstance"""
 
 
-class NoDataSource(Exception):
-    """Raise when no data source available."""
-    # Following is not useless, since message becomes optional
-    # pylint: disable=useless-super-delegation
-    def __init__(self, message='No Data Source available.'):
-        super().__init__(message)
+class HashedHDF5:
+    """Hashed storage of Processor data in HDF5 files
+
+    Outputs may be numpy arrays, CSR, CSC or COO sparse matrices, or (nested) tuples of these. Sparse matrices are
+    stored as groups of their component arrays, and are read back in their original format.
+
+    Parameters
+    ----------
+    h5group : :obj:`h5py.Group`
+        Group in which the hashed outputs are stored.
+    provenance : bool
+        If True, outputs which are read or written are registered with their key as lineage, such that subsequent
+        Processors within the same pipeline run hash them by this key instead of by their content, see
+        :obj:`corelay.io.hashing.register_lineage`. Only the original input of a pipeline is then hashed by its content.
+        Keys computed in this mode differ from the ones computed by content.
+    strategy : :obj:`corelay.io.hashing.HashStrategy`, optional
+        Strategy to hash arrays with. Defaults to :obj:`corelay.io.hashing.ExactHash`. Its identifiers are stored with
+        each output. Processors may use a different strategy on the same group using :obj:`HashedHDF5.with_strategy`.
+    lazy : bool
+        If True, arrays are not loaded on read, but returned as read-only :obj:`numpy.memmap` if they are stored
+        contiguously and uncompressed in a file on disk, and as :obj:`corelay.io.lazy.DatasetProxy` otherwise. Only
+        the parts which are accessed are then loaded. The file must stay open while the outputs are in use.
+    policy : :obj:`corelay.io.policy.WritePolicy`, optional
+        Chunking, filters and precision of written arrays. Defaults to contiguous, uncompressed datasets at the
+        original precision. Its configuration is stored with each output. Processors may use a different policy on
+        the same group using :obj:`HashedHDF5.with_policy`.
+    budget : int, optional
+        Maximum number of bytes of all stored outputs. When a write exceeds the budget, other outputs are evicted,
+        i.e. their groups are deleted, according to `eviction`. Implies `index`. Note that HDF5 only reuses the space
+        of deleted groups if the file tracks its free space persistently, e.g. when created with
+        ``h5py.File(path, 'w', fs_strategy='fsm', fs_persist=True)``, otherwise the file needs to be repacked.
+    eviction : str
+        Eviction policy if `budget` is set, either 'lru' to evict the least recently used outputs first, or 'cost' to
+        evict the outputs with the lowest compute cost per byte first, see :obj:`corelay.io.index.MemoIndex`.
+    index : bool
+        If True, load an in-memory index of all stored outputs once, with their size, creation and access times and
+        compute cost, such that reads of missing keys do not access the file. The index is shared with copies from
+        :obj:`HashedHDF5.with_strategy` and :obj:`HashedHDF5.with_policy`, but not with other instances. The compute
+        cost of an output is the time between the read which missed it and its write.
+    shards : int, optional
+        Number of shard levels of the layout of new outputs, e.g. 2 to store them as `ab/cd/<hash>` in groups named by
+        the first characters of their hash, which keeps HDF5 link lookups fast for many outputs. The depth is recorded
+        in the attribute 'shard_depth' of `h5group`, which takes precedence over this argument once set. Without the
+        attribute, outputs are stored directly in `h5group`. Outputs are read from both layouts, such that existing
+        groups may be migrated, see :obj:`corelay.io.maintenance.migrate`.
 
+    """
+    def __init__(
+        self, h5group, provenance=False, strategy=None, lazy=False, policy=None, *, budget=None, eviction='lru',
+        index=False, shards=None
+    ):
+        self.base = h5group
+        self.provenance = provenance
+        self.strategy = ExactHash() if strategy is None else strategy
+        self.lazy = lazy
+        self.policy = WritePolicy() if policy is None else policy
+        self.budget = budget
+        self.index = None
+        self.shards = 0
+        if self.base is not None:
+            self.shards = self._layout(shards)
+        if index or budget is not None:
+            self.index = MemoIndex(eviction)
+            self.index.load(self.base)
+        self._misses = {}
+
+    def with_strategy(self, strategy):
+        """Return a copy of this storage on the same group, which uses another hashing strategy.
 
-class NoDataTarget(Exception):
-    """Raise when no target source available."""
-    def __init__(self):
-        super().__init__('No Data Target available.')
+        Parameters
+        ----------
+        strategy : :obj:`corelay.io.hashing.HashStrategy`
+            Strategy to hash arrays with.
 
+        Returns
+        -------
+        :obj:`HashedHDF5`
+            New storage using `strategy`.
 
-class HashedHDF5:
-    """Hashed storage of Processor data in HDF5 files"""
-    def __init__(self, h5group):
-        self.base = h5group
+        """
+        result = copy.copy(self)
+        result.strategy = strategy
+        return result
+
+    def with_policy(self, policy):
+        """Return a copy of this storage on the same group, which uses another write policy.
+
+        Parameters
+        ----------
+        policy : :obj:`corelay.io.policy.WritePolicy`
+            Policy to write arrays with.
+
+        Returns
+        -------
+        :obj:`HashedHDF5`
+            New storage using `policy`.
+
+        """
+        result = copy.copy(self)
+        result.policy = policy
+        return result
+
+    def key(self, data_in, meta):
+        """Return the key of the output of `data_in` and `meta`, which is their hash.
+
+        Returns
+        -------
+        :obj:`StorageKey`
+            Key to pass to :obj:`HashedHDF5.read_key`, :obj:`HashedHDF5.write_key` and
+            :obj:`HashedHDF5.contains_key`.
+
+        """
+        return StorageKey(ext_hash((data_in, meta), self.strategy), data_in, meta)
+
+    def read_key(self, key):
+        """Read output from the hashed h5 group with the digest of :obj:`StorageKey` `key`"""
+        return self._read(key.digest)
+
+    def write_key(self, data_out, key):
+        """Write output to the hashed h5 group with the digest of :obj:`StorageKey` `key`, which also stores its meta
+        data and input hashes"""
+        self._write(data_out, key.data_in, key.meta, key.digest)
+
+    def contains_key(self, key):
+        """Return True if the output of :obj:`StorageKey` `key` is stored"""
+        return self._contains(key.digest)
+
+    def read_many(self, keys):
+        """Read the outputs of multiple :obj:`StorageKey` `keys`, and return the stored ones by their digest"""
+        result = {}
+        for key in keys:
+            if key.digest not in result:
+                try:
+                    result[key.digest] = self._read(key.digest)
+                except NoDataSource:
+                    pass
+        return result
+
+    def contains_many(self, keys):
+        """Return the digests of the :obj:`StorageKey` `keys` whose outputs are stored"""
+        return {key.digest for key in keys if self._contains(key.digest)}
 
     def read(self, data_in, meta):
         """Read output from a hashed h5 group, with hash of (data_in, meta)"""
+        return self.read_key(self.key(data_in, meta))
+
+    def _layout(self, shards):
+        """Return the shard depth of the base group, after recording `shards` if it has none and is writable"""
+        if SHARD_ATTR in self.base.attrs:
+            return int(self.base.attrs[SHARD_ATTR])
+        if shards and self.base.file.mode == 'r+':
+            self.base.attrs[SHARD_ATTR] = shards
+            return shards
+        return 0
+
+    def _locate(self, hashval):
+        """Return the path of the group with key `hashval` relative to the base group, in the sharded or the flat
+        layout, or None if it does not exist"""
+        path = shard_path(hashval, self.shards)
+        if path in self.base:
+            return path
+        if self.shards and hashval in self.base:
+            return hashval
+        return None
+
+    def _contains(self, hashval):
+        """Return True if the group with key `hashval` exists with data"""
+        if self.index is not None:
+            return hashval in self.index or self._refresh_index(hashval)
+        path = self._locate(hashval)
+        return path is not None and 'data' in self.base[path]
+
+    def _refresh_index(self, hashval):
+        """Called when `hashval` is missing in the index. Returns True if it was added to the index since, which may
+        happen when the group is written concurrently. The index of a single instance is authoritative."""
+        # pylint: disable=unused-argument
+        return False
+
+    def _read(self, hashval):
+        """Read output from the h5 group with key `hashval`"""
         def _iterread(base):
-            """Iteratively read from HDF5 Group into tuple hierachy of ndarrays"""
+            """Iteratively read from HDF5 Group into tuple hierachy of ndarrays and sparse matrices"""
             if isinstance(base, h5py.Group):
+                if SPARSE_FORMAT_ATTR in base.attrs:
+                    return _read_sparse(base)
                 return tuple(_iterread(base[key]) for key in sorted(base))
             if isinstance(base, h5py.Dataset):
-                return base[()]
+                return lazy_dataset(base) if self.lazy else base[()]
             raise TypeError('Unsupported output type!')
-        hashval = ext_hash((data_in, meta))
+        if self.index is not None and hashval not in self.index and not self._refresh_index(hashval):
+            self._misses[hashval] = time.perf_counter()
+            raise NoDataSource()
         try:
-            group = self.base[hashval]
+            group = self.base[self._locate(hashval) or hashval]
+            data = group['data']
         except KeyError as error:
+            if self.index is not None:
+                self.index.remove(hashval)
+            self._misses[hashval] = time.perf_counter()
             raise NoDataSource() from error
 
-        return _iterread(group['data'])
+        data_out = _iterread(data)
+        if self.index is not None:
+            entry = self.index.touch(hashval)
+            if self.base.file.mode == 'r+':
+                group.attrs[ACCESSED_ATTR] = entry.accessed
+        if self.provenance:
+            register_lineage(data_out, hashval)
+        return data_out
 
     def write(self, data_out, data_in, meta):
         """Write output to a hashed h5 group, with hash of (data_in, meta)"""
-        def _iterwrite(data, group, elem):
-            """Iteratively write to a HDF5 Group from a tuple hierachy of ndarrays"""
+        self.write_key(data_out, self.key(data_in, meta))
+
+    def _write(self, data_out, data_in, meta, hashval):
+        """Write output to the h5 group with key `hashval`"""
+        def _iterwrite(data, group, elem, path=()):
+            """Iteratively write to a HDF5 Group from a tuple hierachy of ndarrays and sparse matrices"""
             if isinstance(data, tuple):
                 g_new = group.require_group(elem)
-                for n, array in enumerate(data_out):
-                    _iterwrite(array, g_new, f'{n:03d}')
+                for n, array in enumerate(data):
+                    _iterwrite(array, g_new, f'{n:03d}', path + (n,))
             elif isinstance(data, np.ndarray):
-                group[elem] = data
+                self.policy.create_dataset(group, elem, data, path)
+            elif sp.issparse(data) and data.format in SPARSE_COMPONENTS:
+                _write_sparse(data, group.require_group(elem), self.policy, path)
             else:
                 raise TypeError('Unsupported output type!')
 
@@ -80,15 +305,58 @@ class HashedHDF5:
             """Iteratively hash from tuple hierachy into tuple hierachy of hashes"""
             if isinstance(base, tuple):
                 return tuple(_iterhash(obj) for obj in base)
-            return ext_hash(base)
+            return ext_hash(base, self.strategy)
 
-        hashval = ext_hash((data_in, meta))
-        group = self.base.require_group(hashval)
+        group = self.base.require_group(self._locate(hashval) or shard_path(hashval, self.shards))
         _iterwrite(data_out, group, 'data')
-        group['meta'] = json.dumps(meta)
+        group['meta'] = json.dumps(meta, default=json_default)
+        group['strategy'] = json.dumps(self.strategy.identifiers())
+        group['policy'] = json.dumps(self.policy.identifiers())
         group['input'] = json.dumps(_iterhash(data_in))
         group['output'] = json.dumps(_iterhash(data_out))
 
+        missed = self._misses.pop(hashval, None)
+        now = time.time()
+        entry = IndexEntry(
+            size=group_size(group),
+            created=now,
+            accessed=now,
+            cost=0. if missed is None else time.perf_counter() - missed,
+        )
+        entry.to_group(group)
+        if self.index is not None:
+            self.index.add(hashval, entry)
+            if self.budget is not None:
+                self.evict(self.budget, exclude=(hashval,))
+        if self.provenance:
+            register_lineage(data_out, hashval)
+
+    def evict(self, budget, exclude=()):
+        """Delete stored outputs according to the eviction policy until their total size does not exceed `budget`.
+
+        Parameters
+        ----------
+        budget : int
+            Maximum number of bytes of all stored outputs.
+        exclude : iterable of str
+            Keys of outputs which may not be evicted.
+
+        Returns
+        -------
+        list of str
+            Keys of the evicted outputs.
+
+        """
+        if self.index is None:
+            raise TypeError('Eviction requires an index!')
+        keys = self.index.victims(budget, exclude)
+        for key in keys:
+            self.index.remove(key)
+            path = self._locate(key)
+            if path is not None:
+                del self.base[path]
+        return keys
+
 
 class DataStorageBase(Plugboard):
     """Implements a key, value storage object.
@@ -132,7 +400,7 @@ class DataStorageBase(Plugboard):
         return self
 
     def __exit__(self, typ, value, traceback):
-        self.io.close()
+        self.close()
 
     def __contains__(self, key):
         return self.at(data_key=key).exists()
@@ -179,15 +447,37 @@ class NoStorage(DataStorageBase):
     def keys(self):
         raise NoDataSource()
 
+    def close(self):
+        """Nothing to close."""
+
 
 class PickleStorage(DataStorageBase):
     """Experimental pickle storage that uses pickle to store data.
 
+    Records are appended to the pickle file as they are written. The offset and length of each record are kept in a
+    sidecar index file `<path>.idx` with one JSON line per record, such that single records are read without
+    unpickling the others. Opening a file only loads its index. Records which are missing in the index, e.g. of files
+    written by earlier versions, are found by scanning the file from the end of the last indexed record when opened,
+    and are added to the index file unless opened read-only.
+
+    With `out_of_band`, records are pickled with protocol 5, and the buffers of contiguous arrays are written raw,
+    aligned to 64 bytes, directly after a small header record. Reads then return read-only arrays which are views of
+    a memory map of the file, without copying. Such records are read regardless of `out_of_band`, but not by versions
+    without out-of-band support.
+
+    Attributes
+    ----------
+    data_key : str
+        Key under which data is read and written.
+    out_of_band : bool
+        If True, write arrays as out-of-band buffers, which requires Python 3.8 or later.
+
     """
 
     data_key = Param(str, 'data', mandatory=True)
+    out_of_band = Param(bool, False)
 
-    def __init__(self, path, mode='r', **kwargs):
+    def __init__(self, path, mode='r', cache_size=0, **kwargs):
         """
         Parameters
         ----------
@@ -195,36 +485,129 @@ class PickleStorage(DataStorageBase):
             Path to the pickled file.
         mode: str
             Write, Read or Append mode ['w', 'r', 'a'].
+        cache_size: int
+            Maximum number of records which are kept in memory after being read or written, of which the least
+            recently used ones are dropped first. Records are not cached by default.
 
         """
         super().__init__(**kwargs)
         if mode not in ['w', 'r', 'a']:
             raise ValueError("Mode should be set to 'w', 'r' or 'a'.")
-        self.io = open(path, mode + 'b')  # pylint: disable=consider-using-with
-        self.data = {}
+        self.path = os.fspath(path)
+        self.index_path = self.path + PICKLE_INDEX_SUFFIX
+        self.mode = mode
+        self.cache_size = cache_size
+        self.io = open(self.path, {'w': 'w+b', 'r': 'rb', 'a': 'a+b'}[mode])  # pylint: disable=consider-using-with
+        if mode == 'w' and os.path.exists(self.index_path):
+            os.remove(self.index_path)
+        self.data = OrderedDict()
+        self.index = {}
+        self._load_index()
+        self._index_io = None
+        if mode != 'r':
+            self._index_io = open(self.index_path, 'a', encoding='utf-8')  # pylint: disable=consider-using-with
+
+    def _load_index(self):
+        """Load the sidecar index, and complete it with the records which were appended after its last entry."""
+        size = os.fstat(self.io.fileno()).st_size
+        complete = True
+        if os.path.exists(self.index_path):
+            with open(self.index_path, 'r', encoding='utf-8') as fd:
+                for line in fd:
+                    try:
+                        key, offset, length = json.loads(line)
+                    except ValueError:
+                        # partially written line of an interrupted write
+                        complete = False
+                        continue
+                    if offset + length > size:
+                        # the record itself was not completely written
+                        complete = False
+                        continue
+                    self.index[key] = (offset, length)
+        end = max((offset + length for offset, length in self.index.values()), default=0)
+        if end < size:
+            complete = False
+            self.io.seek(end)
+            try:
+                while True:
+                    offset = self.io.tell()
+                    record = pickle.load(self.io)
+                    record_end = self.io.tell()
+                    if 'buffers' in record:
+                        record_end = self._segments(record_end, record['buffers'])[-1]
+                        if record_end > size:
+                            break
+                        self.io.seek(record_end)
+                    self.index[record['key']] = (offset, record_end - offset)
+            except EOFError:
+                pass
+        if not complete and self.mode != 'r':
+            self._rewrite_index()
+
+    def _rewrite_index(self):
+        """Atomically replace the sidecar index by the current one."""
+        tmp = f'{self.index_path}.tmp'
+        with open(tmp, 'w', encoding='utf-8') as fd:
+            for key, (offset, length) in sorted(self.index.items(), key=lambda item: item[1]):
+                fd.write(json.dumps([key, offset, length]) + '\n')
+        os.replace(tmp, self.index_path)
 
-    def _load_data(self):
-        try:
-            while True:
-                dc = pickle.load(self.io)
-                self.data.update({dc['key']: dc['data']})
-        except EOFError:
-            pass
+    @staticmethod
+    def _segments(start, lengths):
+        """Return the aligned offsets of buffers with `lengths` which follow a header ending at `start`, followed by
+        the end of the last buffer."""
+        offsets = []
+        for length in lengths:
+            start += -start % PICKLE_BUFFER_ALIGNMENT
+            offsets.append(start)
+            start += length
+        return offsets + [start]
+
+    def _load_buffers(self, start, lengths):
+        """Return read-only views of a memory map of the out-of-band buffers following a header ending at `start`."""
+        offsets = self._segments(start, lengths)
+        begin, end = (offsets[0], offsets[-1]) if lengths else (start, start)
+        if end == begin:
+            return [np.empty(0, dtype=np.uint8) for _ in lengths]
+        mapped = np.memmap(self.path, dtype=np.uint8, mode='r', offset=begin, shape=(end - begin,))
+        return [mapped[offset - begin:offset - begin + length] for offset, length in zip(offsets, lengths)]
+
+    def _cache(self, key, data):
+        """Keep `data` in the cache as the most recently used record, dropping the least recently used ones."""
+        if self.cache_size <= 0:
+            return
+        self.data.pop(key, None)
+        self.data[key] = data
+        while len(self.data) > self.cache_size:
+            self.data.popitem(last=False)
 
     def read(self, data_in=None, meta=None):
-        """Return data for a given key. Need to load the complete pickle at first read. After the data is cached.
+        """Return data for a given key, unpickling only its record.
 
         Returns
         -------
         data for a given key
 
         """
+        if self.data_key in self.data:
+            self.data.move_to_end(self.data_key)
+            return self.data[self.data_key]
         if not self.exists():
             raise NoDataSource(f"Key: '{self.data_key}' does not exist.")
-        return self.data[self.data_key]
+        offset, _ = self.index[self.data_key]
+        self.io.seek(offset)
+        record = pickle.load(self.io)
+        if 'buffers' in record:
+            buffers = self._load_buffers(self.io.tell(), record['buffers'])
+            data = pickle.loads(record['payload'], buffers=buffers)
+        else:
+            data = record['data']
+        self._cache(self.data_key, data)
+        return data
 
     def write(self, data_out, data_in=None, meta=None):
-        """Write and pickle the data as: {"data": data, "key": key}
+        """Write and pickle the data as: {"data": data, "key": key}, and append its offset and length to the index.
 
         Parameters
         ----------
@@ -232,16 +615,40 @@ class PickleStorage(DataStorageBase):
             Data being stored.
 
         """
-        self.data[self.data_key] = data_out
-        pickle.dump({"data": data_out, "key": self.data_key}, self.io)
+        buffers = []
+        if self.out_of_band:
+            if pickle.HIGHEST_PROTOCOL < 5:
+                raise ValueError('Out-of-band buffers require pickle protocol 5, i.e. Python 3.8 or later.')
+            pickle_buffers = []
+            inner = pickle.dumps(data_out, protocol=5, buffer_callback=pickle_buffers.append)
+            buffers = [buffer.raw() for buffer in pickle_buffers]
+            payload = pickle.dumps({
+                "key": self.data_key,
+                "payload": inner,
+                "buffers": [buffer.nbytes for buffer in buffers],
+            })
+        else:
+            payload = pickle.dumps({"data": data_out, "key": self.data_key})
+        self.io.seek(0, os.SEEK_END)
+        offset = self.io.tell()
+        self.io.write(payload)
+        end = offset + len(payload)
+        for buffer in buffers:
+            self.io.write(bytes(-end % PICKLE_BUFFER_ALIGNMENT))
+            self.io.write(buffer)
+            end += -end % PICKLE_BUFFER_ALIGNMENT + buffer.nbytes
+        self.io.flush()
+        self._index_io.write(json.dumps([self.data_key, offset, end - offset]) + '\n')
+        self._index_io.flush()
+        self.index[self.data_key] = (offset, end - offset)
+        self.data.pop(self.data_key, None)
+        self._cache(self.data_key, data_out)
 
     def keys(self):
-        """Return keys from self.data. Need to load the complete pickle at first read.
+        """Return the keys of all records from the index.
 
         """
-        if not self.data:
-            self._load_data()
-        return self.data.keys()
+        return self.index.keys()
 
     def exists(self):
         """Return True if key exists in self.keys().
@@ -249,12 +656,44 @@ class PickleStorage(DataStorageBase):
         """
         return self.data_key in self.keys()
 
+    def close(self):
+        """Close the pickle and index files.
+
+        """
+        if self._index_io is not None:
+            self._index_io.close()
+            self._index_io = None
+        self.io.close()
+
 
 class HDF5Storage(DataStorageBase):
     """HDF5 storage that stores data under different keys.
 
+    Attributes
+    ----------
+    data_key : str
+        Key under which data is read and written.
+    policy : :obj:`corelay.io.policy.WritePolicy`
+        Chunking, filters and precision of written arrays, which is recorded in the attribute 'write_policy' of each
+        dataset. Different policies may be used per Processor using e.g. ``storage.at(policy=...)``. Defaults to
+        contiguous, uncompressed datasets at the original precision.
+    lazy : bool
+        If True, reads do not load data, but return groups as :obj:`corelay.io.lazy.GroupView` and datasets as
+        :obj:`corelay.io.lazy.DatasetProxy`, such that e.g. ``storage.at(lazy=True)['analysis']['embedding'][idx]``
+        only reads the selected rows. The storage must stay open while the views are in use.
+    batch : int
+        Number of rows which are buffered by :obj:`HDF5Storage.append` before they are written at once.
+    growth : float
+        Factor by which the capacity of appendable datasets grows when it is exceeded, at least by the written rows.
+        A factor of 1 resizes them exactly to the written rows. Datasets are trimmed to their rows when the storage is
+        flushed or closed.
+
     """
     data_key = Param(str, 'data', mandatory=True)
+    policy = Param(WritePolicy, WritePolicy())
+    lazy = Param(bool, False)
+    batch = Param(int, 1024)
+    growth = Param(float, 2.)
 
     def __init__(self, path, mode='r', **kwargs):
         """
@@ -268,16 +707,27 @@ class HDF5Storage(DataStorageBase):
         """
         super().__init__(**kwargs)
         self.io = h5py.File(path, mode=mode)
+        # rows buffered by append, and keys of the appended datasets which are not yet trimmed, shared with copies
+        self._appends = {}
+        self._untrimmed = set()
 
     def read(self, data_in=None, meta=None):
         """
         Returns
         -------
-        data for a given key
+        data for a given key, or a lazy view of it if `lazy` is set
 
         """
         if not self.exists():
             raise NoDataSource(f"Key: '{self.data_key}' does not exist.")
+        if self.data_key in self._untrimmed or self.data_key in self._appends:
+            self._flush_rows(self.data_key, trim=True)
+        if self.lazy:
+            value = self.io[self.data_key]
+            if APPEND_LENGTH_ATTR in value.attrs and value.attrs[APPEND_LENGTH_ATTR] < len(value):
+                # not trimmed, e.g. while being appended to by another process
+                return DatasetProxy(value, length=int(value.attrs[APPEND_LENGTH_ATTR]))
+            return GroupView(value) if isinstance(value, h5py.Group) else lazy_leaf(value)
         _, data = self._unpack('/', self.io[self.data_key])
         return data
 
@@ -291,21 +741,107 @@ class HDF5Storage(DataStorageBase):
         """
         if isinstance(data_out, dict):
             for key, value in data_out.items():
-                shape, dtype = self._get_shape_dtype(value)
-                self.io.require_dataset(data=value, shape=shape, dtype=dtype, name=f'{self.data_key}/{key}')
+                self._require_dataset(f'{self.data_key}/{key}', value, (key,))
         elif isinstance(data_out, tuple):
             for key, value in enumerate(data_out):
-                shape, dtype = self._get_shape_dtype(value)
-                self.io.require_dataset(data=value, shape=shape, dtype=dtype, name=f'{self.data_key}/{key}')
+                self._require_dataset(f'{self.data_key}/{key}', value, (key,))
         else:
-            shape, dtype = self._get_shape_dtype(data_out)
-            self.io.require_dataset(data=data_out, shape=shape, dtype=dtype, name=self.data_key)
+            self._require_dataset(self.data_key, data_out)
+
+    def _require_dataset(self, name, value, path=()):
+        """Write `value` to dataset `name`, applying the write policy to arrays, and recording it with the dataset."""
+        kwargs = {}
+        if isinstance(value, np.ndarray):
+            value = self.policy.prepare(value, path)
+            kwargs = self.policy.dataset_kwargs(value)
+        shape, dtype = self._get_shape_dtype(value)
+        dataset = self.io.require_dataset(data=value, shape=shape, dtype=dtype, name=name, **kwargs)
+        dataset.attrs['write_policy'] = json.dumps(self.policy.identifiers())
+
+    def append(self, rows):
+        """Append rows to the resizable dataset at the current data key, which is created by the first append. Rows
+        are buffered until `batch` rows are pending, and then written at once.
+
+        Parameters
+        ----------
+        rows: np.ndarray
+            Array whose first axis are the rows to append. All other axes must match the previously appended rows.
+
+        """
+        rows = np.array(rows)
+        if not rows.shape:
+            raise ValueError('Rows to append must have at least one axis.')
+        _, pending = self._appends.get(self.data_key, (None, []))
+        if pending and pending[0].shape[1:] != rows.shape[1:]:
+            raise ValueError(f"Rows of shape {rows.shape[1:]} do not match the rows of '{self.data_key}'.")
+        pending.append(rows)
+        # the rows are written with the parameters of the most recent append
+        self._appends[self.data_key] = (self, pending)
+        if sum(len(elem) for elem in pending) >= self.batch:
+            self._flush_rows(self.data_key)
+
+    def _require_appendable(self, rows):
+        """Return the resizable dataset at the current data key, which is created for `rows` if it does not exist."""
+        if self.data_key in self.io:
+            dataset = self.io[self.data_key]
+            if not isinstance(dataset, h5py.Dataset) or not dataset.maxshape or dataset.maxshape[0] is not None:
+                raise TypeError(f"'{self.data_key}' is not an appendable dataset.")
+            if dataset.shape[1:] != rows.shape[1:]:
+                raise ValueError(f"Rows of shape {rows.shape[1:]} do not match the rows of '{self.data_key}'.")
+            return dataset
+        row_bytes = rows.dtype.itemsize * int(np.prod(rows.shape[1:]))
+        chunk_rows = max(1, min(self.batch, APPEND_CHUNK_BYTES // max(row_bytes, 1)))
+        # only the shape of the template is used, so it does not need to be allocated
+        template = np.broadcast_to(np.zeros((), dtype=rows.dtype), (chunk_rows,) + rows.shape[1:])
+        kwargs = self.policy.dataset_kwargs(template)
+        kwargs.setdefault('chunks', template.shape if template.size else True)
+        dataset = self.io.create_dataset(
+            self.data_key, shape=(0,) + rows.shape[1:], maxshape=(None,) + rows.shape[1:], dtype=rows.dtype, **kwargs
+        )
+        dataset.attrs[APPEND_LENGTH_ATTR] = 0
+        dataset.attrs['write_policy'] = json.dumps(self.policy.identifiers())
+        return dataset
+
+    def _flush_rows(self, key, trim=False):
+        """Write the rows buffered for `key`, growing its dataset according to `growth`, and optionally trim it."""
+        storage, pending = self._appends.pop(key, (None, None))
+        if pending:
+            rows = storage.policy.prepare(np.concatenate(pending))
+            dataset = storage._require_appendable(rows)  # pylint: disable=protected-access
+            length = int(dataset.attrs.get(APPEND_LENGTH_ATTR, len(dataset)))
+            end = length + len(rows)
+            if end > len(dataset):
+                dataset.resize(max(end, int(len(dataset) * max(storage.growth, 1.))), axis=0)
+            dataset[length:end] = rows
+            dataset.attrs[APPEND_LENGTH_ATTR] = end
+            self._untrimmed.add(key)
+        if trim and key in self._untrimmed:
+            dataset = self.io[key]
+            dataset.resize(int(dataset.attrs[APPEND_LENGTH_ATTR]), axis=0)
+            self._untrimmed.discard(key)
+
+    def flush(self):
+        """Write all buffered rows, trim the appended datasets to their rows, and flush the file.
+
+        """
+        for key in list(self._appends) + list(self._untrimmed):
+            self._flush_rows(key, trim=True)
+        if self.io.mode != 'r':
+            self.io.flush()
+
+    def close(self):
+        """Flush appended rows and close the file.
+
+        """
+        if self.io:
+            self.flush()
+        super().close()
 
     def exists(self):
-        """Returns True if key exists in self.io.
+        """Returns True if key exists in self.io, or rows were appended to it.
 
         """
-        return self.data_key in self.io
+        return self.data_key in self.io or self.data_key in self._appends
 
     def keys(self):
         """Return keys of the storage.
@@ -319,7 +855,10 @@ class HDF5Storage(DataStorageBase):
             key = int(key)
         if isinstance(value, h5py.Dataset):
             check = h5py.check_string_dtype(value.dtype)
-            value = value[()]
+            if APPEND_LENGTH_ATTR in value.attrs:
+                value = value[:value.attrs[APPEND_LENGTH_ATTR]]
+            else:
+                value = value[()]
             if check is not None:
                 value = value.decode(check.encoding)
         elif isinstance(value, h5py.Group):
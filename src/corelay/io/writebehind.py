@@ -0,0 +1,164 @@
+"""Asynchronous write-behind in front of storages of Processor data.
+
+"""
+import queue
+import atexit
+import weakref
+import threading
+import contextvars
+
+from .keys import NoDataTarget, KeyedStorable, StorageKey, read_key, write_key, contains_key
+from .hashing import ext_hash, register_lineage, ExactHash
+
+
+# instances with a running writer, which are flushed when the interpreter exits
+_ACTIVE = weakref.WeakSet()
+
+
+@atexit.register
+def _flush_active():
+    """Flush the pending writes of all instances when the interpreter exits"""
+    for storage in list(_ACTIVE):
+        storage.close()
+
+
+class WriteBehindStorage:
+    """Storage which writes outputs asynchronously to any other :obj:`corelay.io.storage.Storable`.
+
+    Writes are put into a bounded queue and return immediately, while a background thread writes them to the backend.
+    When the queue is full, writes block until there is space, which bounds the memory of pending outputs. Reads of
+    pending outputs are served from the queue, all other reads from the backend. Backend reads and writes are
+    serialized, since backends are not necessarily thread-safe. Outputs must not be modified in-place after they were
+    written, since they are written later.
+
+    Background writes run in an empty context, i.e. outside of any :obj:`corelay.io.hashing.hash_memo` of the caller,
+    whose memo is not thread-safe and would otherwise be kept alive until the write. Lineage of the outputs of backends
+    which register it is registered by the caller when writing.
+
+    Errors of writes in the background are raised by :obj:`WriteBehindStorage.flush` and
+    :obj:`WriteBehindStorage.close`, which are called when exiting the context. Pending writes are also flushed when
+    the interpreter exits.
+
+    Parameters
+    ----------
+    backend : :obj:`corelay.io.storage.Storable`
+        Storage to which outputs are written.
+    maxsize : int
+        Maximum number of pending writes.
+    strategy : :obj:`corelay.io.hashing.HashStrategy`, optional
+        Strategy to hash inputs of pending writes with. Defaults to the strategy of the backend, if it has one, else
+        :obj:`corelay.io.hashing.ExactHash`.
+
+    """
+    def __init__(self, backend, maxsize=8, strategy=None):
+        self.backend = backend
+        if strategy is None:
+            strategy = getattr(backend, 'strategy', None)
+        self.strategy = ExactHash() if strategy is None else strategy
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._pending = {}
+        self._errors = []
+        self._lock = threading.Lock()
+        self._backend_lock = threading.RLock()
+        self._thread = None
+
+    def key(self, data_in, meta):
+        """Return the key of `data_in` and `meta`, which is the key of the backend if it implements the key protocol,
+        and their hash otherwise."""
+        if isinstance(self.backend, KeyedStorable):
+            return self.backend.key(data_in, meta)
+        return StorageKey(ext_hash((data_in, meta), self.strategy), data_in, meta)
+
+    def _run(self):
+        """Write queued outputs to the backend until receiving None"""
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                key, data_out = item
+                try:
+                    with self._backend_lock:
+                        contextvars.Context().run(write_key, self.backend, data_out, key)
+                except NoDataTarget:
+                    pass
+                except Exception as error:  # pylint: disable=broad-except
+                    self._errors.append(error)
+                finally:
+                    with self._lock:
+                        if self._pending.get(key.digest, (None,))[0] is data_out:
+                            del self._pending[key.digest]
+            finally:
+                self._queue.task_done()
+
+    def read_key(self, key):
+        """Read pending output of :obj:`corelay.io.keys.StorageKey` `key` from the queue, or from the backend"""
+        with self._lock:
+            if key.digest in self._pending:
+                return self._pending[key.digest][0]
+        with self._backend_lock:
+            return read_key(self.backend, key)
+
+    def contains_key(self, key):
+        """Return True if the output of :obj:`corelay.io.keys.StorageKey` `key` is pending or in the backend"""
+        with self._lock:
+            if key.digest in self._pending:
+                return True
+        with self._backend_lock:
+            return contains_key(self.backend, key)
+
+    def read(self, data_in, meta):
+        """Read pending output from the queue, or from the backend"""
+        return self.read_key(self.key(data_in, meta))
+
+    def write(self, data_out, data_in, meta):
+        """Queue output to be written to the backend, blocking while the queue is full"""
+        self.write_key(data_out, self.key(data_in, meta))
+
+    def write_key(self, data_out, key):
+        """Queue output of :obj:`corelay.io.keys.StorageKey` `key` to be written to the backend, blocking while the
+        queue is full"""
+        if getattr(self.backend, 'provenance', False):
+            # register the lineage now, such that subsequent Processors hash the output by its key as if it was
+            # written synchronously
+            register_lineage(data_out, key.digest)
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='corelay-write-behind', daemon=True)
+                self._thread.start()
+                _ACTIVE.add(self)
+            self._pending[key.digest] = (data_out,)
+        self._queue.put((key, data_out))
+
+    @property
+    def pending(self):
+        """Number of outputs which are not yet written"""
+        return self._queue.unfinished_tasks
+
+    def flush(self):
+        """Wait until all pending outputs are written, and raise the first error of any write since the last flush.
+        """
+        self._queue.join()
+        errors, self._errors = self._errors, []
+        if errors:
+            raise errors[0]
+
+    def close(self):
+        """Flush pending outputs, stop the writer thread and close the backend, if it can be closed. Errors of pending
+        writes are raised after the backend was closed."""
+        try:
+            self.flush()
+        finally:
+            if self._thread is not None:
+                self._queue.put(None)
+                self._thread.join()
+                self._thread = None
+                _ACTIVE.discard(self)
+            if hasattr(self.backend, 'close'):
+                self.backend.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, typ, value, traceback):
+        self.close()
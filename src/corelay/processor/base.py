@@ -6,7 +6,9 @@ from types import FunctionType, MethodType, LambdaType
 from abc import abstractmethod
 from collections import OrderedDict
 
-from ..io import Storable, NoStorage, NoDataSource, NoDataTarget
+from ..io import Storable, KeyedStorable, NoStorage, NoDataSource, NoDataTarget
+from ..io.keys import storage_key, read_key, write_key
+from ..io.hashing import hash_memo
 from ..base import Param
 from ..plugboard import Plugboard
 
@@ -77,25 +79,69 @@ class Processor(Plugboard):
     def __call__(self, data):
         """Apply `self.funtion` on input data, save output if `self.is_checkpoint`
 
+        The call is executed within a :obj:`corelay.io.hashing.hash_memo` context, such that each distinct input array
+        is hashed at most once during the outermost call, i.e. the run of a whole pipeline, even if it is broadcast to
+        multiple children. If `self.io` implements the key protocol (see :obj:`corelay.io.keys.KeyedStorable`), the
+        identifiers are built and the key of the input is computed once, and used for both reading and writing.
+
+        Parameters
+        ----------
+        data : object
+            Input data to this Processor.
+
+        Returns
+        -------
+        object
+            Depending on what operation `self.function` executes.
+
+        """
+        with hash_memo():
+            return self.resolve(data, self.key(data))
+
+    def key(self, data):
+        """Return the key under which the output for input `data` is stored in `self.io`.
+
         Parameters
         ----------
         data : object
             Input data to this Processor.
 
+        Returns
+        -------
+        :obj:`corelay.io.keys.StorageKey`
+            Key of the output, see :obj:`corelay.io.keys.storage_key`.
+
+        """
+        return storage_key(self.io, data, self.identifiers())
+
+    def resolve(self, data, key, probe=True):
+        """Return the output for input `data`, by reading it from `self.io` with `key`, or by computing it with
+        `self.function` and writing it with `key` if it is not stored. Save the output if `self.is_checkpoint`.
+
+        Parameters
+        ----------
+        data : object
+            Input data to this Processor.
+        key : :obj:`corelay.io.keys.StorageKey`
+            Key of the output, as returned by :obj:`Processor.key`.
+        probe : bool
+            If False, the output is known not to be stored, e.g. from a batched probe, and is computed without reading.
+
         Returns
         -------
         object
             Depending on what operation `self.function` executes.
 
         """
-        try:
-            # pylint: disable=no-member
-            out = self.io.read(data_in=data, meta=self.identifiers())
-        except NoDataSource:
+        if probe:
+            try:
+                out = read_key(self.io, key)
+            except NoDataSource:
+                probe = False
+        if not probe:
             out = self.function(data)
             try:
-                # pylint: disable=no-member
-                self.io.write(data_out=out, data_in=data, meta=self.identifiers())
+                write_key(self.io, out, key)
             except NoDataTarget:
                 pass
         if self.is_checkpoint:
@@ -115,7 +161,9 @@ class Processor(Plugboard):
 
     def identifiers(self):
         """Returns a dict containing the class qualifer name, as well all Parameters marked as identifiers with their
-        values
+        values. If `self.io` implements the key protocol, the `function` defined by the class is included as well, such
+        that it is hashed by its fingerprint (see :obj:`corelay.io.hashing.HashPickler.function_id`), and outputs of a
+        modified `function` are stored under different keys.
 
         Returns
         -------
@@ -124,6 +172,10 @@ class Processor(Plugboard):
         """
         result = OrderedDict(name=type(self).__qualname__)
         result.update((key, getattr(self, key)) for key, param in self.collect(Param).items() if param.is_identifier)
+        if 'function' not in result and isinstance(self.io, KeyedStorable):
+            function = inspect.getattr_static(type(self), 'function', None)
+            if isinstance(function, FunctionType):
+                result['function'] = function
         return result
 
     def copy(self):
@@ -171,24 +223,27 @@ class FunctionProcessor(Processor):
     ----------
     function : :obj:`types.FunctionType` or :obj:`types.MethodType`
         The function around which to create the :obj:`FunctionProcessor`. It wil be bound as a method if bind_method.
+        It is an identifier by its code-aware fingerprint (see :obj:`corelay.io.hashing.HashPickler.function_id`), so
+        outputs of different functions, or of a modified function, are stored under different keys.
     bind_method : bool
         Will bind `function` to this class, enabling it to access `self`.
 
     """
-    function = Param((MethodType, FunctionType), (lambda self, data: data), positional=True)
+    function = Param((MethodType, FunctionType), (lambda self, data: data), positional=True, identifier=True)
     bind_method = Param(bool, False)
 
-    def __call__(self, data):
-        """Bind function as attribute of instance.
+    def key(self, data):
+        """Bind function as attribute of instance, before it is used as identifier of the key.
 
         See also
         --------
-        :obj:`Processor`
+        :obj:`Processor.key`
 
         """
         if self.bind_method:
-            self.function = self.function.__get__(self, type(self))
-        return super().__call__(data)
+            # binding an already bound method returns it unchanged
+            self.function = self.function.__get__(self, type(self))  # pylint: disable=unnecessary-dunder-call
+        return super().key(data)
 
 
 def ensure_processor(proc, **kwargs):
@@ -1,5 +1,6 @@
 """Basic flow operation Processors, such as Shaper, Sequential and Parallel"""
 from ..base import Param
+from ..io.keys import read_many
 from .base import Processor
 from ..utils import zip_equal, Iterable
 
@@ -89,6 +90,12 @@ class Parallel(GroupProcessor):
         """Sequentially get one element from data per child, call all children with this element as input in parallel,
         and accumulate the outputs.
 
+        The keys of all children are computed first, hashing each distinct input only once, and the stored outputs of
+        children sharing the same storage are read in a single batch (see :obj:`corelay.io.keys.read_many`). Only
+        the children whose outputs are not stored are then called to compute them. Children which override
+        :obj:`Processor.__call__` are called as they are, and children whose storage does not implement the key
+        protocol each probe their storage when called, such that they may read outputs written by previous children.
+
         Parameters
         ----------
         data : iterable or object
@@ -116,9 +123,36 @@ class Parallel(GroupProcessor):
             # pylint: disable=not-an-iterable
             data = tuple(data for _ in self.children)
 
+        pairs = list(wrap_err(zip_equal(self.children, data)))
+        keys = {
+            n: child.key(element) for n, (child, element) in enumerate(pairs)
+            if type(child).__call__ is Processor.__call__
+        }
+
+        storages = {}
+        for n, key in keys.items():
+            if key.digest is not None:
+                storages.setdefault(id(pairs[n][0].io), (pairs[n][0].io, []))[1].append(n)
+        stored = {}
+        for storage, positions in storages.values():
+            outputs = read_many(storage, [keys[n] for n in positions])
+            stored.update((positions[m], out) for m, out in outputs.items())
+
         result = []
-        for child, element in wrap_err(zip_equal(self.children, data)):
-            out = child(element)
+        computed = set()
+        for n, (child, element) in enumerate(pairs):
+            if n not in keys:
+                out = child(element)
+            elif n in stored:
+                out = stored[n]
+                if child.is_checkpoint:
+                    child.checkpoint_data = out
+            elif keys[n].digest is None:
+                out = child.resolve(element, keys[n])
+            else:
+                # probe again if a previous child computed the same output
+                out = child.resolve(element, keys[n], probe=(id(child.io), keys[n].digest) in computed)
+                computed.add((id(child.io), keys[n].digest))
             result.append(out)
         return tuple(result)
 
@@ -0,0 +1,137 @@
+"""Test module for corelay/io/cache.py"""
+from io import BytesIO
+
+import pytest
+import numpy as np
+import h5py
+from scipy import sparse as sp
+
+from corelay import io
+from corelay.io.cache import CachedStorage, nbytes
+from corelay.io.storage import HashedHDF5
+from corelay.io import hashing
+from corelay.processor.base import FunctionProcessor
+from corelay.processor.flow import Sequential
+
+
+def _double(data):
+    """Double the data."""
+    return data * 2
+
+
+def _increment(data):
+    """Increment the data."""
+    return data + 1
+
+
+class CountingStorage:
+    """Storable which counts reads from a dictionary"""
+    def __init__(self):
+        self.data = {}
+        self.reads = 0
+
+    def read(self, data_in, meta):
+        """Read from the dictionary"""
+        self.reads += 1
+        try:
+            return self.data[(data_in, meta)]
+        except KeyError as error:
+            raise io.NoDataSource() from error
+
+    def write(self, data_out, data_in, meta):
+        """Write to the dictionary"""
+        self.data[(data_in, meta)] = data_out
+
+
+class TestNBytes:
+    """Test class for nbytes"""
+    @staticmethod
+    def test_nbytes():
+        """Sizes should be computed from the buffers of arrays, sparse matrices and tuples of these"""
+        matrix = sp.random(10, 10, density=0.5, format='csr', random_state=0)
+        expected = matrix.data.nbytes + matrix.indices.nbytes + matrix.indptr.nbytes
+        assert nbytes(np.zeros(10)) == 80
+        assert nbytes(matrix) == expected
+        assert nbytes((np.zeros(10), (matrix,))) == 80 + expected
+        assert nbytes(matrix.tolil()) == nbytes(matrix.tocoo())
+
+
+class TestCachedStorage:
+    """Test class for CachedStorage"""
+    @staticmethod
+    def test_read_through():
+        """Repeated reads should be served from the cache"""
+        backend = CountingStorage()
+        backend.write(np.zeros(4), 1, 'meta')
+        storage = CachedStorage(backend)
+        first = storage.read(1, 'meta')
+        second = storage.read(1, 'meta')
+        assert first is second
+        assert backend.reads == 1
+        info = storage.cache_info()
+        assert (info.hits, info.misses, info.entries, info.size) == (1, 1, 1, 32)
+
+    @staticmethod
+    def test_write_through():
+        """Writes should reach the backend and be cached"""
+        backend = CountingStorage()
+        storage = CachedStorage(backend)
+        storage.write(np.zeros(4), 1, 'meta')
+        assert (1, 'meta') in backend.data
+        storage.read(1, 'meta')
+        assert backend.reads == 0
+
+    @staticmethod
+    def test_miss():
+        """Reads missing in cache and backend should raise NoDataSource"""
+        storage = CachedStorage(CountingStorage())
+        with pytest.raises(io.NoDataSource):
+            storage.read(1, 'meta')
+        assert storage.cache_info().misses == 1
+
+    @staticmethod
+    def test_budget():
+        """The least recently used entries should be evicted beyond the budget, and too large ones not cached"""
+        storage = CachedStorage(io.NoStorage(), budget=250)
+        for key in range(3):
+            storage.write(np.zeros(10), key, 'meta')
+        storage.read(0, 'meta')
+        storage.write(np.zeros(10), 3, 'meta')
+        storage.write(np.zeros(100), 4, 'meta')
+        info = storage.cache_info()
+        assert (info.entries, info.size, info.evictions) == (3, 240, 1)
+        storage.read(0, 'meta')
+        storage.read(3, 'meta')
+        with pytest.raises(io.NoDataSource):
+            storage.read(1, 'meta')
+
+    @staticmethod
+    def test_hashed_hdf5():
+        """Processors should be served from the cache in front of HashedHDF5"""
+        with BytesIO() as buf, h5py.File(buf, 'w') as fd:
+            storage = CachedStorage(HashedHDF5(fd.require_group('hashed')))
+            processor = FunctionProcessor(function=lambda data: data * 2, io=storage)
+            first = processor(np.arange(5))
+            second = processor(np.arange(5))
+            assert first is second
+            assert len(fd['hashed']) == 1
+            assert storage.cache_info().hits == 1
+
+    @staticmethod
+    def test_provenance(monkeypatch):
+        """Cache hits should register their lineage, such that downstream Processors are not hashed by content"""
+        with BytesIO() as buf, h5py.File(buf, 'w') as fd:
+            storage = CachedStorage(HashedHDF5(fd.require_group('hashed'), provenance=True))
+            pipeline = Sequential([
+                FunctionProcessor(function=_double, io=storage),
+                FunctionProcessor(function=_increment, io=storage),
+            ])
+            first = pipeline(np.arange(5))
+            assert len(fd['hashed']) == 2
+            calls = []
+            digest = hashing.array_digest
+            monkeypatch.setattr(hashing, 'array_digest', lambda obj: calls.append(obj) or digest(obj))
+            second = pipeline(np.arange(5))
+            assert second is first
+            assert len(fd['hashed']) == 2
+            assert len(calls) == 1
@@ -0,0 +1,105 @@
+"""Test module for corelay/io/directory.py"""
+import os
+import json
+import multiprocessing
+
+import pytest
+import numpy as np
+from scipy import sparse as sp
+
+from corelay import io
+from corelay.io.directory import DirectoryStorage
+from corelay.processor.base import FunctionProcessor
+
+
+def _writer(root):
+    """Write the same entries as other processes."""
+    storage = DirectoryStorage(root)
+    for key in range(16):
+        storage.write(np.full(32, key), data_in=key, meta='concurrent')
+
+
+@pytest.fixture
+def data():
+    """Return a tuple hierarchy of arrays and a sparse matrix."""
+    return (
+        np.random.default_rng(0).normal(size=(10, 3)),
+        (np.arange(4), sp.random(8, 6, density=0.3, format='csr', random_state=0)),
+    )
+
+
+class TestDirectoryStorage:
+    """Test class for DirectoryStorage"""
+    @staticmethod
+    def test_round_trip(tmp_path, data):
+        """Tuple hierarchies should be read back as read-only memory-maps with the same content"""
+        storage = DirectoryStorage(tmp_path)
+        storage.write(data, data_in=1, meta={'name': 'test'})
+        first, (second, third) = storage.read(data_in=1, meta={'name': 'test'})
+        assert isinstance(first, np.memmap) and not first.flags.writeable
+        assert np.array_equal(first, data[0])
+        assert np.array_equal(second, data[1][0])
+        assert third.format == 'csr' and (third != data[1][1]).nnz == 0
+
+    @staticmethod
+    def test_layout(tmp_path, data):
+        """Entries should be stored under their hash prefix with a manifest and one file per leaf"""
+        storage = DirectoryStorage(tmp_path)
+        storage.write(data, data_in=1, meta=1)
+        key = storage.key(data_in=1, meta=1).digest
+        assert storage.keys() == [key]
+        directory = tmp_path / key[:2] / key
+        assert sorted(os.listdir(directory)) == [
+            'data-000.npy',
+            'data-001-000.npy',
+            'data-001-001.data.npy',
+            'data-001-001.indices.npy',
+            'data-001-001.indptr.npy',
+            'manifest.json',
+        ]
+        with open(directory / 'manifest.json', encoding='utf-8') as fd:
+            assert json.load(fd)['strategy']['name'] == 'exact'
+        storage.write(np.arange(3), data_in=2, meta=1)
+        key = storage.key(data_in=2, meta=1).digest
+        assert sorted(os.listdir(tmp_path / key[:2] / key)) == ['data.npy', 'manifest.json']
+
+    @staticmethod
+    def test_data_key(tmp_path, data):
+        """Entries should be addressable by their data key"""
+        with DirectoryStorage(tmp_path) as storage:
+            storage['first'] = data[0]
+            assert 'first' in storage
+            assert 'second' not in storage
+            assert np.array_equal(storage['first'], data[0])
+            with pytest.raises(io.NoDataSource):
+                _ = storage['second']
+
+    @staticmethod
+    def test_read_only(tmp_path, data):
+        """Writing in read mode or unsupported types should raise errors"""
+        with pytest.raises(OSError):
+            DirectoryStorage(tmp_path, mode='r').write(data)
+        with pytest.raises(TypeError):
+            DirectoryStorage(tmp_path).write('string')
+        assert not os.listdir(next(tmp_path.iterdir()))
+
+    @staticmethod
+    def test_memoize(tmp_path):
+        """Processors should memoize their outputs"""
+        processor = FunctionProcessor(function=lambda data: data * 2, io=DirectoryStorage(tmp_path))
+        first = processor(np.arange(5))
+        second = processor(np.arange(5))
+        assert not isinstance(first, np.memmap)
+        assert isinstance(second, np.memmap)
+        assert np.array_equal(first, second)
+        assert len(processor.io.keys()) == 1
+
+    @staticmethod
+    def test_concurrent(tmp_path):
+        """Concurrent writers should publish each entry exactly once"""
+        root = str(tmp_path / 'store')
+        with multiprocessing.get_context('spawn').Pool(4) as pool:
+            pool.map(_writer, [root] * 4)
+        storage = DirectoryStorage(root, mode='r')
+        assert len(storage.keys()) == 16
+        assert np.array_equal(storage.read(data_in=3, meta='concurrent'), np.full(32, 3))
@@ -0,0 +1,455 @@
+"""Test module for corelay/io/hashing.py"""
+from io import BytesIO
+
+import pytest
+import numpy as np
+import h5py
+from scipy import sparse as sp
+
+from corelay.io import hashing
+from corelay.io.hashing import ext_hash, array_digest, tree_digest, hash_memo
+from corelay.io.hashing import ExactHash, TolerantHash, SampledHash, fingerprint, versioned
+from corelay.io.lazy import DatasetProxy
+
+
+def _scale(factor):
+    """Return a function multiplying its argument by `factor`."""
+    return lambda data: data * factor
+
+
+class Scale:
+    """Multiply data by a factor."""
+    def __init__(self, factor):
+        self.factor = factor
+
+    def apply(self, data):
+        """Return data multiplied by the factor."""
+        return data * self.factor
+
+
+_OFFSET = 1
+
+
+def _offset(data):
+    """Function referencing a global value."""
+    return data + _OFFSET
+
+
+def _factorial(num):
+    """Recursive function referencing itself through its globals."""
+    return 1 if num <= 1 else num * _factorial(num - 1)
+
+
+@pytest.fixture
+def sparse_matrix():
+    """Return a random sparse CSR matrix of shape (64, 48)."""
+    return sp.random(64, 48, density=0.1, format='csr', random_state=0xBEEF)
+
+
+@pytest.fixture
+def array():
+    """Return a random float64 array of shape (64, 32)."""
+    return np.random.default_rng(0xDEADBEEF).normal(size=(64, 32))
+
+
+class TestArrayDigest:
+    """Test class for array_digest"""
+    @staticmethod
+    def test_deterministic(array):
+        """Hashing the same content twice should result in the same digest"""
+        assert array_digest(array) == array_digest(array.copy())
+
+    @staticmethod
+    def test_content(array):
+        """Changing a single element should change the digest"""
+        other = array.copy()
+        other[-1, -1] += 1.
+        assert array_digest(array) != array_digest(other)
+
+    @staticmethod
+    def test_shape_dtype(array):
+        """Arrays with the same buffer but different shape or dtype should not collide"""
+        digest = array_digest(array)
+        assert digest != array_digest(array.reshape(32, 64))
+        assert digest != array_digest(array.view(np.int64))
+
+    @staticmethod
+    def test_non_contiguous(array):
+        """Non-contiguous arrays should hash like their contiguous copies"""
+        view = array[::2, 1::3]
+        assert not view.flags.c_contiguous
+        assert array_digest(view) == array_digest(np.ascontiguousarray(view))
+
+    @staticmethod
+    def test_memory_order(array):
+        """The memory layout is part of the digest"""
+        assert array_digest(array) != array_digest(np.asfortranarray(array))
+
+    @staticmethod
+    def test_chunking(array, monkeypatch):
+        """The digest should not depend on the chunk size"""
+        view = array[:, ::2]
+        digests = {array_digest(array), array_digest(view)}
+        monkeypatch.setattr(hashing, 'CHUNK_SIZE', 100)
+        assert digests == {array_digest(array), array_digest(view)}
+
+
+class TestTreeDigest:
+    """Test class for tree_digest"""
+    @staticmethod
+    @pytest.mark.parametrize('workers', [1, 2, 5])
+    def test_workers(array, workers):
+        """The digest should not depend on the number of threads"""
+        assert tree_digest(array, block_size=1000, workers=workers) == tree_digest(array, block_size=1000, workers=1)
+
+    @staticmethod
+    def test_block_size(array):
+        """The block size is part of the digest"""
+        assert tree_digest(array, block_size=1000) != tree_digest(array, block_size=1024)
+
+    @staticmethod
+    def test_non_contiguous(array):
+        """Non-contiguous arrays should tree-hash like their contiguous copies, also if rows span multiple blocks"""
+        view = array[::3, ::2]
+        assert tree_digest(view, block_size=100) == tree_digest(np.ascontiguousarray(view), block_size=100)
+
+    @staticmethod
+    def test_content(array):
+        """Changing a single element should change the digest"""
+        other = array.copy()
+        other[-1, -1] += 1.
+        assert tree_digest(array, block_size=1000) != tree_digest(other, block_size=1000)
+
+
+class TestExtHash:
+    """Test class for ext_hash"""
+    @staticmethod
+    def test_nested(array):
+        """Arrays nested in containers should be hashed by their content"""
+        assert ext_hash((array, {'name': 'meta'})) == ext_hash((array.copy(), {'name': 'meta'}))
+        assert ext_hash((array, {'name': 'meta'})) != ext_hash((array, {'name': 'other'}))
+
+    @staticmethod
+    def test_exact(array):
+        """The default mode should distinguish tiny numerical differences"""
+        assert ext_hash(array) != ext_hash(array * (1. + 1e-6))
+
+    @staticmethod
+    def test_tolerant(array):
+        """The tolerant mode should ignore tiny numerical differences, and differ from the exact mode"""
+        assert ext_hash(array, TolerantHash()) == ext_hash(array * (1. + 1e-6), TolerantHash())
+        assert ext_hash(array, TolerantHash()) != ext_hash(array)
+        assert ext_hash(array, TolerantHash()) != ext_hash(array, TolerantHash(decimals=3))
+
+    @staticmethod
+    def test_tree(array, monkeypatch):
+        """Arrays larger than the block size should only be tree-hashed in tree-mode"""
+        monkeypatch.setattr(hashing, 'BLOCK_SIZE', 1000)
+        assert ext_hash(array, ExactHash(tree=True)) == ext_hash(array, ExactHash(tree=True, workers=3))
+        assert ext_hash(array, ExactHash(tree=True)) != ext_hash(array)
+        assert ext_hash(array[:2], ExactHash(tree=True)) == ext_hash(array[:2])
+
+    @staticmethod
+    def test_object_array():
+        """Object arrays should be hashed by pickling their members"""
+        assert ext_hash(np.array(['a', 1], dtype=object)) == ext_hash(np.array(['a', 1], dtype=object))
+        assert ext_hash(np.array(['a', 1], dtype=object)) != ext_hash(np.array(['a', 2], dtype=object))
+
+
+class TestSparse:
+    """Test class for hashing sparse matrices"""
+    @staticmethod
+    @pytest.mark.parametrize('fmt', ['csr', 'csc', 'coo', 'lil'])
+    def test_canonical(sparse_matrix, fmt):
+        """Sparse matrices in different formats with the same values should have the same hash"""
+        assert ext_hash(sparse_matrix) == ext_hash(sparse_matrix.asformat(fmt))
+
+    @staticmethod
+    def test_duplicates(sparse_matrix):
+        """Matrices with duplicate entries should hash like their canonical counterparts"""
+        coo = sparse_matrix.tocoo()
+        half = coo.data / 2.
+        duplicated = sp.coo_matrix(
+            (np.concatenate([half, half]), (np.tile(coo.row, 2), np.tile(coo.col, 2))), shape=coo.shape
+        )
+        assert ext_hash(duplicated) == ext_hash(sparse_matrix)
+
+    @staticmethod
+    def test_content(sparse_matrix):
+        """Changing values, structure or shape should change the hash"""
+        other = sparse_matrix.copy()
+        other.data[0] += 1.
+        assert ext_hash(sparse_matrix) != ext_hash(other)
+        assert ext_hash(sparse_matrix) != ext_hash(sparse_matrix.T)
+        assert ext_hash(sparse_matrix) != ext_hash(sparse_matrix.toarray())
+
+    @staticmethod
+    def test_memo(sparse_matrix, monkeypatch):
+        """Sparse matrices should only be hashed once within a memo context"""
+        calls = []
+        monkeypatch.setattr(hashing, 'canonical_sparse', lambda obj: calls.append(obj) or obj)
+        with hash_memo():
+            ext_hash(sparse_matrix)
+            ext_hash(sparse_matrix)
+        assert len(calls) == 1
+
+
+class TestStrategies:
+    """Test class for the hashing strategies"""
+    @staticmethod
+    def test_distinct(array):
+        """Different strategies should result in different hashes of the same array"""
+        strategies = [ExactHash(), TolerantHash(), SampledHash(), SampledHash(10), SampledHash(statistics=True)]
+        assert len({ext_hash(array, strategy) for strategy in strategies}) == len(strategies)
+
+    @staticmethod
+    def test_identifiers():
+        """Strategies should be equal if their identifiers are equal"""
+        assert ExactHash(workers=4) == ExactHash()
+        assert ExactHash(tree=True) != ExactHash()
+        assert SampledHash() != TolerantHash()
+        assert list(SampledHash().identifiers()) == ['name', 'file_keys', 'n_samples', 'statistics']
+
+    @staticmethod
+    def test_sampled(array):
+        """Sampled hashes should detect changes in sampled elements or statistics, but not in unsampled elements"""
+        strategy = SampledHash(n_samples=2)
+        other = array.copy()
+        other[0, 1] += 1.
+        assert ext_hash(array, strategy) == ext_hash(other, strategy)
+        with_stats = SampledHash(n_samples=2, statistics=True)
+        assert ext_hash(array, with_stats) != ext_hash(other, with_stats)
+        other[0, 0] += 1.
+        assert ext_hash(array, strategy) != ext_hash(other, strategy)
+
+    @staticmethod
+    @pytest.mark.parametrize('strategy', [ExactHash(), TolerantHash(), SampledHash(100), SampledHash(statistics=True)])
+    def test_dataset(array, strategy):
+        """HDF5 datasets should hash like their loaded arrays for all strategies"""
+        with BytesIO() as buf, h5py.File(buf, 'w') as fd:
+            fd['data'] = array
+            assert ext_hash(fd['data'], strategy) == ext_hash(array, strategy)
+
+    @staticmethod
+    @pytest.mark.parametrize('order', ['C', 'F'])
+    def test_dataset_statistics(order, monkeypatch):
+        """Statistics of arrays and streamed HDF5 datasets or their proxies should be reduced identically"""
+        monkeypatch.setattr(hashing, 'CHUNK_SIZE', 1000)
+        array = np.asarray(np.random.default_rng(0).normal(size=(4000, 30)), order=order)
+        strategy = SampledHash(n_samples=16, statistics=True)
+        with BytesIO() as buf, h5py.File(buf, 'w') as fd:
+            fd['data'] = array
+            assert ext_hash(fd['data'], strategy) == ext_hash(array, strategy)
+            assert ext_hash(DatasetProxy(fd['data']), strategy) == ext_hash(array, strategy)
+
+
+class TestFingerprint:
+    """Test class for code-aware fingerprints of functions"""
+    @staticmethod
+    def test_same_code():
+        """Functions with the same code should have the same fingerprint, independent of their name"""
+        def first(data):
+            return data[1]
+
+        def second(data):
+            return data[1]
+
+        assert fingerprint(first) == fingerprint(second) == fingerprint(lambda data: data[1])
+
+    @staticmethod
+    def test_different_code():
+        """Functions with different code or constants should have different fingerprints"""
+        assert fingerprint(lambda data: data[1]) != fingerprint(lambda data: data[0])
+        assert fingerprint(lambda data: data + 1) != fingerprint(lambda data: data - 1)
+
+    @staticmethod
+    def test_defaults():
+        """Functions which only differ in their defaults should have different fingerprints"""
+        functions = [lambda data, num=num: data + num for num in range(3)]
+        assert len({fingerprint(func) for func in functions}) == 3
+
+    @staticmethod
+    def test_closure(array):
+        """Functions which only differ in the values of their closure should have different fingerprints"""
+        assert fingerprint(_scale(2)) == fingerprint(_scale(2))
+        assert fingerprint(_scale(2)) != fingerprint(_scale(3))
+        assert fingerprint(_scale(array)) != fingerprint(_scale(array + 1.))
+
+    @staticmethod
+    def test_globals(monkeypatch):
+        """Changing a referenced global should change the fingerprint, and recursive functions should be supported"""
+        before = fingerprint(_offset)
+        assert fingerprint(_offset) == before
+        monkeypatch.setitem(globals(), '_OFFSET', _OFFSET + 1)
+        assert fingerprint(_offset) != before
+        assert fingerprint(_factorial) == fingerprint(_factorial)
+
+    @staticmethod
+    def test_unhashable():
+        """Referenced values which cannot be pickled should raise an error, unless the function is versioned"""
+        unpicklable = (lambda: None).__code__
+        with pytest.raises(TypeError):
+            fingerprint(lambda: unpicklable)
+        assert fingerprint(versioned('1')(lambda: unpicklable)) == fingerprint(versioned('1')(lambda: unpicklable))
+
+    @staticmethod
+    def test_versioned():
+        """The version tag should be part of the fingerprint"""
+        def func(data):
+            return data
+
+        before = fingerprint(func)
+        assert fingerprint(versioned('1')(func)) != before
+        assert fingerprint(versioned('2')(func)) != fingerprint(versioned('1')(func))
+
+    @staticmethod
+    def test_method():
+        """Bound methods should be identified by their function and their instance"""
+        assert fingerprint(Scale(2).apply) == fingerprint(Scale(2).apply)
+        assert fingerprint(Scale(2).apply) != fingerprint(Scale(3).apply)
+        assert fingerprint(Scale(2).apply) != fingerprint(Scale.apply)
+
+    @staticmethod
+    def test_ext_hash():
+        """Functions nested in data should be hashed by their fingerprint"""
+        assert ext_hash({'function': lambda data: data[1]}) == ext_hash({'function': lambda data: data[1]})
+        assert ext_hash({'function': lambda data: data[1]}) != ext_hash({'function': lambda data: data[0]})
+
+
+class TestHashMemo:
+    """Test class for HashMemo and hash_memo"""
+    @staticmethod
+    def test_hashed_once(array, monkeypatch):
+        """Within a memo context, the same array object should only be hashed once"""
+        calls = []
+        monkeypatch.setattr(hashing, 'array_digest', lambda obj: calls.append(obj) or b'digest')
+        with hash_memo():
+            ext_hash((array, 1))
+            ext_hash((array, 2))
+        assert len(calls) == 1
+
+    @staticmethod
+    def test_scope(array, monkeypatch):
+        """Memoized digests should be discarded when the outermost context exits"""
+        calls = []
+        monkeypatch.setattr(hashing, 'array_digest', lambda obj: calls.append(obj) or b'digest')
+        with hash_memo():
+            with hash_memo():
+                ext_hash(array)
+            ext_hash(array)
+        ext_hash(array)
+        assert len(calls) == 2
+
+    @staticmethod
+    def test_invalidate_flags(array):
+        """Changing the writeable flag of an array should invalidate its entry"""
+        with hash_memo() as memo:
+            before = ext_hash(array)
+            array.flags.writeable = False
+            assert memo.get(array, ExactHash().mode) is None
+            assert ext_hash(array) == before
+
+    @staticmethod
+    def test_modified(array):
+        """In-place modifications of sampled elements should invalidate the entry, without changing the flags"""
+        with hash_memo() as memo:
+            before = ext_hash(array)
+            assert array.flags.writeable
+            array[0, 0] += 1.
+            assert memo.get(array, ExactHash().mode) is None
+            assert ext_hash(array) != before
+
+    @staticmethod
+    @pytest.mark.parametrize('fmt', ['lil', 'dok', 'dia'])
+    def test_sparse_formats(fmt):
+        """Sparse matrices whose modifications cannot be detected should not be memoized"""
+        matrix = sp.eye(8, format=fmt)
+        with hash_memo() as memo:
+            before = ext_hash(matrix)
+            if fmt == 'dia':
+                matrix.data[0, 3] = 2.
+            else:
+                matrix[3, 3] = 2.
+            assert memo.get(matrix, ExactHash().mode) is None
+            assert ext_hash(matrix) != before
+
+    @staticmethod
+    def test_freeze(array):
+        """With freeze, hashed arrays should be read-only within the context, and writeable again after it exits"""
+        view = array[1:]
+        with hash_memo(freeze=True):
+            ext_hash(array)
+            ext_hash(view)
+            with pytest.raises(ValueError):
+                array[0] = 1.
+            with pytest.raises(ValueError):
+                view[0] = 1.
+        assert array.flags.writeable and view.flags.writeable
+
+    @staticmethod
+    def test_weakref(array):
+        """Entries should be dropped when the array is garbage collected"""
+        with hash_memo() as memo:
+            ext_hash(array.copy())
+            assert not memo
+
+
+class TestFileBacked:
+    """Test class for hashing HDF5 datasets and memory-maps"""
+    @staticmethod
+    def test_dataset_content(array, tmp_path, monkeypatch):
+        """HDF5 datasets should be streamed and hash like their loaded arrays"""
+        monkeypatch.setattr(hashing, 'CHUNK_SIZE', 1000)
+        with h5py.File(tmp_path / 'data.h5', 'w') as fd:
+            fd['data'] = array
+            assert ext_hash(fd['data']) == ext_hash(array)
+            fd['string'] = 'text'
+            assert ext_hash(fd['string']) == ext_hash(fd['string'])
+
+    @staticmethod
+    @pytest.mark.parametrize('block_size', [100, 1000])
+    def test_dataset_tree(array, tmp_path, monkeypatch, block_size):
+        """In tree-mode, HDF5 datasets and their lazy proxies should tree-hash like their loaded arrays"""
+        monkeypatch.setattr(hashing, 'BLOCK_SIZE', block_size)
+        strategy = ExactHash(tree=True, workers=3)
+        with h5py.File(tmp_path / 'data.h5', 'w') as fd:
+            fd['data'] = array
+            key = ext_hash(array, strategy)
+            assert key != ext_hash(array)
+            assert ext_hash(fd['data'], strategy) == key
+            assert ext_hash(DatasetProxy(fd['data']), strategy) == key
+            fd['small'] = array[:1, :1]
+            assert ext_hash(fd['small'], strategy) == ext_hash(array[:1, :1])
+
+    @staticmethod
+    def test_dataset_file_keys(array, tmp_path):
+        """With file keys, HDF5 datasets should be hashed by their file, name and checksum attribute"""
+        with h5py.File(tmp_path / 'data.h5', 'w') as fd:
+            fd['data'] = array
+            fd['other'] = array
+            key = ext_hash(fd['data'], ExactHash(file_keys=True))
+            assert key != ext_hash(fd['data'])
+            assert key != ext_hash(fd['other'], ExactHash(file_keys=True))
+            fd['data'].attrs[hashing.CHECKSUM_ATTR] = 42
+            assert key != ext_hash(fd['data'], ExactHash(file_keys=True))
+
+    @staticmethod
+    def test_memmap_file_keys(array, tmp_path):
+        """With file keys, memory-maps should be hashed by their file and offset"""
+        np.save(tmp_path / 'data.npy', array)
+        mapped = np.load(tmp_path / 'data.npy', mmap_mode='r')
+        assert ext_hash(mapped) == ext_hash(array)
+        strategy = ExactHash(file_keys=True)
+        key = ext_hash(mapped, strategy)
+        assert key != ext_hash(mapped)
+        assert key == ext_hash(np.load(tmp_path / 'data.npy', mmap_mode='r'), strategy)
+        assert ext_hash(mapped[1:], strategy) not in (key, ext_hash(mapped[2:], strategy))
+        np.save(tmp_path / 'data.npy', array[::-1])
+        assert key != ext_hash(np.load(tmp_path / 'data.npy', mmap_mode='r'), strategy)
+
+    @staticmethod
+    def test_in_memory_file(array):
+        """Datasets of files without a path should fall back to content hashing"""
+        with BytesIO() as buf, h5py.File(buf, 'w') as fd:
+            fd['data'] = array
+            assert ext_hash(fd['data'], ExactHash(file_keys=True)) == ext_hash(array)
@@ -0,0 +1,63 @@
+"""Test module for corelay/io/index.py"""
+from io import BytesIO
+
+import pytest
+import numpy as np
+import h5py
+
+from corelay.io.index import MemoIndex, IndexEntry, group_size
+
+
+class TestMemoIndex:
+    """Test class for MemoIndex"""
+    @staticmethod
+    def test_lru():
+        """LRU eviction should evict the least recently used entries first"""
+        index = MemoIndex('lru')
+        for n, key in enumerate('abc'):
+            index.add(key, IndexEntry(size=10, created=n, accessed=n, cost=1.))
+        index.touch('a')
+        assert index.total == 30
+        assert not index.victims(30)
+        assert index.victims(15) == ['b', 'c']
+        assert index.victims(15, exclude=('b',)) == ['c', 'a']
+
+    @staticmethod
+    def test_cost():
+        """Cost-aware eviction should evict the entries with the lowest cost per byte first"""
+        index = MemoIndex('cost')
+        index.add('cheap', IndexEntry(size=100, created=0, accessed=0, cost=1.))
+        index.add('expensive', IndexEntry(size=10, created=0, accessed=0, cost=5.))
+        index.add('large', IndexEntry(size=1000, created=0, accessed=0, cost=5.))
+        assert index.victims(200) == ['large']
+        assert index.victims(5) == ['large', 'cheap', 'expensive']
+
+    @staticmethod
+    def test_remove():
+        """Removing entries should update the total size"""
+        index = MemoIndex()
+        index.add('a', IndexEntry(size=10, created=0, accessed=0, cost=0.))
+        assert index.remove('a').size == 10
+        assert index.remove('a') is None
+        assert index.total == 0 and 'a' not in index
+
+    @staticmethod
+    def test_load():
+        """Entries should be loaded from group attributes, and their size computed if missing"""
+        with BytesIO() as buf, h5py.File(buf, 'w') as fd:
+            fd.create_group('old')['data'] = np.zeros(8)
+            group = fd.create_group('new')
+            group['data'] = np.zeros(4)
+            IndexEntry(size=32, created=1., accessed=2., cost=3.).to_group(group)
+            index = MemoIndex()
+            index.load(fd)
+            assert list(index.entries) == ['old', 'new']
+            assert index['old'].size == group_size(fd['old']) == 64
+            assert index['new'].cost == 3.
+            assert index.total == 96
+
+    @staticmethod
+    def test_invalid():
+        """Unsupported eviction policies should raise a ValueError"""
+        with pytest.raises(ValueError):
+            MemoIndex('fifo')
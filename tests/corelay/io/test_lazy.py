@@ -0,0 +1,105 @@
+"""Test module for corelay/io/lazy.py"""
+from io import BytesIO
+
+import pytest
+import numpy as np
+import h5py
+
+from corelay.io.lazy import DatasetProxy, GroupView, lazy_dataset, memmap_dataset
+from corelay.io.hashing import ext_hash
+
+
+@pytest.fixture
+def array():
+    """Return a random array of shape (16, 8)."""
+    return np.random.default_rng(0xDEADBEEF).normal(size=(16, 8))
+
+
+class TestLazyDataset:
+    """Test class for lazy_dataset"""
+    @staticmethod
+    def test_memmap(array, tmp_path):
+        """Contiguous datasets in files on disk should be memory-mapped read-only"""
+        with h5py.File(tmp_path / 'data.h5', 'w') as fd:
+            fd['data'] = array
+            result = lazy_dataset(fd['data'])
+            assert isinstance(result, np.memmap)
+            assert not result.flags.writeable
+            assert np.array_equal(result, array)
+
+    @staticmethod
+    @pytest.mark.parametrize('kwargs', [{'chunks': (4, 8)}, {'compression': 'gzip'}])
+    def test_proxy(array, tmp_path, kwargs):
+        """Chunked or compressed datasets should be proxied"""
+        with h5py.File(tmp_path / 'data.h5', 'w') as fd:
+            fd.create_dataset('data', data=array, **kwargs)
+            result = lazy_dataset(fd['data'])
+            assert memmap_dataset(fd['data']) is None
+            assert isinstance(result, DatasetProxy)
+            assert result.shape == array.shape
+            assert np.array_equal(result[:, 1], array[:, 1])
+            assert np.array_equal(np.asarray(result), array)
+
+    @staticmethod
+    def test_in_memory_file(array):
+        """Datasets of in-memory files should be proxied"""
+        with BytesIO() as buf, h5py.File(buf, 'w') as fd:
+            fd['data'] = array
+            assert isinstance(lazy_dataset(fd['data']), DatasetProxy)
+
+    @staticmethod
+    def test_scalar():
+        """Scalar datasets should be read directly"""
+        with BytesIO() as buf, h5py.File(buf, 'w') as fd:
+            fd['data'] = 3
+            assert lazy_dataset(fd['data']) == 3
+
+    @staticmethod
+    def test_hash(array):
+        """Proxies should hash the same as their content"""
+        with BytesIO() as buf, h5py.File(buf, 'w') as fd:
+            fd['data'] = array
+            assert ext_hash(DatasetProxy(fd['data'])) == ext_hash(array)
+
+    @staticmethod
+    @pytest.mark.parametrize('key', [
+        (), 3, -1, slice(None), slice(2, 100), slice(None, None, -2), [4, 1, 1], np.arange(10) % 3 == 0,
+        (Ellipsis, 2), (slice(1, 4), 2),
+    ])
+    def test_length(array, key):
+        """Proxies limited to the first rows should only expose, read and hash those rows"""
+        with BytesIO() as buf, h5py.File(buf, 'w') as fd:
+            fd['data'] = array
+            proxy = DatasetProxy(fd['data'], length=10)
+            assert proxy.shape == (10, 8)
+            assert len(proxy) == 10
+            assert proxy.size == 80
+            np.testing.assert_equal(proxy[key], array[:10][key])
+            np.testing.assert_equal(np.asarray(proxy), array[:10])
+            assert ext_hash(proxy) == ext_hash(array[:10])
+            with pytest.raises(IndexError):
+                proxy[10]  # pylint: disable=pointless-statement
+
+
+class TestGroupView:
+    """Test class for GroupView"""
+    @staticmethod
+    def test_view(array):
+        """Views should list keys without reading data, and return subgroups as views and datasets as proxies"""
+        with BytesIO() as buf, h5py.File(buf, 'w') as fd:
+            fd['analysis/embedding'] = array
+            fd['analysis/name'] = 'spectral'
+            fd['analysis/clustering/0'] = np.arange(4)
+            view = GroupView(fd['analysis'])
+            assert sorted(view) == ['clustering', 'embedding', 'name']
+            assert 'embedding' in view and 'missing' not in view
+            assert len(view) == 3
+            assert view['name'] == 'spectral'
+            assert isinstance(view['embedding'], DatasetProxy)
+            assert np.array_equal(view['embedding'][2:4], array[2:4])
+            assert isinstance(view['clustering'], GroupView)
+            assert list(view['clustering']) == [0]
+            assert 0 in view['clustering']
+            assert np.array_equal(view['clustering'][0][:], np.arange(4))
+            with pytest.raises(KeyError):
+                _ = view['missing']
@@ -0,0 +1,186 @@
+"""Test module for corelay/io/maintenance.py"""
+import os
+import time
+from io import BytesIO
+
+import pytest
+import numpy as np
+import h5py
+from scipy import sparse as sp
+from click.testing import CliRunner
+
+from corelay.io.storage import HashedHDF5
+from corelay.io.hashing import ExactHash, TolerantHash, SampledHash
+from corelay.io.maintenance import repack, deduplicate, prune, usage, stored_size, migrate, main
+from corelay.processor.base import FunctionProcessor
+
+
+def _square(data):
+    """Square the data."""
+    return data ** 2
+
+
+def _cube(data):
+    """Cube the data."""
+    return data ** 3
+
+
+def _step(offset):
+    """Return a function adding `offset` to the data, whose name is the same for all offsets."""
+    def step(data):
+        return data + offset
+    return step
+
+
+_first = _step(1)
+_second = _step(-1)
+
+
+def _fill(path):
+    """Write two identical and one distinct output to the memo file `path`."""
+    with h5py.File(path, 'w') as fd:
+        storage = HashedHDF5(fd.require_group('hashed'))
+        labels = np.arange(4096) % 7
+        storage.write(labels, data_in=1, meta={'name': 'KMeans', 'n_clusters': 2})
+        storage.write(labels.copy(), data_in=1, meta={'name': 'KMeans', 'n_clusters': 3})
+        storage.write(np.ones(4096), data_in=1, meta={'name': 'FunctionProcessor', 'function': _square})
+
+
+class TestMaintenance:
+    """Test class for the memo file maintenance functions"""
+    @staticmethod
+    def test_deduplicate(tmp_path):
+        """Entries with identical outputs should share their data, which should reclaim space after repacking"""
+        path = tmp_path / 'memo.h5'
+        _fill(path)
+        with h5py.File(path, 'r+') as fd:
+            before = stored_size(fd['hashed'])
+            assert len(deduplicate(fd['hashed'], dry_run=True)) == 1
+            assert stored_size(fd['hashed']) == before
+            relinked = deduplicate(fd['hashed'])
+            assert len(relinked) == 1
+            assert not deduplicate(fd['hashed'])
+            assert stored_size(fd['hashed']) < before
+            key, original = relinked[0]
+            assert np.array_equal(fd['hashed'][key]['data'][()], fd['hashed'][original]['data'][()])
+        size, repacked = repack(path)
+        assert repacked < size
+        with h5py.File(path, 'r') as fd:
+            rows = {row.name: row for row in usage(fd['hashed'])}
+        assert rows['KMeans'].entries == 2
+        assert rows['KMeans'].shared == 2
+        assert rows['FunctionProcessor'].shared == 0
+
+    @staticmethod
+    @pytest.mark.parametrize('strategy', [SampledHash(n_samples=4), TolerantHash(), ExactHash(file_keys=True)])
+    def test_deduplicate_inexact(strategy):
+        """Entries whose output hashes do not identify their content should never be relinked"""
+        with BytesIO() as buf, h5py.File(buf, 'w') as fd:
+            storage = HashedHDF5(fd.require_group('hashed'), strategy=strategy)
+            data = np.linspace(0., 1., 4096)
+            other = data.copy()
+            other[1] += 1e-9
+            storage.write(data, data_in=1, meta=1)
+            storage.write(other, data_in=2, meta=1)
+            assert not deduplicate(fd['hashed'])
+            assert np.array_equal(storage.read(data_in=2, meta=1), other)
+
+    @staticmethod
+    def test_deduplicate_sparse():
+        """Sparse outputs with the same values in different formats should not be relinked"""
+        matrix = sp.random(64, 64, density=0.1, format='csr', random_state=0)
+        with BytesIO() as buf, h5py.File(buf, 'w') as fd:
+            storage = HashedHDF5(fd.require_group('hashed'))
+            storage.write(matrix, data_in=1, meta=1)
+            storage.write(matrix.tocoo(), data_in=2, meta=1)
+            storage.write(matrix.copy(), data_in=3, meta=1)
+            assert len(deduplicate(fd['hashed'])) == 1
+            assert storage.read(data_in=1, meta=1).format == 'csr'
+            assert storage.read(data_in=2, meta=1).format == 'coo'
+
+    @staticmethod
+    def test_prune(tmp_path):
+        """Entries created before a date, or computed by other versions of functions, should be deleted"""
+        path = tmp_path / 'memo.h5'
+        _fill(path)
+        with h5py.File(path, 'r+') as fd:
+            base = fd['hashed']
+            assert not prune(base, before=time.time() - 3600.)
+            assert not prune(base, functions=[_square, _cube])
+            # change the code of the function, as if it was edited since its output was written
+            code, _square.__code__ = _square.__code__, _cube.__code__
+            try:
+                processor = FunctionProcessor(function=_square)
+                assert len(prune(base, functions=[processor], dry_run=True)) == 1
+                assert len(prune(base, functions=[processor])) == 1
+            finally:
+                _square.__code__ = code
+            assert len(prune(base, before=time.time() + 3600.)) == 2
+            assert len(base) == 0
+
+    @staticmethod
+    def test_prune_shared_name(tmp_path):
+        """Entries of functions sharing their name with other current functions, e.g. lambdas or functions created by
+        the same factory, should not be pruned"""
+        path = os.fspath(tmp_path / 'memo.h5')
+        with h5py.File(path, 'w') as fd:
+            base = fd.require_group('hashed')
+            HashedHDF5(base).write(np.ones(2), data_in=1, meta={'function': _first})
+            assert not prune(base, functions=[_first, _second])
+            assert not prune(base, functions=[_second, _first])
+        functions = ['--function', f'{__name__}:_first', '--function', f'{__name__}:_second']
+        result = CliRunner().invoke(main, ['prune', path] + functions)
+        assert result.exit_code == 0, result.output
+        assert result.output.startswith('0 entries deleted')
+        with h5py.File(path, 'r+') as fd:
+            assert len(prune(fd['hashed'], functions=[_second])) == 1
+
+    @staticmethod
+    def test_migrate(tmp_path):
+        """Migrating should move all entries into the sharded layout and back, without changing their outputs"""
+        path = tmp_path / 'memo.h5'
+        _fill(path)
+        with h5py.File(path, 'r+') as fd:
+            base = fd['hashed']
+            keys = sorted(base)
+            assert migrate(base, shards=2) == 3
+            assert migrate(base, shards=2) == 0
+            assert all(f'{key[:2]}/{key[2:4]}/{key}' in base for key in keys)
+            assert len(deduplicate(base)) == 1
+            storage = HashedHDF5(base)
+            assert storage.shards == 2
+            labels = storage.read(data_in=1, meta={'name': 'KMeans', 'n_clusters': 3})
+            assert np.array_equal(labels, np.arange(4096) % 7)
+            assert migrate(base, shards=0) == 3
+            assert sorted(base) == keys
+            assert {row.name for row in usage(base)} == {'KMeans', 'FunctionProcessor'}
+
+    @staticmethod
+    def test_repack_output(tmp_path):
+        """Repacking into another file should keep the original file and all entries"""
+        path = tmp_path / 'memo.h5'
+        _fill(path)
+        repack(path, tmp_path / 'packed.h5')
+        with h5py.File(path, 'r') as fd, h5py.File(tmp_path / 'packed.h5', 'r') as packed:
+            assert sorted(fd['hashed']) == sorted(packed['hashed'])
+
+    @staticmethod
+    def test_cli(tmp_path):
+        """The command line interface should report usage and maintain the file"""
+        path = os.fspath(tmp_path / 'memo.h5')
+        _fill(path)
+        runner = CliRunner()
+        result = runner.invoke(main, ['usage', path])
+        assert result.exit_code == 0, result.output
+        assert 'KMeans' in result.output
+        result = runner.invoke(main, ['dedup', path])
+        assert result.exit_code == 0, result.output
+        assert result.output.startswith('1 entries relinked')
+        result = runner.invoke(main, ['prune', path, '--function', f'{__name__}:_square'])
+        assert result.exit_code == 0, result.output
+        assert result.output.startswith('0 entries deleted')
+        result = runner.invoke(main, ['migrate', path, '--shards', '1'])
+        assert result.exit_code == 0, result.output
+        assert result.output.startswith('3 entries moved')
+        result = runner.invoke(main, ['repack', path])
+        assert result.exit_code == 0, result.output
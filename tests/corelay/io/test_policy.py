@@ -0,0 +1,70 @@
+"""Test module for corelay/io/policy.py"""
+from io import BytesIO
+
+import pytest
+import numpy as np
+import h5py
+
+from corelay.io.policy import WritePolicy
+
+
+@pytest.fixture
+def array():
+    """Return a random float64 array of shape (32, 16)."""
+    return np.random.default_rng(0xDEADBEEF).normal(size=(32, 16))
+
+
+class TestWritePolicy:
+    """Test class for WritePolicy"""
+    @staticmethod
+    def test_default(array):
+        """The default policy should write contiguous, uncompressed datasets at the original precision"""
+        with BytesIO() as buf, h5py.File(buf, 'w') as fd:
+            dataset = WritePolicy().create_dataset(fd, 'data', array)
+            assert dataset.chunks is None
+            assert dataset.compression is None
+            assert dataset.dtype == array.dtype
+
+    @staticmethod
+    @pytest.mark.parametrize('compression', ['gzip', 'lzf'])
+    def test_filters(array, compression):
+        """Filters should be applied losslessly"""
+        with BytesIO() as buf, h5py.File(buf, 'w') as fd:
+            dataset = WritePolicy(compression=compression, shuffle=True).create_dataset(fd, 'data', array)
+            assert dataset.compression == compression
+            assert dataset.shuffle
+            assert np.array_equal(dataset[()], array)
+
+    @staticmethod
+    @pytest.mark.parametrize('chunks, expected', [((8, 4), (8, 4)), ((64, 4), (32, 4)), ((8,), None)])
+    def test_chunks(array, chunks, expected):
+        """Chunks should be clipped to the array, and guessed if their dimensions do not match"""
+        with BytesIO() as buf, h5py.File(buf, 'w') as fd:
+            dataset = WritePolicy(chunks=chunks).create_dataset(fd, 'data', array)
+            assert dataset.chunks is not None
+            if expected is not None:
+                assert dataset.chunks == expected
+
+    @staticmethod
+    def test_scalar():
+        """Scalars should be written without chunks or filters"""
+        with BytesIO() as buf, h5py.File(buf, 'w') as fd:
+            dataset = WritePolicy(compression='gzip').create_dataset(fd, 'data', np.array(1.))
+            assert dataset[()] == 1.
+
+    @staticmethod
+    def test_downcast(array):
+        """Only selected floating point outputs with a higher precision should be downcast"""
+        policy = WritePolicy(downcast='float32', downcast_outputs=[(1,)])
+        assert policy.prepare(array, (1,)).dtype == np.float32
+        assert policy.prepare(array, (0,)).dtype == np.float64
+        assert policy.prepare(array.astype(np.float16), (1,)).dtype == np.float16
+        assert policy.prepare(np.arange(3), (1,)).dtype == np.arange(3).dtype
+        assert WritePolicy(downcast='float16').prepare(array).dtype == np.float16
+
+    @staticmethod
+    @pytest.mark.parametrize('kwargs', [{'compression': 'szip'}, {'downcast': 'int8'}])
+    def test_invalid(kwargs):
+        """Unsupported compressions or downcast types should raise a ValueError"""
+        with pytest.raises(ValueError):
+            WritePolicy(**kwargs)
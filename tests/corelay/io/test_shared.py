@@ -0,0 +1,74 @@
+"""Test module for corelay/io/shared.py"""
+import random
+import multiprocessing
+
+import pytest
+import numpy as np
+import h5py
+
+from corelay import io
+from corelay.io.hashing import ext_hash
+from corelay.io.shared import SharedHashedHDF5
+
+
+N_KEYS = 24
+
+
+def _expected(key):
+    """Return the output expected for the input `key`."""
+    return np.full((64, 8), float(key))
+
+
+def _worker(args):
+    """Read all keys in random order, computing and writing the missing ones, and return the number of misses."""
+    path, seed = args
+    storage = SharedHashedHDF5(path, index=True)
+    keys = list(range(N_KEYS))
+    random.Random(seed).shuffle(keys)
+    misses = 0
+    for key in keys:
+        try:
+            data = storage.read(data_in=key, meta='stress')
+        except io.NoDataSource:
+            misses += 1
+            data = _expected(key)
+            storage.write(data, data_in=key, meta='stress')
+        assert np.array_equal(data, _expected(key))
+    return misses
+
+
+class TestSharedHashedHDF5:
+    """Test class for SharedHashedHDF5"""
+    @staticmethod
+    def test_missing_file(tmp_path):
+        """Reading from a file which does not exist yet should raise NoDataSource"""
+        storage = SharedHashedHDF5(tmp_path / 'memo.h5', index=True)
+        with pytest.raises(io.NoDataSource):
+            storage.read(data_in=1, meta=1)
+
+    @staticmethod
+    def test_reopen_on_miss(tmp_path):
+        """Outputs written by another instance should be read, even if missing in the index"""
+        reader = SharedHashedHDF5(tmp_path / 'memo.h5', index=True)
+        writer = SharedHashedHDF5(tmp_path / 'memo.h5')
+        writer.write(_expected(1), data_in=1, meta=1)
+        assert np.array_equal(reader.read(data_in=1, meta=1), _expected(1))
+        writer.write(_expected(2), data_in=1, meta=1)
+        assert np.array_equal(reader.read(data_in=1, meta=1), _expected(1))
+
+    @staticmethod
+    def test_lazy(tmp_path):
+        """Lazy reads should raise a ValueError"""
+        with pytest.raises(ValueError):
+            SharedHashedHDF5(tmp_path / 'memo.h5', lazy=True)
+
+    @staticmethod
+    def test_stress(tmp_path):
+        """Concurrent processes should share their outputs, which are written exactly once"""
+        path = str(tmp_path / 'memo.h5')
+        n_procs = 8
+        with multiprocessing.get_context('spawn').Pool(n_procs) as pool:
+            misses = pool.map(_worker, [(path, seed) for seed in range(n_procs)])
+        assert N_KEYS <= sum(misses) < N_KEYS * n_procs
+        with h5py.File(path, 'r') as fd:
+            assert set(fd['hashed']) == {ext_hash((key, 'stress')) for key in range(N_KEYS)}
@@ -0,0 +1,153 @@
+"""Test module for corelay/io/sqlite.py"""
+import os
+import multiprocessing
+
+import pytest
+import numpy as np
+from scipy import sparse as sp
+
+from corelay import io
+from corelay.io.sqlite import SQLiteStorage
+from corelay.io.keys import read_many
+from corelay.processor.base import FunctionProcessor
+
+
+def _writer(path):
+    """Write the same entries as other processes."""
+    storage = SQLiteStorage(path)
+    with storage.transaction():
+        for key in range(16):
+            storage.write(np.full(32, key), data_in=key, meta='concurrent')
+    storage.close()
+
+
+def _double(data):
+    """Double the data."""
+    return data * 2
+
+
+@pytest.fixture
+def data():
+    """Return a tuple hierarchy of arrays and a sparse matrix."""
+    return (
+        np.asfortranarray(np.random.default_rng(0).normal(size=(10, 3))),
+        (np.arange(4, dtype=np.int16), sp.random(8, 6, density=0.3, format='csr', random_state=0)),
+        np.empty((0, 2)),
+    )
+
+
+class TestSQLiteStorage:
+    """Test class for SQLiteStorage"""
+    @staticmethod
+    def test_round_trip(tmp_path, data):
+        """Tuple hierarchies should be read back as read-only arrays with the same dtypes and content"""
+        with SQLiteStorage(tmp_path / 'memo.db') as storage:
+            storage.write(data, data_in=1, meta={'name': 'test'})
+            first, (second, third), fourth = storage.read(data_in=1, meta={'name': 'test'})
+        assert not first.flags.writeable
+        assert np.array_equal(first, data[0])
+        assert second.dtype == np.int16 and np.array_equal(second, data[1][0])
+        assert third.format == 'csr' and (third != data[1][1]).nnz == 0
+        assert fourth.shape == (0, 2)
+        assert not os.path.exists(tmp_path / 'memo.db-spill')
+
+    @staticmethod
+    def test_spill(tmp_path, data):
+        """Outputs above the spill threshold should be stored as memory-mapped .npy files"""
+        with SQLiteStorage(tmp_path / 'memo.db', spill=64) as storage:
+            storage.write(data, data_in=1, meta=1)
+            storage.write(np.arange(4, dtype=np.uint8), data_in=2, meta=1)
+            first, _, _ = storage.read(data_in=1, meta=1)
+            assert isinstance(first, np.memmap)
+            assert np.array_equal(first, data[0])
+            assert np.array_equal(storage.read(data_in=2, meta=1), np.arange(4))
+        assert len(os.listdir(tmp_path / 'memo.db-spill')) == 1
+
+    @staticmethod
+    def test_spill_existing(tmp_path, data, monkeypatch):
+        """Spilled outputs should not be packed, and not be spilled again if their entry exists"""
+        def _unpacked(*_):
+            raise AssertionError('Spilled outputs should not be packed!')
+
+        monkeypatch.setattr('corelay.io.sqlite._pack', _unpacked)
+        with SQLiteStorage(tmp_path / 'memo.db', spill=64) as storage:
+            key = storage.key(data_in=1, meta=1)
+            storage.write_key(data, key)
+            storage.write_key(data, key)
+            # as if another process wrote the entry after it was checked
+            monkeypatch.setattr(storage, 'contains_key', lambda key: False)
+            storage.write_key(data, key)
+            first, _, _ = storage.read_key(key)
+            assert np.array_equal(first, data[0])
+        assert len(os.listdir(tmp_path / 'memo.db-spill' / key.digest[:2])) == 1
+
+    @staticmethod
+    def test_transaction(tmp_path):
+        """Writes within a transaction should only be visible to other connections after it is committed, and be
+        discarded if it raises"""
+        writer = SQLiteStorage(tmp_path / 'memo.db')
+        reader = SQLiteStorage(tmp_path / 'memo.db', mode='r')
+        with writer.transaction():
+            writer.write(np.zeros(2), data_in=1, meta=1)
+            with writer.transaction():
+                writer.write(np.ones(2), data_in=2, meta=1)
+            assert not reader.contains_key(reader.key(data_in=1, meta=1))
+        assert len(reader.keys()) == 2
+        with pytest.raises(RuntimeError):
+            with writer.transaction():
+                writer.write(np.zeros(2), data_in=3, meta=1)
+                raise RuntimeError()
+        assert len(reader.keys()) == 2
+        with pytest.raises(OSError):
+            reader.write(np.zeros(2), data_in=3, meta=1)
+        writer.close()
+        reader.close()
+
+    @staticmethod
+    def test_read_many(tmp_path, monkeypatch):
+        """Multiple keys should be probed and read in batches of queries"""
+        monkeypatch.setattr('corelay.io.sqlite.BATCH_SIZE', 2)
+        with SQLiteStorage(tmp_path / 'memo.db', spill=16) as storage:
+            keys = [storage.key(data_in=n, meta=1) for n in range(5)]
+            for n in (0, 1, 3):
+                storage.write_key(np.full(n + 1, n), keys[n])
+            assert storage.contains_many(keys) == {keys[n].digest for n in (0, 1, 3)}
+            outputs = read_many(storage, keys)
+            assert sorted(outputs) == [0, 1, 3]
+            assert isinstance(outputs[3], np.memmap)
+            for n, output in outputs.items():
+                assert np.array_equal(output, np.full(n + 1, n))
+
+    @staticmethod
+    def test_data_key(tmp_path):
+        """Entries should be addressable by data key like other storages"""
+        with SQLiteStorage(tmp_path / 'memo.db') as storage:
+            storage.at(data_key='labels').write(np.arange(3))
+            assert 'labels' in storage
+            assert 'other' not in storage
+            assert np.array_equal(storage['labels'], np.arange(3))
+            with pytest.raises(io.NoDataSource):
+                _ = storage['other']
+
+    @staticmethod
+    def test_memo(tmp_path):
+        """Processors should use the database as memo store"""
+        with SQLiteStorage(tmp_path / 'memo.db') as storage:
+            processor = FunctionProcessor(function=_double, io=storage)
+            computed = processor(np.arange(3))
+            stored = processor(np.arange(3))
+        assert computed.flags.writeable
+        assert not stored.flags.writeable
+        assert np.array_equal(stored, np.arange(3) * 2)
+
+    @staticmethod
+    def test_concurrent(tmp_path):
+        """Concurrent processes should write the same entries without errors"""
+        path = os.fspath(tmp_path / 'memo.db')
+        SQLiteStorage(path).close()
+        context = multiprocessing.get_context('spawn')
+        with context.Pool(4) as pool:
+            pool.map(_writer, [path] * 4)
+        with SQLiteStorage(path, mode='r') as storage:
+            assert len(storage.keys()) == 16
+            assert np.array_equal(storage.read(data_in=3, meta='concurrent'), np.full(32, 3))
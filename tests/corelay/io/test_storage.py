@@ -1,14 +1,22 @@
 """Test io functionalities
 
 """
+import os
+import json
+import pickle
 from io import BytesIO
 
 import pytest
 import numpy as np
 import h5py
+from scipy import sparse as sp
 
 from corelay import io
+from corelay.io.hashing import ext_hash, hash_memo, SampledHash
 from corelay.io.storage import HashedHDF5
+from corelay.io.keys import read_many, contains_many
+from corelay.io.policy import WritePolicy
+from corelay.io.lazy import GroupView, DatasetProxy
 
 
 @pytest.fixture
@@ -29,6 +37,19 @@ def param_values():
 
 class TestHashedHDF5:
     """Test class for HashedHDF5"""
+    @staticmethod
+    def test_function_meta():
+        """Functions in meta should be serialized by their fingerprint, and distinguish keys"""
+        with BytesIO() as buf, h5py.File(buf, 'w') as fd:
+            iobj = HashedHDF5(fd.require_group('hashed'))
+            data_out = np.random.normal(size=5)
+            iobj.write(data_out=data_out, data_in=1, meta={'function': lambda data: data[1]})
+            assert np.allclose(iobj.read(data_in=1, meta={'function': lambda data: data[1]}), data_out)
+            with pytest.raises(io.NoDataSource):
+                iobj.read(data_in=1, meta={'function': lambda data: data[0]})
+            meta = json.loads(fd['hashed'][ext_hash((1, {'function': lambda data: data[1]}))]['meta'][()])
+            assert 'fingerprint' in meta['function']
+
     @staticmethod
     def test_write_array():
         """Writing a numpy array should raise no Exceptions"""
@@ -47,6 +68,146 @@ class TestHashedHDF5:
             iobj = HashedHDF5(group)
             iobj.write(data_out=data_out, data_in=1, meta=1)
 
+    @staticmethod
+    def test_nested_tuple():
+        """Nested tuples of arrays should be read back in the same structure"""
+        with BytesIO() as buf, h5py.File(buf, 'w') as fd:
+            iobj = HashedHDF5(fd.require_group('hashed'))
+            data_out = (np.arange(3), (np.arange(4), np.arange(5)))
+            iobj.write(data_out=data_out, data_in=1, meta=1)
+            result = iobj.read(data_in=1, meta=1)
+            assert np.array_equal(result[0], data_out[0])
+            assert all(np.array_equal(left, right) for left, right in zip(result[1], data_out[1]))
+
+    @staticmethod
+    @pytest.mark.parametrize('fmt', ['csr', 'csc', 'coo'])
+    def test_sparse(fmt):
+        """Sparse matrices, also within tuples, should be read back in their format with the same content"""
+        with BytesIO() as buf, h5py.File(buf, 'w') as fd:
+            iobj = HashedHDF5(fd.require_group('hashed'))
+            matrix = sp.random(20, 10, density=0.2, format=fmt, random_state=0)
+            iobj.write(data_out=(matrix, np.arange(3)), data_in=1, meta=1)
+            result, array = iobj.read(data_in=1, meta=1)
+            assert result.format == fmt
+            assert result.shape == matrix.shape
+            assert (result != matrix).nnz == 0
+            assert np.array_equal(array, np.arange(3))
+
+    @staticmethod
+    def test_sparse_unsupported():
+        """Writing a sparse matrix of an unsupported format should raise a TypeError"""
+        with BytesIO() as buf, h5py.File(buf, 'w') as fd:
+            iobj = HashedHDF5(fd.require_group('hashed'))
+            with pytest.raises(TypeError):
+                iobj.write(data_out=sp.random(5, 5, format='lil'), data_in=1, meta=1)
+
+    @staticmethod
+    def test_lazy(tmp_path):
+        """Lazy reads should return memory-maps or proxies with the stored content"""
+        data_out = (np.random.normal(size=(5, 3)), np.random.normal(size=4))
+        with h5py.File(tmp_path / 'data.h5', 'w') as fd:
+            HashedHDF5(fd.require_group('hashed')).write(data_out=data_out, data_in=1, meta=1)
+            first, second = HashedHDF5(fd['hashed'], lazy=True).read(data_in=1, meta=1)
+            assert isinstance(first, np.memmap)
+            assert np.array_equal(first[:, 1], data_out[0][:, 1])
+            assert np.array_equal(second, data_out[1])
+
+    @staticmethod
+    def test_policy():
+        """Write policies should be applied and recorded with the output"""
+        with BytesIO() as buf, h5py.File(buf, 'w') as fd:
+            policy = WritePolicy(compression='gzip', shuffle=True, downcast='float32', downcast_outputs=[(1,)])
+            iobj = HashedHDF5(fd.require_group('hashed')).with_policy(policy)
+            data_out = (np.random.normal(size=(5, 3)), np.random.normal(size=4))
+            iobj.write(data_out=data_out, data_in=1, meta=1)
+            first, second = iobj.read(data_in=1, meta=1)
+            assert first.dtype == np.float64 and np.array_equal(first, data_out[0])
+            assert second.dtype == np.float32 and np.allclose(second, data_out[1])
+            group = fd['hashed'][ext_hash((1, 1))]
+            assert group['data/000'].compression == 'gzip'
+            assert json.loads(group['policy'][()])['downcast'] == 'float32'
+
+    @staticmethod
+    def test_index():
+        """Misses should not access the file, and writes should record size and compute cost"""
+        with BytesIO() as buf, h5py.File(buf, 'w') as fd:
+            iobj = HashedHDF5(fd.require_group('hashed'), index=True)
+            with pytest.raises(io.NoDataSource):
+                iobj.read(data_in=1, meta=1)
+            iobj.write(data_out=np.zeros(16), data_in=1, meta=1)
+            key = ext_hash((1, 1))
+            assert iobj.index[key].size > 128
+            assert iobj.index[key].cost > 0.
+            assert HashedHDF5(fd['hashed'], index=True).index[key].size == iobj.index[key].size
+            del fd['hashed'][key]
+            with pytest.raises(io.NoDataSource):
+                iobj.read(data_in=1, meta=1)
+            assert key not in iobj.index
+
+    @staticmethod
+    def test_budget():
+        """Writes exceeding the budget should evict the least recently used outputs"""
+        with BytesIO() as buf, h5py.File(buf, 'w') as fd:
+            iobj = HashedHDF5(fd.require_group('hashed'), budget=1 << 20)
+            for data_in in range(3):
+                iobj.write(data_out=np.zeros(16), data_in=data_in, meta=1)
+            iobj.budget = iobj.index.total + 1
+            iobj.read(data_in=0, meta=1)
+            iobj.write(data_out=np.zeros(16), data_in=3, meta=1)
+            assert set(fd['hashed']) == {ext_hash((data_in, 1)) for data_in in (0, 2, 3)}
+            assert iobj.index.total < iobj.budget
+
+    @staticmethod
+    def test_key_protocol():
+        """Outputs should be accessible by key, and by input and meta data"""
+        with BytesIO() as buf, h5py.File(buf, 'w') as fd:
+            iobj = HashedHDF5(fd.require_group('hashed'))
+            assert isinstance(iobj, io.KeyedStorable)
+            key = iobj.key(data_in=1, meta=2)
+            assert key == io.StorageKey(ext_hash((1, 2)))
+            assert not iobj.contains_key(key)
+            iobj.write_key(np.arange(3), key)
+            assert iobj.contains_key(key)
+            assert np.array_equal(iobj.read_key(key), np.arange(3))
+            assert np.array_equal(iobj.read(data_in=1, meta=2), np.arange(3))
+            assert json.loads(fd['hashed'][key.digest]['meta'][()]) == 2
+
+    @staticmethod
+    def test_read_many():
+        """Multiple keys should be probed and read at once, returning the stored outputs by position"""
+        with BytesIO() as buf, h5py.File(buf, 'w') as fd:
+            iobj = HashedHDF5(fd.require_group('hashed'))
+            keys = [iobj.key(data_in=n, meta=1) for n in range(3)]
+            iobj.write_key(np.arange(2), keys[0])
+            iobj.write_key(np.arange(3), keys[2])
+            keys.append(keys[0])
+            assert iobj.contains_many(keys) == {keys[0].digest, keys[2].digest}
+            assert contains_many(iobj, keys) == {0, 2, 3}
+            outputs = read_many(iobj, keys)
+            assert sorted(outputs) == [0, 2, 3]
+            assert np.array_equal(outputs[3], np.arange(2))
+            assert np.array_equal(outputs[2], np.arange(3))
+            assert read_many(iobj, []) == {}
+
+    @staticmethod
+    def test_sharded():
+        """Sharded groups should store new outputs in shard groups, and read outputs of both layouts"""
+        with BytesIO() as buf, h5py.File(buf, 'w') as fd:
+            group = fd.require_group('hashed')
+            flat = HashedHDF5(group)
+            flat.write(np.zeros(2), data_in=1, meta=1)
+            iobj = HashedHDF5(group, shards=2, budget=1 << 20)
+            assert group.attrs['shard_depth'] == 2
+            assert HashedHDF5(group).shards == 2
+            key = iobj.key(data_in=2, meta=1).digest
+            iobj.write(np.ones(2), data_in=2, meta=1)
+            assert f'{key[:2]}/{key[2:4]}/{key}' in group
+            assert len(iobj.index) == 2
+            assert np.array_equal(iobj.read(data_in=1, meta=1), np.zeros(2))
+            assert np.array_equal(iobj.read(data_in=2, meta=1), np.ones(2))
+            assert iobj.evict(0) == [flat.key(data_in=1, meta=1).digest, key]
+            assert not iobj.contains_key(iobj.key(data_in=2, meta=1))
+
     @staticmethod
     def test_write_unsupported():
         """Writing an unsupported type should raise a TypeError"""
@@ -79,6 +240,37 @@ class TestHashedHDF5:
             loaded = iobj.read(data_in=1, meta=1)
             assert all((out == load).all() for out, load in zip(data_out, loaded))
 
+    @staticmethod
+    def test_provenance():
+        """Outputs read and written in provenance mode should be hashed by their key instead of their content"""
+        with BytesIO() as buf, h5py.File(buf, 'w') as fd:
+            group = fd.require_group('hashed')
+            data_out = (np.random.normal(size=5), np.random.normal(size=3))
+            iobj = HashedHDF5(group, provenance=True)
+            with hash_memo():
+                iobj.write(data_out=data_out, data_in=1, meta=1)
+                written = ext_hash(data_out[1])
+                loaded = iobj.read(data_in=1, meta=1)
+                assert ext_hash(loaded[1]) == written
+                assert written != ext_hash(data_out[0])
+            assert ext_hash(data_out[1]) != written
+
+    @staticmethod
+    def test_strategy():
+        """Outputs written with different strategies should not collide, and their strategy should be recorded"""
+        with BytesIO() as buf, h5py.File(buf, 'w') as fd:
+            group = fd.require_group('hashed')
+            data_in = np.random.normal(size=5)
+            iobj = HashedHDF5(group)
+            sampled = iobj.with_strategy(SampledHash())
+            iobj.write(data_out=np.zeros(2), data_in=data_in, meta=1)
+            sampled.write(data_out=np.ones(2), data_in=data_in, meta=1)
+            assert len(group) == 2
+            assert (iobj.read(data_in=data_in, meta=1) == 0).all()
+            assert (sampled.read(data_in=data_in, meta=1) == 1).all()
+            strategies = {json.loads(entry['strategy'][()])['name'] for entry in group.values()}
+            assert strategies == {'exact', 'sampled'}
+
 
 @pytest.mark.parametrize("storage", [io.HDF5Storage, io.PickleStorage])
 def test_data_storage_at_functionality(storage, tmp_path):
@@ -145,6 +337,97 @@ def test_data_storage(storage, tmp_path, data, param_values):
         np.testing.assert_equal(ret_data, data)
 
 
+def test_hdf5_storage_policy(tmp_path, data):
+    """Test HDF5Storage writing with a write policy per key.
+
+    """
+    policy = WritePolicy(chunks=(5, 2), compression='lzf', downcast='float32', downcast_outputs=['low'])
+    with io.HDF5Storage(tmp_path / "test.file", mode='w') as data_storage:
+        data_storage.at(data_key='data', policy=policy).write({'low': data, 'high': data, 'name': 'spiral'})
+        data_storage.at(data_key='plain').write(data)
+        result = data_storage.at(data_key='data').read()
+        assert result['low'].dtype == np.float32
+        np.testing.assert_allclose(result['low'], data, rtol=1e-6)
+        np.testing.assert_equal(result['high'], data)
+        assert result['name'] == 'spiral'
+        assert data_storage.io['data/high'].chunks == (5, 2)
+        assert json.loads(data_storage.io['data/high'].attrs['write_policy'])['compression'] == 'lzf'
+        assert data_storage.io['plain'].compression is None
+
+
+def test_hdf5_storage_lazy(tmp_path, data):
+    """Test HDF5Storage returning lazy views of groups and datasets.
+
+    """
+    with io.HDF5Storage(tmp_path / "test.file", mode='w') as data_storage:
+        data_storage.at(data_key='analysis').write({'embedding': data, 'name': 'spiral'})
+        data_storage.at(data_key='plain').write(data)
+        data_storage.at(data_key='labels').write((data[:, 0], data[:, 1]))
+    with io.HDF5Storage(tmp_path / "test.file", mode='r') as data_storage:
+        lazy = data_storage.at(lazy=True)
+        analysis = lazy['analysis']
+        assert isinstance(analysis, GroupView)
+        assert sorted(analysis) == ['embedding', 'name']
+        assert analysis['name'] == 'spiral'
+        np.testing.assert_equal(analysis['embedding'][3:5], data[3:5])
+        assert isinstance(lazy['plain'], DatasetProxy)
+        np.testing.assert_equal(lazy['labels'][1][:], data[:, 1])
+        assert 'plain' in lazy
+        assert isinstance(data_storage['plain'], np.ndarray)
+
+
+def test_hdf5_storage_append(tmp_path):
+    """Test HDF5Storage appending rows in batches to resizable datasets.
+
+    """
+    rows = np.arange(30.).reshape(10, 3)
+    with io.HDF5Storage(tmp_path / "test.file", mode='w', batch=4, growth=2.) as data_storage:
+        stream = data_storage.at(data_key='stream')
+        for row in rows[:3]:
+            stream.append(row[None])
+        assert 'stream' not in data_storage.io
+        assert stream.exists()
+        data_storage.at(data_key='stream').append(rows[3:5])
+        dataset = data_storage.io['stream']
+        assert dataset.maxshape == (None, 3)
+        assert dataset.attrs['append_length'] == 5
+        stream.append(rows[5:9])
+        assert dataset.attrs['append_length'] == 9
+        assert len(dataset) == 10
+        stream.append(rows[9:])
+        with pytest.raises(ValueError):
+            stream.append(np.zeros((1, 4)))
+        np.testing.assert_equal(stream.read(), rows)
+        assert len(dataset) == 10
+        data_storage.at(data_key='fixed').write(rows)
+        with pytest.raises(TypeError):
+            data_storage.at(data_key='fixed').append(rows)
+        data_storage.at(data_key='tail').append(rows[:2])
+    with io.HDF5Storage(tmp_path / "test.file", mode='a') as data_storage:
+        np.testing.assert_equal(data_storage['tail'], rows[:2])
+        data_storage.at(data_key='stream').append(rows)
+    with io.HDF5Storage(tmp_path / "test.file", mode='r') as data_storage:
+        np.testing.assert_equal(data_storage['stream'], np.concatenate([rows, rows]))
+        assert len(data_storage.io['stream']) == 20
+
+
+def test_hdf5_storage_lazy_untrimmed(tmp_path):
+    """Test HDF5Storage returning lazy views of only the appended rows of untrimmed datasets.
+
+    """
+    rows = np.arange(30.).reshape(10, 3)
+    with h5py.File(tmp_path / "test.file", 'w') as fd:
+        dataset = fd.create_dataset('stream', data=np.concatenate([rows, rows]), maxshape=(None, 3), chunks=(4, 3))
+        dataset.attrs['append_length'] = 10
+    with io.HDF5Storage(tmp_path / "test.file", mode='r') as data_storage:
+        stream = data_storage.at(data_key='stream', lazy=True).read()
+        assert isinstance(stream, DatasetProxy)
+        assert stream.shape == rows.shape
+        np.testing.assert_equal(stream[-2:], rows[-2:])
+        np.testing.assert_equal(np.asarray(stream), rows)
+        assert len(data_storage.io['stream']) == 20
+
+
 def test_no_storage(data):
     """Test NoStorage instance that raises error when reading and writing.
 
@@ -154,3 +437,83 @@ def test_no_storage(data):
         data_storage.read()
     with pytest.raises(io.NoDataTarget):
         data_storage.write(data)
+
+
+class TestPickleStorage:
+    """Test class for PickleStorage"""
+    @staticmethod
+    def test_index(tmp_path, monkeypatch):
+        """Reads should only unpickle the requested record, using the sidecar index"""
+        path = tmp_path / 'test.pickle'
+        with io.PickleStorage(path, mode='w') as storage:
+            for n in range(3):
+                storage.at(data_key=f'key{n}').write(np.full(4, n))
+            storage.at(data_key='key1').write(np.full(4, 10))
+        loads = []
+        monkeypatch.setattr(pickle, 'load', lambda fd: loads.append(fd) or pickle.Unpickler(fd).load())
+        with io.PickleStorage(path, mode='r') as storage:
+            assert sorted(storage.keys()) == ['key0', 'key1', 'key2']
+            assert not loads
+            assert (storage['key1'] == 10).all()
+            assert len(loads) == 1
+
+    @staticmethod
+    def test_legacy_file(tmp_path):
+        """Records appended without updating the index should be indexed when the file is opened"""
+        path = tmp_path / 'test.pickle'
+        with open(path, 'wb') as fd:
+            for n in range(3):
+                pickle.dump({'data': np.full(4, n), 'key': f'key{n}'}, fd)
+        with io.PickleStorage(path, mode='r') as storage:
+            assert (storage['key2'] == 2).all()
+        assert not os.path.exists(f'{path}.idx')
+        with io.PickleStorage(path, mode='a') as storage:
+            storage.at(data_key='key3').write(np.full(4, 3))
+        with open(path, 'ab') as fd:
+            pickle.dump({'data': np.full(4, 4), 'key': 'key4'}, fd)
+        with io.PickleStorage(path, mode='a') as storage:
+            assert [(storage[f'key{n}'] == n).all() for n in range(5)] == [True] * 5
+        with open(f'{path}.idx', 'r', encoding='utf-8') as fd:
+            assert len(fd.readlines()) == 5
+
+    @staticmethod
+    def test_cache(tmp_path):
+        """The cache should keep at most the given number of the most recently used records"""
+        with io.PickleStorage(tmp_path / 'test.pickle', mode='w', cache_size=2) as storage:
+            for n in range(3):
+                storage.at(data_key=f'key{n}').write(np.full(4, n))
+            assert list(storage.data) == ['key1', 'key2']
+            first = storage['key1']
+            assert storage['key1'] is first
+            assert (storage['key0'] == 0).all()
+            assert list(storage.data) == ['key1', 'key0']
+
+    @staticmethod
+    @pytest.mark.skipif(pickle.HIGHEST_PROTOCOL < 5, reason='requires pickle protocol 5')
+    def test_out_of_band(tmp_path):
+        """Arrays written out-of-band should be read as aligned read-only views of the file, mixed with other records"""
+        path = tmp_path / 'test.pickle'
+        large = np.random.normal(size=(64, 33))
+        with io.PickleStorage(path, mode='w') as storage:
+            storage.at(data_key='inband').write(np.arange(3))
+            outputs = (large, np.asfortranarray(large), large[::2], {'a': 1})
+            storage.at(data_key='large', out_of_band=True).write(outputs)
+            storage.at(data_key='empty', out_of_band=True).write(np.empty((0, 3)))
+            storage.at(data_key='last').write('value')
+        os.remove(f'{path}.idx')
+        for _ in range(2):
+            with io.PickleStorage(path, mode='a') as storage:
+                assert (storage['inband'] == np.arange(3)).all()
+                contiguous, fortran, strided, other = storage['large']
+                assert storage['empty'].shape == (0, 3)
+                assert storage['last'] == 'value'
+            for array in (contiguous, fortran):
+                assert np.array_equal(array, large)
+                assert not array.flags.writeable
+                base = array
+                while base.base is not None and not isinstance(base, np.memmap):
+                    base = base.base
+                assert isinstance(base, np.memmap)
+                assert array.ctypes.data % 64 == 0
+            assert np.array_equal(strided, large[::2])
+            assert other == {'a': 1}
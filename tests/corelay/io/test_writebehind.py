@@ -0,0 +1,115 @@
+"""Test module for corelay/io/writebehind.py"""
+import threading
+from io import BytesIO
+
+import pytest
+import numpy as np
+import h5py
+
+from corelay import io
+from corelay.io.hashing import ext_hash, hash_memo, register_lineage, HashPickler
+from corelay.io.storage import HashedHDF5
+from corelay.io.writebehind import WriteBehindStorage
+
+
+class BlockingStorage:
+    """Storable of which writes block until released, and which fails writing the input 'fail'"""
+    def __init__(self):
+        self.data = {}
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.lineages = []
+
+    def read(self, data_in, meta):
+        """Read from the dictionary"""
+        try:
+            return self.data[(data_in, meta)]
+        except KeyError as error:
+            raise io.NoDataSource() from error
+
+    def write(self, data_out, data_in, meta):
+        """Write to the dictionary once released"""
+        self.started.set()
+        self.release.wait()
+        self.lineages.append(HashPickler.lineage_id(data_out))
+        if data_in == 'fail':
+            raise RuntimeError('Write failed!')
+        self.data[(data_in, meta)] = data_out
+
+
+class TestWriteBehindStorage:
+    """Test class for WriteBehindStorage"""
+    @staticmethod
+    def test_write_behind():
+        """Writes should return immediately, pending outputs should be readable, and flush should write them"""
+        backend = BlockingStorage()
+        with WriteBehindStorage(backend) as storage:
+            data = np.arange(3)
+            storage.write(data, 1, 'meta')
+            assert storage.pending == 1
+            assert not backend.data
+            assert storage.read(1, 'meta') is data
+            backend.release.set()
+            storage.flush()
+            assert storage.pending == 0
+            assert backend.data[(1, 'meta')] is data
+            assert storage.read(1, 'meta') is data
+            with pytest.raises(io.NoDataSource):
+                storage.read(2, 'meta')
+
+    @staticmethod
+    def test_backpressure():
+        """Writes should block while the queue is full"""
+        backend = BlockingStorage()
+        storage = WriteBehindStorage(backend, maxsize=1)
+        storage.write(np.arange(3), 1, 'meta')
+        backend.started.wait()
+        storage.write(np.arange(3), 2, 'meta')
+        thread = threading.Thread(target=storage.write, args=(np.arange(3), 3, 'meta'))
+        thread.start()
+        thread.join(timeout=.2)
+        assert thread.is_alive()
+        backend.release.set()
+        thread.join()
+        storage.close()
+        assert len(backend.data) == 3
+
+    @staticmethod
+    def test_errors():
+        """Errors of writes should be raised on close, after all other outputs were written"""
+        backend = BlockingStorage()
+        backend.release.set()
+        storage = WriteBehindStorage(backend)
+        storage.write(np.arange(3), 'fail', 'meta')
+        storage.write(np.arange(3), 1, 'meta')
+        with pytest.raises(RuntimeError):
+            storage.close()
+        assert (1, 'meta') in backend.data
+        storage.flush()
+
+    @staticmethod
+    def test_provenance():
+        """Lineage should be registered immediately with the key of the backend"""
+        with BytesIO() as buf, h5py.File(buf, 'w') as fd:
+            storage = WriteBehindStorage(HashedHDF5(fd.require_group('hashed'), provenance=True))
+            data = np.arange(3)
+            with hash_memo():
+                storage.write(data, 1, 'meta')
+                key = ext_hash((1, 'meta'))
+                assert HashPickler.lineage_id(data) == ('lineage', key, ())
+            storage.close()
+            assert key in fd['hashed']
+
+    @staticmethod
+    def test_empty_context():
+        """Background writes should not share the hash memo of the caller"""
+        backend = BlockingStorage()
+        with WriteBehindStorage(backend) as storage:
+            data = np.arange(3)
+            with hash_memo():
+                register_lineage(data, 'key')
+                storage.write(data, 1, 'meta')
+                backend.release.set()
+                storage.flush()
+                assert HashPickler.lineage_id(data) == ('lineage', 'key', ())
+        assert backend.lineages == [None]
@@ -3,19 +3,24 @@
 """
 
 import os
+from io import BytesIO
 
 import pytest
 import numpy as np
+import h5py
 from numpy import pi
 
 
 import matplotlib.pyplot as plt
 
+from corelay.io import hashing
+from corelay.io.storage import HashedHDF5
 from corelay.pipeline.spectral import SpectralEmbedding, SpectralClustering
-from corelay.processor.affinity import SparseKNN
+from corelay.processor.affinity import SparseKNN, RadialBasisFunction
 from corelay.processor.laplacian import SymmetricNormalLaplacian
 from corelay.processor.embedding import EigenDecomposition
 from corelay.processor.clustering import KMeans
+from corelay.processor.distance import SciPyPDist
 
 
 @pytest.fixture(scope='module')
@@ -216,3 +221,32 @@ class TestSpectral:
         plt.yticks([])
         plt.savefig(path)
         os.remove(path)
+
+    @staticmethod
+    def test_spectral_clustering_provenance(spiral_data, k_eig, k_clusters, monkeypatch):
+        """with provenance keys, a fully cached run should only hash the pipeline input by its content"""
+        array_digest = hashing.array_digest
+        hashed = []
+
+        def counting_digest(obj):
+            hashed.append(obj.shape)
+            return array_digest(obj)
+
+        monkeypatch.setattr(hashing, 'array_digest', counting_digest)
+        with BytesIO() as buf, h5py.File(buf, 'w') as fd:
+            iobj = HashedHDF5(fd.require_group('hashed'), provenance=True)
+            pipeline = SpectralClustering(
+                pairwise_distance=SciPyPDist(metric='euclidean', io=iobj),
+                affinity=RadialBasisFunction(io=iobj),
+                laplacian=SymmetricNormalLaplacian(io=iobj),
+                embedding=EigenDecomposition(n_eigval=k_eig, io=iobj, is_output=True),
+                clustering=KMeans(n_clusters=k_clusters, io=iobj, is_output=True, kwargs={'random_state': 0}),
+            )
+            (eigval, eigvec), labels = pipeline(spiral_data)
+            hashed.clear()
+            (eigval_cached, eigvec_cached), labels_cached = pipeline(spiral_data)
+
+        assert hashed == [spiral_data.shape]
+        np.testing.assert_array_equal(eigval, eigval_cached)
+        np.testing.assert_array_equal(eigvec, eigvec_cached)
+        np.testing.assert_array_equal(labels, labels_cached)
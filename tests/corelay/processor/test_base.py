@@ -1,7 +1,8 @@
 """Test module for corelay/processor/base.py"""
 import pytest
 
-from corelay.io import NoStorage
+from corelay.io import NoStorage, NoDataSource, StorageKey
+from corelay.io.hashing import ext_hash
 from corelay.processor.base import Processor, Param, FunctionProcessor, ensure_processor
 
 
@@ -55,6 +56,64 @@ def unbound_function():
     return some_function
 
 
+class Scale:
+    """Multiply data by a factor"""
+    def __init__(self, factor):
+        self.factor = factor
+
+    def apply(self, data):
+        """Return data multiplied by the factor"""
+        return data * self.factor
+
+
+class Step(Processor):
+    """Processor which increments its input"""
+    def function(self, data):
+        return data + 1
+
+
+def _decrement(_, data):
+    """Decrement the data, as a replacement of Step.function"""
+    return data - 1
+
+
+class KeyedStorage:
+    """Storage implementing the key protocol, which counts calls"""
+    def __init__(self):
+        self.data = {}
+        self.calls = []
+
+    def key(self, data_in, meta):
+        """Return the key"""
+        self.calls.append('key')
+        return StorageKey(ext_hash((data_in, meta)), data_in, meta)
+
+    def read_key(self, key):
+        """Read by key"""
+        self.calls.append('read_key')
+        try:
+            return self.data[key]
+        except KeyError as error:
+            raise NoDataSource() from error
+
+    def write_key(self, data_out, key):
+        """Write by key"""
+        self.calls.append('write_key')
+        self.data[key] = data_out
+
+    def contains_key(self, key):
+        """Check by key"""
+        return key in self.data
+
+    def read(self, data_in, meta):
+        """Compatibility read"""
+        return self.read_key(self.key(data_in, meta))
+
+    def write(self, data_out, data_in, meta):
+        """Compatibility write"""
+        self.write_key(data_out, self.key(data_in, meta))
+
+
 class TestProcessor:
     """Test class for Processor"""
     @staticmethod
@@ -178,6 +237,30 @@ class TestProcessor:
         with pytest.raises(TypeError):
             proc.update_defaults(param_2='bogus')
 
+    @staticmethod
+    def test_key_protocol(processor_type, kwargs):
+        """Storages implementing the key protocol should compute the key once per call"""
+        storage = KeyedStorage()
+        processor = processor_type(**{**kwargs, 'io': storage})
+        assert processor(1) == 21
+        assert storage.calls == ['key', 'read_key', 'write_key']
+        assert processor(1) == 21
+        assert storage.calls[3:] == ['key', 'read_key']
+
+    @staticmethod
+    def test_function_fingerprint():
+        """Modifying the function of a Processor subclass should change its key if its storage is keyed"""
+        storage = KeyedStorage()
+        assert 'function' not in Step().identifiers()
+        assert Step(io=storage)(1) == 2
+        code, Step.function.__code__ = Step.function.__code__, _decrement.__code__
+        try:
+            assert Step(io=storage)(1) == 0
+        finally:
+            Step.function.__code__ = code
+        assert Step(io=storage)(1) == 2
+        assert storage.calls.count('write_key') == 2
+
 
 class TestFunctionProcessor:
     """Test class for FunctionProcessor"""
@@ -210,6 +293,24 @@ class TestFunctionProcessor:
         with pytest.raises(TypeError):
             FunctionProcessor(function='monkey')
 
+    @staticmethod
+    def test_identifiers_function():
+        """Processors of different functions should have different hashed identifiers"""
+        first = FunctionProcessor(function=lambda data: data[1])
+        second = FunctionProcessor(function=lambda data: data[0])
+        same = FunctionProcessor(function=lambda data: data[1])
+        assert ext_hash(first.identifiers()) != ext_hash(second.identifiers())
+        assert ext_hash(first.identifiers()) == ext_hash(same.identifiers())
+
+    @staticmethod
+    def test_identifiers_method(function):
+        """Processors of methods bound to different instances should not share stored outputs"""
+        storage = KeyedStorage()
+        assert FunctionProcessor(function=Scale(2).apply, io=storage)(1) == 2
+        assert FunctionProcessor(function=Scale(3).apply, io=storage)(1) == 3
+        processor = FunctionProcessor(function=function, bind_method=True, io=storage)
+        assert processor(0) == processor(0) == function(processor, 0)
+
 
 class TestEnsureProcessor:
     """Test class for ensure_processor"""
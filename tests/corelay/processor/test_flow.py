@@ -1,8 +1,44 @@
 """Test module for corelay/processor/flow.py"""
+from io import BytesIO
+
 import pytest
+import numpy as np
+import h5py
 
+from corelay.io import hashing
+from corelay.io.storage import HashedHDF5, NoDataSource
 from corelay.processor.flow import Shaper, Parallel, Sequential
-from corelay.processor.base import FunctionProcessor
+from corelay.processor.base import Processor, FunctionProcessor
+from corelay.processor.clustering import KMeans
+
+
+def _double(data):
+    """Double the data."""
+    return data * 2
+
+
+class Halve(Processor):
+    """Processor which halves its input in-place"""
+    def function(self, data):
+        data /= 2
+        return data
+
+
+class BatchedHDF5(HashedHDF5):
+    """Hashed storage which records its batched and single reads"""
+    def __init__(self, h5group):
+        super().__init__(h5group)
+        self.calls = []
+
+    def read_many(self, keys):
+        """Record a batched read"""
+        self.calls.append(('read_many', len(keys)))
+        return super().read_many(keys)
+
+    def read_key(self, key):
+        """Record a single read"""
+        self.calls.append(('read_key', 1))
+        return super().read_key(key)
 
 
 class TestShaper:
@@ -65,6 +101,96 @@ class TestParallel:
         with pytest.raises(TypeError):
             parallel((4, 3, 2, 1))
 
+    @staticmethod
+    def test_broadcast_hashed_once(monkeypatch):
+        """The input broadcast to memoized children should only be hashed once"""
+        array_digest = hashing.array_digest
+        data = np.random.normal(size=(32, 2))
+        calls = []
+
+        def counting_digest(obj):
+            if obj is data:
+                calls.append(obj)
+            return array_digest(obj)
+
+        monkeypatch.setattr(hashing, 'array_digest', counting_digest)
+        with BytesIO() as buf, h5py.File(buf, 'w') as fd:
+            iobj = HashedHDF5(fd.require_group('hashed'))
+            parallel = Parallel([KMeans(n_clusters=k, io=iobj) for k in range(2, 6)], broadcast=True)
+            parallel(data)
+        assert len(calls) == 1
+
+    @staticmethod
+    def test_batched_probe():
+        """Stored outputs of children sharing a storage should be read in one batch, and only misses be computed"""
+        with BytesIO() as buf, h5py.File(buf, 'w') as fd:
+            iobj = BatchedHDF5(fd.require_group('hashed'))
+            data = np.arange(12.).reshape(6, 2)
+            children = [FunctionProcessor(function=_double, io=iobj) for _ in range(2)]
+            children[1].is_checkpoint = True
+            children.append(KMeans(n_clusters=2, io=iobj))
+            parallel = Parallel(children, broadcast=True)
+            first = parallel(data)
+            # the second child reads the output the first one computed
+            assert iobj.calls == [('read_many', 3), ('read_key', 1)]
+            assert len(fd['hashed']) == 2
+            iobj.calls.clear()
+            second = parallel(data)
+            assert iobj.calls == [('read_many', 3)]
+            assert children[1].checkpoint_data is second[1]
+            for computed, stored in zip(first, second):
+                assert np.array_equal(computed, stored)
+
+    @staticmethod
+    def test_batched_fallback():
+        """Children with storages without the key protocol should each probe their storage when called"""
+        calls = []
+
+        class DictStorage(dict):
+            """Storage without the key protocol, which records its reads and writes"""
+            def read(self, data_in, meta):
+                """Record a read"""
+                calls.append('read')
+                try:
+                    return self[(data_in.tobytes(), meta['name'])]
+                except KeyError as error:
+                    raise NoDataSource from error
+
+            def write(self, data_out, data_in, meta):
+                """Record a write"""
+                calls.append('write')
+                self[(data_in.tobytes(), meta['name'])] = data_out
+
+        iobj = DictStorage()
+        parallel = Parallel([FunctionProcessor(function=_double, io=iobj) for _ in range(2)], broadcast=True)
+        first = parallel(np.arange(3.))
+        # the second child reads the output written by the first one
+        assert calls == ['read', 'write', 'read']
+        calls.clear()
+        second = parallel(np.arange(3.))
+        assert calls == ['read', 'read']
+        assert all(np.array_equal(left, right) for left, right in zip(first, second))
+
+    @staticmethod
+    def test_call_override():
+        """Children which override __call__ should be called as they are"""
+        calls = []
+
+        class LoggingProcessor(FunctionProcessor):
+            """FunctionProcessor which logs its calls"""
+            def __call__(self, data):
+                calls.append(data)
+                return super().__call__(data)
+
+        with BytesIO() as buf, h5py.File(buf, 'w') as fd:
+            iobj = HashedHDF5(fd.require_group('hashed'))
+            children = [LoggingProcessor(function=_double, io=iobj), FunctionProcessor(function=_double, io=iobj)]
+            parallel = Parallel(children, broadcast=True)
+            for _ in range(2):
+                first, second = parallel(np.arange(3.))
+                assert np.array_equal(first, second)
+        assert len(calls) == 2
+
 
 class TestSequential:
     """Test class for Sequential"""
@@ -79,3 +205,14 @@ class TestSequential:
         """Input should be passed sequentially along all child processors when given children positionally"""
         sequential = Sequential([FunctionProcessor(function=lambda x, c=c: c + x) for c in 'bcde'])
         assert sequential('a') == 'edcba'
+
+    @staticmethod
+    def test_inplace():
+        """Processors should be able to modify their hashed input in-place"""
+        with BytesIO() as buf, h5py.File(buf, 'w') as fd:
+            iobj = HashedHDF5(fd.require_group('hashed'))
+            data = np.arange(4.)
+            assert np.array_equal(Halve(io=iobj)(data), np.arange(4.) / 2)
+            sequential = Sequential([FunctionProcessor(function=_double, io=iobj), Halve()])
+            assert np.array_equal(sequential(np.arange(4.)), np.arange(4.))
+            assert np.array_equal(sequential(np.arange(4.)), np.arange(4.))